@@ -1,16 +1,20 @@
 """シートキャッシュユーティリティ
 
 マスターデータ（石・組み合わせ・商品）をシートから取得する際の
-TTL付きインメモリキャッシュを提供する。
+TTL付きインメモリキャッシュと、計算結果用のLRUキャッシュを提供する。
 """
 
 import time
 import logging
+import threading
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
 CACHE_TTL = 300  # 5分
 
+_sheet_caches: dict = {}  # {name: SheetCache} 一括読み込みで埋めるための登録簿
+
 
 class SheetCache:
     """シート読み込み結果のTTL付きインメモリキャッシュ"""
@@ -20,6 +24,7 @@ class SheetCache:
         self._ttl = ttl
         self._data: dict | None = None
         self._expires: float = 0.0
+        _sheet_caches[name] = self
 
     def get(self) -> dict | None:
         """キャッシュが有効ならデータを返す。期限切れ・未設定はNone。"""
@@ -39,3 +44,55 @@ class SheetCache:
         self._data = None
         self._expires = 0.0
         logger.info("キャッシュクリア: %s", self._name)
+
+
+def get_sheet_cache(name: str) -> SheetCache | None:
+    """名前（シート名）で登録済みの SheetCache を返す"""
+    return _sheet_caches.get(name)
+
+
+class LRUCache:
+    """件数上限付きLRUキャッシュ（スレッドセーフ・ヒット率集計付き）"""
+
+    def __init__(self, name: str, max_size: int = 1024):
+        self._name = name
+        self._max_size = max_size
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """キーに対応する値を返す。なければNone。"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value) -> None:
+        """値を格納し、上限を超えたら最も古いものを捨てる"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """全件破棄する"""
+        with self._lock:
+            self._data.clear()
+        logger.info("キャッシュクリア: %s", self._name)
+
+    def stats(self) -> dict:
+        """件数とヒット率を返す"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -5,7 +5,10 @@
 - Phase 2 (build_bracelet): 手首サイズ・デザインに基づくブレスレット注文情報生成
 """
 
+import itertools
 import logging
+import os
+import threading
 import time
 import uuid
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -19,9 +22,17 @@ from api.utils_perplexity import (
     build_chart_data,
 )
 from api.utils_order import build_order_summary
-from api.utils_sheet import add_diagnosis, format_stones, update_diagnosis
+from api.storage import add_diagnosis, update_diagnosis, warm_caches, needs_warm_up
+from api.utils_sheet import format_stones, new_diagnosis_id
 from api.utils_geocode import geocode
-from api.matching import recommend_products, build_user_profile
+from api.matching import (
+    recommend_products,
+    build_user_profile,
+    build_scoring_context,
+    build_recommendation_table,
+    lookup_recommendation_table,
+)
+from api.product_master import normalize_gender
 from api.utils_woo import fetch_woo_products
 from api.utils_image import generate_stone_beads_image
 
@@ -172,6 +183,118 @@ def _element_to_aura_need(element_lack: dict[str, float]) -> dict[str, float]:
     return aura_need
 
 
+# ===== 推薦テーブルの事前計算 =====
+
+# "1" のとき、全エレメントバランス × 悩みカテゴリの組み合わせの上位3件を事前計算して引き当てる
+PRECOMPUTE_RECOMMENDATIONS = os.environ.get("PRECOMPUTE_RECOMMENDATIONS", "") == "1"
+
+# エレメントバランスは6天体（太陽・月・ASC・水星・金星・火星）の星座の配分
+CHART_PLACEMENT_COUNT = 6
+
+# 正規化した性別（None=指定なし）→ 事前計算テーブル
+_recommendation_tables: dict = {}
+# (性別, 版数) → 作成中のスレッド
+_recommendation_builds: dict = {}
+_recommendation_table_lock = threading.Lock()
+
+
+def _recommendation_key(chart_info: dict, concerns: list[str]) -> tuple:
+    """(エレメントバランス, 悩みカテゴリ集合) の事前計算テーブル用キー"""
+    balance = tuple(chart_info.get(k, 1) for k in ("fire", "earth", "wind", "water"))
+    return balance, frozenset(c for c in (concerns or []) if c in CONCERN_THEME_MAP)
+
+
+def _enumerate_chart_profiles() -> dict:
+    """到達しうる全 (エレメントバランス, 悩みカテゴリ集合) のユーザープロファイルを返す"""
+    profiles: dict = {}
+    for fire in range(CHART_PLACEMENT_COUNT + 1):
+        for earth in range(CHART_PLACEMENT_COUNT + 1 - fire):
+            for wind in range(CHART_PLACEMENT_COUNT + 1 - fire - earth):
+                water = CHART_PLACEMENT_COUNT - fire - earth - wind
+                chart_info = {"fire": fire, "earth": earth, "wind": wind, "water": water}
+                for size in range(len(CONCERN_THEME_MAP) + 1):
+                    for concerns in itertools.combinations(CONCERN_THEME_MAP, size):
+                        key = _recommendation_key(chart_info, list(concerns))
+                        profiles[key] = _build_user_profile_from_chart(chart_info, list(concerns))
+    return profiles
+
+
+def _get_recommendation_table(context, gender: str | None = None):
+    """現在のマスター・configと性別に対応する事前計算テーブルを返す
+
+    版数が変わっていたり未作成だったりする場合は、バックグラウンドで作り始めてNoneを返す
+    （リクエストは作成を待たず、その間は通常のマッチングを使う）。
+    """
+    gender = normalize_gender(gender)
+    table = _recommendation_tables.get(gender)
+    if table is not None and table.version == context.version:
+        return table
+
+    build_key = (gender, context.version)
+    with _recommendation_table_lock:
+        if build_key not in _recommendation_builds:
+            thread = threading.Thread(
+                target=_build_recommendation_table, args=(context, gender), daemon=True,
+            )
+            _recommendation_builds[build_key] = thread
+            thread.start()
+    return None
+
+
+def _build_recommendation_table(context, gender: str | None) -> None:
+    """事前計算テーブルを作って差し替える（バックグラウンドスレッドで実行）"""
+    start = time.time()
+    try:
+        table = build_recommendation_table(
+            _enumerate_chart_profiles(), top_n=3, context=context, gender=gender,
+        )
+        with _recommendation_table_lock:
+            _recommendation_tables[gender] = table
+        logger.info("推薦テーブルを作成しました: gender=%s (%.0fms)", gender, (time.time() - start) * 1000)
+    except Exception as e:
+        logger.warning("推薦テーブル作成エラー（通常のマッチングを使用）: %s", e)
+    finally:
+        with _recommendation_table_lock:
+            _recommendation_builds.pop((gender, context.version), None)
+
+
+def _recommend_for_chart(
+    chart_info: dict,
+    concerns: list[str],
+    problem: str,
+    user_profile: dict,
+    top_n: int = 3,
+    gender: str | None = None,
+) -> list[dict]:
+    """
+    診断入力に対する推薦商品を返す（gender で候補商品を性別ごとに絞る）。
+
+    事前計算モードでは、problem テキスト由来のタグが悩みカテゴリのタグに
+    新しいタグを加えない限りテーブルから引き当てる。それ以外は通常のスコアリングを行う。
+    """
+    if not PRECOMPUTE_RECOMMENDATIONS:
+        return recommend_products(user_profile, top_n=top_n, gender=gender)
+
+    key = _recommendation_key(chart_info, concerns)
+    extra_worry, extra_theme = _extract_tags_from_problem(problem) if problem else ([], [])
+    concern_themes = {t for c in key[1] for t in CONCERN_THEME_MAP[c]}
+    concern_worries = {t for c in key[1] for t in CONCERN_WORRY_MAP[c]}
+    if set(extra_theme) <= concern_themes and set(extra_worry) <= concern_worries:
+        try:
+            context = build_scoring_context()
+            table = _get_recommendation_table(context, gender)
+            if table is not None:
+                top = lookup_recommendation_table(
+                    table, key, user_profile, context, top_n=top_n, gender=gender,
+                )
+                if top is not None:
+                    return top
+        except Exception as e:
+            logger.warning("推薦テーブル引き当てエラー（通常のマッチングを使用）: %s", e)
+
+    return recommend_products(user_profile, top_n=top_n, gender=gender)
+
+
 # ===== Phase 1: 診断＆商品提案 =====
 
 def diagnose():
@@ -184,10 +307,16 @@ def diagnose():
         if not req:
             return jsonify({"error": "リクエストボディが空です"}), 400
 
-        diagnosis_id = str(uuid.uuid4())
+        diagnosis_id = new_diagnosis_id()
         line_user_id = req.get("line_user_id")
         concerns = req.get("concerns") or []
 
+        # キャッシュが冷えているときだけマスター・configの一括読み込みをホロスコープ計算と並行して行う
+        warmup = None
+        if needs_warm_up():
+            warmup = threading.Thread(target=warm_caches, daemon=True)
+            warmup.start()
+
         # ホロスコープ計算
         chart_data = None
         birth = req.get("birth", {})
@@ -212,7 +341,11 @@ def diagnose():
         # ===== Step1: マッチングで石を確定 =====
         # AIに石名を伝えるため、マッチングを先に1回だけ実行する。
         # AI重みによる再マッチングは廃止（石名がすり替わり信頼を損なうため）。
-        top_products = recommend_products(base_profile, top_n=3)
+        if warmup is not None:
+            warmup.join()
+        top_products = _recommend_for_chart(
+            chart_info, concerns, problem_text, base_profile, top_n=3, gender=req.get("gender"),
+        )
 
         rank1_stones = top_products[0].get("stones", []) if top_products else []
         rank1_main_stone = rank1_stones[0] if rank1_stones else ""
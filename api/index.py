@@ -6,12 +6,13 @@ from dotenv import load_dotenv
 load_dotenv()  # ローカル開発時に .env を読み込む（本番では無視される）
 
 from api.diagnose import diagnose, build_bracelet
-from api.utils_sheet import get_diagnosis, upsert_profile, get_profile, add_bracelet_selection
+from api.storage import get_diagnosis, upsert_profile, get_profile, add_bracelet_selection
 from api.utils_perplexity import generate_today_fortune, calculate_chart
 from api.utils_geocode import geocode
 from api.woo_webhook import woo_webhook
 from api.utils_rate_limit import rate_limited
-from api.utils_sheet import get_config, set_config
+from api.storage import get_config, set_config
+from api.utils_blob import resolve_text
 
 # ロギング設定
 logging.basicConfig(level=logging.INFO)
@@ -48,6 +49,8 @@ def fortune_detail():
     saved = get_diagnosis(diagnosis_id)
     if not saved:
         return jsonify({"error": "診断結果が見つかりません"}), 404
+    # 長文がブロブに逃がされていればハッシュで取得する（内容アドレスなのでキャッシュ済みなら再取得しない）
+    saved = resolve_text(saved)
 
     # 保存済みの推薦商品スラッグからWooCommerce情報を取得
     product_slug = saved.get("product_slug", "")
@@ -112,8 +115,8 @@ def route_profile():
         if not user_id:
             return jsonify({"error": "ユーザーIDが必要です"}), 400
         try:
-            upsert_profile(body)
-            profile = get_profile(user_id)
+            # 書き込んだレコードをそのまま返す（読み直さない）
+            profile = upsert_profile(body)
             return jsonify(profile or {})
         except Exception as e:
             logger.exception("プロフィール保存エラー")
@@ -298,6 +301,13 @@ def health_sheets_write():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route('/api/health/sheets-quota', methods=['GET'])
+def health_sheets_quota():
+    """Sheets APIのクォータ使用状況（このインスタンス分）"""
+    from api.sheets_client import quota_usage
+    return jsonify({"status": "ok", "quota": quota_usage()})
+
+
 @app.route('/api/health/sheets', methods=['GET'])
 def health_sheets():
     """Google Sheets接続診断エンドポイント"""
@@ -446,7 +456,7 @@ def admin_create_stone():
     if not stone_id or not stone_data:
         return jsonify({"error": "stone_idとstone_dataが必要です"}), 400
     try:
-        from api.utils_sheet import upsert_stone
+        from api.storage import upsert_stone
         upsert_stone(stone_id, stone_data)
         return jsonify({"status": "ok", "stone_id": stone_id})
     except Exception as e:
@@ -463,7 +473,7 @@ def admin_stone(stone_id):
         body = request.get_json(force=True, silent=True) or {}
         stone_data = body.get("stone_data", body)
         try:
-            from api.utils_sheet import upsert_stone
+            from api.storage import upsert_stone
             upsert_stone(stone_id, stone_data)
             return jsonify({"status": "ok", "stone_id": stone_id})
         except Exception as e:
@@ -471,7 +481,7 @@ def admin_stone(stone_id):
             return jsonify({"error": str(e)}), 500
     else:  # DELETE
         try:
-            from api.utils_sheet import delete_stone
+            from api.storage import delete_stone
             ok = delete_stone(stone_id)
             if ok:
                 return jsonify({"status": "ok"})
@@ -491,21 +501,28 @@ def admin_combo():
     stone_id_b = body.get("stone_id_b", "")
     if not stone_id_a or not stone_id_b:
         return jsonify({"error": "stone_id_aとstone_id_bが必要です"}), 400
+    # 編集前のインデックスから影響を受ける商品を求める（商品構成は変わらない）
+    try:
+        from api.matching_index import get_products_affected_by_combination
+        affected = get_products_affected_by_combination(stone_id_a, stone_id_b)
+    except Exception as e:
+        logger.warning("影響商品の取得エラー: %s", e)
+        affected = []
     if request.method == 'POST':
         effect = body.get("effect", {})
         try:
-            from api.utils_sheet import upsert_combination
+            from api.storage import upsert_combination
             upsert_combination(stone_id_a, stone_id_b, effect)
-            return jsonify({"status": "ok"})
+            return jsonify({"status": "ok", "affected_products": affected})
         except Exception as e:
             logger.exception("組み合わせ作成エラー")
             return jsonify({"error": str(e)}), 500
     else:  # DELETE
         try:
-            from api.utils_sheet import delete_combination
+            from api.storage import delete_combination
             ok = delete_combination(stone_id_a, stone_id_b)
             if ok:
-                return jsonify({"status": "ok"})
+                return jsonify({"status": "ok", "affected_products": affected})
             return jsonify({"error": "組み合わせが見つかりません"}), 404
         except Exception as e:
             logger.exception("組み合わせ削除エラー")
@@ -520,7 +537,7 @@ def admin_create_product():
     body = request.get_json(force=True, silent=True) or {}
     product_data = body.get("product_data", body)
     try:
-        from api.utils_sheet import generate_external_product_id, upsert_product
+        from api.storage import generate_external_product_id, upsert_product
         product_id = generate_external_product_id()
         upsert_product(product_id, product_data)
         return jsonify({"status": "ok", "product_id": product_id})
@@ -538,7 +555,7 @@ def admin_product(product_id):
         body = request.get_json(force=True, silent=True) or {}
         product_data = body.get("product_data", body)
         try:
-            from api.utils_sheet import upsert_product
+            from api.storage import upsert_product
             upsert_product(product_id, product_data)
             return jsonify({"status": "ok", "product_id": product_id})
         except Exception as e:
@@ -546,7 +563,7 @@ def admin_product(product_id):
             return jsonify({"error": str(e)}), 500
     else:  # DELETE
         try:
-            from api.utils_sheet import delete_product
+            from api.storage import delete_product
             ok = delete_product(product_id)
             if ok:
                 return jsonify({"status": "ok"})
@@ -590,31 +607,28 @@ def admin_migrate_to_sheets():
     from api.stone_master import STONE_MASTER
     from api.stone_combination_master import STONE_COMBINATION_MASTER
     from api.product_master import PRODUCT_MASTER
-    from api.utils_sheet import (
-        write_stone_master_to_sheet,
-        write_combination_master_to_sheet,
-        write_product_master_to_sheet,
-    )
+    from api.storage import get_storage
+    storage = get_storage()
 
     results = {}
     errors = []
 
     try:
-        write_stone_master_to_sheet(STONE_MASTER)
+        storage.write_stone_master(STONE_MASTER)
         results["stone_master"] = f"✅ {len(STONE_MASTER)}件書き込み"
     except Exception as e:
         errors.append(f"石マスター: {e}")
         results["stone_master"] = "❌ 失敗"
 
     try:
-        write_combination_master_to_sheet(STONE_COMBINATION_MASTER)
+        storage.write_combination_master(STONE_COMBINATION_MASTER)
         results["stone_combinations"] = f"✅ {len(STONE_COMBINATION_MASTER)}件書き込み"
     except Exception as e:
         errors.append(f"組み合わせマスター: {e}")
         results["stone_combinations"] = "❌ 失敗"
 
     try:
-        write_product_master_to_sheet(PRODUCT_MASTER)
+        storage.write_product_master(PRODUCT_MASTER)
         results["product_master"] = f"✅ {len(PRODUCT_MASTER)}件書き込み"
     except Exception as e:
         errors.append(f"商品マスター: {e}")
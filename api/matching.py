@@ -9,13 +9,22 @@
   悩み一致率      10%
 """
 
+import copy
+import json
+import heapq
+import hashlib
 import logging
-from itertools import combinations
+import threading
+from typing import NamedTuple
 
-from api.stone_master import get_stone
-from api.stone_combination_master import get_combination_effect
+import numpy as np
+
+from api.stone_master import get_stone_master_data
+from api.stone_combination_master import get_combination_adjacency
 from api.role_weight import get_role_weight, get_combination_role_weight
-from api.product_master import get_enabled_products, ProductEntry
+from api.product_master import apply_config_overrides, normalize_gender, ProductEntry
+from api.matching_index import get_product_index, ProductIndex
+from api.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
@@ -29,11 +38,18 @@ SCORE_WEIGHTS = {
 }
 
 
-def get_score_weights() -> dict:
-    """configシートのオーバーライドを反映したスコアリング重みを返す（合計1に正規化）"""
+def _load_config() -> dict:
+    """configシートを読み込む。取得できなければ空dict。"""
+    try:
+        from api.storage import get_config
+        return get_config()
+    except Exception:
+        return {}
+
+
+def _weights_from_config(cfg: dict) -> dict:
+    """configのオーバーライドを反映したスコアリング重みを返す（合計1に正規化）"""
     try:
-        from api.utils_sheet import get_config
-        cfg = get_config()
         weights = dict(SCORE_WEIGHTS)
         for k in ["element", "aura", "theme", "worry"]:
             key = f"score_weight_{k}"
@@ -47,6 +63,12 @@ def get_score_weights() -> dict:
         logger.warning("スコア重み読み込みエラー（デフォルト使用）: %s", e)
         return dict(SCORE_WEIGHTS)
 
+
+def get_score_weights() -> dict:
+    """configシートのオーバーライドを反映したスコアリング重みを返す（合計1に正規化）"""
+    return _weights_from_config(_load_config())
+
+
 ELEMENT_KEYS = ["fire", "earth", "air", "water"]
 AURA_KEYS    = ["intuition", "clarity", "stability", "vitality",
                  "protection", "love", "expression", "courage"]
@@ -54,11 +76,20 @@ AURA_KEYS    = ["intuition", "clarity", "stability", "vitality",
 
 # ===== 商品プロファイル計算 =====
 
-def _calc_product_profile(product: ProductEntry) -> dict:
+def _calc_product_profile(
+    product: ProductEntry,
+    stones: dict | None = None,
+    combos: dict | None = None,
+) -> dict:
     """
     商品の石構成と組み合わせマスタから、商品全体のプロファイルを計算する。
     粒数は影響させず、役割×サイズの重みで合成する。
+    stones / combos を渡すとそのマスタースナップショットで計算する（省略時は現在のマスター）。
     """
+    if stones is None:
+        stones = get_stone_master_data()
+    adjacency = get_combination_adjacency(combos)
+
     element_vec: dict[str, float] = {k: 0.0 for k in ELEMENT_KEYS}
     aura_vec:    dict[str, float] = {k: 0.0 for k in AURA_KEYS}
     theme_tags:  set[str]         = set()
@@ -69,7 +100,7 @@ def _calc_product_profile(product: ProductEntry) -> dict:
 
     # --- 石単体の寄与 ---
     for part in parts:
-        stone = get_stone(part["stone_id"])
+        stone = stones.get(part["stone_id"])
         if stone is None:
             logger.warning("stone_id not found: %s", part["stone_id"])
             continue
@@ -85,22 +116,26 @@ def _calc_product_profile(product: ProductEntry) -> dict:
         worry_tags.update(stone.get("worry_tags", []))
         total_weight += rw
 
-    # --- 組み合わせ効果の寄与 ---
-    for (part_a, part_b) in combinations(parts, 2):
-        effect = get_combination_effect(part_a["stone_id"], part_b["stone_id"])
-        if effect is None:
+    # --- 組み合わせ効果の寄与（隣接インデックスで後続パーツの相手石を引く） ---
+    for i, part_a in enumerate(parts):
+        partners = adjacency.get(part_a["stone_id"])
+        if not partners:
             continue
+        for part_b in parts[i + 1:]:
+            effect = partners.get(part_b["stone_id"])
+            if effect is None:
+                continue
 
-        combo_rw = get_combination_role_weight(part_a["role"], part_b["role"])
-        w = effect.get("weight", 1.0) * combo_rw
+            combo_rw = get_combination_role_weight(part_a["role"], part_b["role"])
+            w = effect.get("weight", 1.0) * combo_rw
 
-        for k in ELEMENT_KEYS:
-            element_vec[k] += effect["element_bonus"].get(k, 0.0) * w
-        for k in AURA_KEYS:
-            aura_vec[k] += effect["aura_bonus"].get(k, 0.0) * w
+            for k in ELEMENT_KEYS:
+                element_vec[k] += effect["element_bonus"].get(k, 0.0) * w
+            for k in AURA_KEYS:
+                aura_vec[k] += effect["aura_bonus"].get(k, 0.0) * w
 
-        theme_tags.update(effect.get("theme_tags", []))
-        worry_tags.update(effect.get("worry_tags", []))
+            theme_tags.update(effect.get("theme_tags", []))
+            worry_tags.update(effect.get("worry_tags", []))
 
     # --- 正規化（最大値を1.0に揃える） ---
     if total_weight > 0:
@@ -153,6 +188,19 @@ def _cosine_similarity(vec_a: dict[str, float], vec_b: dict[str, float]) -> floa
     return dot / (norm_a * norm_b)
 
 
+def _unit_vector(vec: dict[str, float], keys: list[str]) -> np.ndarray:
+    """dictベクトルをkeys順の配列にしてL2正規化する（ノルム0ならゼロ配列）
+
+    ノルムはkeys以外の要素も含めたdict全体で計算するため、
+    正規化済み配列同士の内積は _cosine_similarity と同じ値になる。
+    """
+    arr = np.array([vec.get(k, 0.0) for k in keys], dtype=np.float64)
+    norm = sum(v ** 2 for v in vec.values()) ** 0.5
+    if norm == 0:
+        return np.zeros(len(keys))
+    return arr / norm
+
+
 def _tag_overlap_score(user_tags: list[str], product_tags: list[str]) -> float:
     """タグの一致率を計算する（0.0〜1.0）"""
     if not user_tags or not product_tags:
@@ -163,14 +211,17 @@ def _tag_overlap_score(user_tags: list[str], product_tags: list[str]) -> float:
     return overlap / len(user_set)
 
 
-def _score_product(user_profile: dict, product_profile: dict) -> dict:
-    """商品とユーザープロファイルの一致率を計算する（合計と内訳を返す）"""
+def _score_product(user_profile: dict, product_profile: dict, weights: dict | None = None) -> dict:
+    """商品とユーザープロファイルの一致率を計算する（合計と内訳を返す）
+
+    weights を省略するとconfigシートから重みを読み込む。
+    """
     e_score = _cosine_similarity(user_profile["element"], product_profile["element"])
     a_score = _cosine_similarity(user_profile["aura"],    product_profile["aura"])
     t_score = _tag_overlap_score(user_profile["theme_tags"], product_profile["theme_tags"])
     w_score = _tag_overlap_score(user_profile["worry_tags"], product_profile["worry_tags"])
 
-    w = get_score_weights()
+    w = weights if weights is not None else get_score_weights()
     total = (
         e_score * w["element"] +
         a_score * w["aura"]    +
@@ -188,26 +239,12 @@ def _score_product(user_profile: dict, product_profile: dict) -> dict:
 
 # ===== 推薦理由生成 =====
 
-def _build_reason(user_profile: dict, product_profile: dict, product: ProductEntry) -> str:
-    """推薦理由の簡潔なテキストを生成する"""
-    parts = product["parts"]
-    stone_names = []
-    for part in parts:
-        stone = get_stone(part["stone_id"])
-        if stone:
-            stone_names.append(stone["stone_name"])
-
-    # 一致したテーマタグ
-    matched_themes = list(
-        set(user_profile.get("theme_tags", [])) &
-        set(product_profile.get("theme_tags", []))
-    )
-    # 一致した悩みタグ
-    matched_worries = list(
-        set(user_profile.get("worry_tags", [])) &
-        set(product_profile.get("worry_tags", []))
-    )
-
+def _build_reason(
+    stone_names: list[str],
+    matched_themes: list[str],
+    matched_worries: list[str],
+) -> str:
+    """推薦理由の簡潔なテキストを生成する（一致タグはユーザー側の優先順）"""
     reason_parts = []
     if stone_names:
         reason_parts.append(f"使用石：{' × '.join(stone_names)}")
@@ -219,14 +256,342 @@ def _build_reason(user_profile: dict, product_profile: dict, product: ProductEnt
     return "　".join(reason_parts) if reason_parts else "あなたの星読みに共鳴する構成です"
 
 
+# ===== リクエスト単位のスコアリングコンテキスト =====
+
+class ScoringContext(NamedTuple):
+    """1回の推薦で使う設定・マスターのスナップショット（生成後は変更しない）
+
+    products / enabled / priority は index.entries と同じ行順。
+    candidates は正規化した性別（None=指定なし）→ 推薦対象にする有効商品の行マスク。
+    version はマスター版数・重み・商品オーバーライドから求めたフィンガープリント。
+    """
+    version: str
+    weights: dict                       # 正規化済みスコアリング重み
+    index: ProductIndex                 # コンパイル済みマスタースナップショット
+    products: tuple[ProductEntry, ...]  # configオーバーライド適用済みの商品
+    enabled: np.ndarray                 # 有効な商品はTrue
+    priority: np.ndarray                # priority_weight
+    candidates: dict                    # 性別 → 有効かつ性別に合う商品はTrue
+
+
+def build_scoring_context(config: dict | None = None) -> ScoringContext:
+    """configを1回だけ読み込み、重みと商品オーバーライドを確定したコンテキストを作る
+
+    config を渡した場合はシートを読まない。
+    """
+    cfg = _load_config() if config is None else config
+    index = get_product_index()
+    products = tuple(
+        apply_config_overrides(e["product_id"], e["product"], cfg) for e in index.entries
+    )
+    enabled = np.array([bool(p["enabled"]) for p in products], dtype=bool)
+    priority = np.array([p.get("priority_weight", 1.0) for p in products], dtype=np.float64)
+    weights = _weights_from_config(cfg)
+
+    digest = hashlib.sha1(index.version.encode())
+    digest.update(json.dumps(weights, sort_keys=True).encode())
+    digest.update(enabled.tobytes())
+    digest.update(priority.tobytes())
+    return ScoringContext(
+        version=digest.hexdigest()[:16],
+        weights=weights,
+        index=index,
+        products=products,
+        enabled=enabled,
+        priority=priority,
+        candidates={g: enabled & index.gender_mask(g) for g in (None, "female", "male")},
+    )
+
+
+def _candidate_mask(context: ScoringContext, gender: str | None) -> np.ndarray:
+    """リクエストの性別に対応する候補商品の行マスクを返す"""
+    return context.candidates[normalize_gender(gender)]
+
+
+# ===== 一括スコア計算 =====
+
+class ScoreArrays(NamedTuple):
+    """全商品分のスコア（index.entries と同じ行順、0.0〜1.0。total のみ補正後の点数）"""
+    element: np.ndarray
+    aura: np.ndarray
+    theme: np.ndarray
+    worry: np.ndarray
+    total: np.ndarray   # priority_weight 補正後の0〜100点
+
+
+def _score_matrix(profiles: list[dict], context: ScoringContext) -> ScoreArrays:
+    """複数ユーザー分のスコアを全商品について一括計算する（各配列は (ユーザー数, 商品数)）"""
+    index = context.index
+    e_scores, a_scores = _similarity_matrix(profiles, index)
+
+    # テーマ・悩みタグの一致数はビットセットのANDのポップカウントで一括計算
+    t_scores = _tag_overlap_matrix([p.get("theme_tags", []) for p in profiles], index, index.theme_bits)
+    w_scores = _tag_overlap_matrix([p.get("worry_tags", []) for p in profiles], index, index.worry_bits)
+
+    total = _combine_scores(e_scores, a_scores, t_scores, w_scores, context.weights, context.priority)
+    return ScoreArrays(e_scores, a_scores, t_scores, w_scores, total)
+
+
+def _similarity_matrix(
+    profiles: list[dict],
+    index: ProductIndex,
+    rows: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """エレメント・オーラのコサイン類似度を正規化済み行列同士の積で一括計算する
+
+    rows を渡すとその行の商品だけを計算する（列は rows の順）。
+    """
+    user_e = np.array([_unit_vector(p["element"], ELEMENT_KEYS) for p in profiles]).reshape(-1, len(ELEMENT_KEYS))
+    user_a = np.array([_unit_vector(p["aura"], AURA_KEYS) for p in profiles]).reshape(-1, len(AURA_KEYS))
+    element_matrix = index.element_matrix if rows is None else index.element_matrix[rows]
+    aura_matrix = index.aura_matrix if rows is None else index.aura_matrix[rows]
+    return user_e @ element_matrix.T, user_a @ aura_matrix.T
+
+
+def _combine_scores(e_scores, a_scores, t_scores, w_scores, weights: dict, priority: np.ndarray) -> np.ndarray:
+    """内訳スコアを重み付けで合算し、priority_weight 補正後の0〜100点にする"""
+    raw_total = (
+        e_scores * weights["element"] +
+        a_scores * weights["aura"]    +
+        t_scores * weights["theme"]   +
+        w_scores * weights["worry"]
+    )
+    # priority_weight による補正（最大±5点）
+    return np.minimum(100.0, _round1(raw_total * 100) * priority)
+
+
+def _round1(values: np.ndarray) -> np.ndarray:
+    """小数第1位に丸める（_score_product の round(x, 1) と同じ結果にする）
+
+    np.round は x*10 を偶数丸めするため、44.45 のような .x5 の境界で
+    Python の round（10進表現で正しく丸める）と結果がずれる。
+    境界付近の要素だけ round() で計算し直す。
+    """
+    rounded = np.round(values, 1)
+    scaled = values * 10
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_half.any():
+        rounded[near_half] = [round(float(v), 1) for v in values[near_half]]
+    return rounded
+
+
+def _tag_overlap_matrix(tag_lists: list[list[str]], index: ProductIndex, product_bits: np.ndarray) -> np.ndarray:
+    """ユーザーごとのタグ一致率 (ユーザー数, 商品数) を返す"""
+    encoded = [index.encode_tags(tags) for tags in tag_lists]
+    user_bits = np.array([bits for bits, _ in encoded]).reshape(len(tag_lists), -1)
+    counts = np.array([max(count, 1) for _, count in encoded], dtype=np.float64)
+    overlap = np.bitwise_count(user_bits[:, None, :] & product_bits[None, :, :]).sum(axis=2)
+    return overlap / counts[:, None]
+
+
+def _score_all(user_profile: dict, context: ScoringContext) -> ScoreArrays:
+    """1ユーザー分のスコアを全商品について一括計算する（結果dictは作らない）"""
+    return ScoreArrays(*(arr[0] for arr in _score_matrix([user_profile], context)))
+
+
+# ===== 上限値による候補の枝刈り =====
+
+# 枝刈り時に1回でまとめて厳密スコアを計算する商品数
+PRUNE_BLOCK_SIZE = 32
+
+# 枝刈りの累計（リクエスト数・候補商品数・スキップした商品数）
+_pruning_stats: dict[str, int] = {"requests": 0, "candidates": 0, "pruned": 0}
+_pruning_lock = threading.Lock()
+
+
+def get_pruning_stats() -> dict[str, int]:
+    """枝刈りの累計カウンタを返す"""
+    with _pruning_lock:
+        return dict(_pruning_stats)
+
+
+def _score_with_pruning(
+    user_profile: dict,
+    context: ScoringContext,
+    top_n: int,
+    gender: str | None = None,
+) -> tuple[ScoreArrays, np.ndarray]:
+    """上位top_n件に入り得ない商品のタグ一致計算を省いてスコアを求める
+
+    性別の分割で候補を絞ってから、エレメント・オーラを候補分だけ計算し、
+    タグ一致率は転置インデックスと商品ごとのタグ数から上限を見積もる。
+    上限の高い順に厳密スコアを計算し、残りの上限が現在のtop_n位の
+    スコアを下回った時点で打ち切る。
+    戻り値は (スコア, 厳密に計算した行のマスク)。未計算行のスコアはNaN。
+    """
+    index = context.index
+    w = context.weights
+    theme_tags = user_profile.get("theme_tags", [])
+    worry_tags = user_profile.get("worry_tags", [])
+
+    n = len(index)
+    candidates = np.flatnonzero(_candidate_mask(context, gender))
+    e_scores = np.full(n, np.nan)
+    a_scores = np.full(n, np.nan)
+    e_cand, a_cand = _similarity_matrix([user_profile], index, candidates)
+    e_scores[candidates] = e_cand[0]
+    a_scores[candidates] = a_cand[0]
+    t_bound = index.tag_overlap_bound(theme_tags, "theme")[candidates]
+    w_bound = index.tag_overlap_bound(worry_tags, "worry")[candidates]
+
+    # タグ項の寄与の最大・最小（重みが負の場合も上限が崩れないように両側を取る）
+    base = e_cand[0] * w["element"] + a_cand[0] * w["aura"]
+    raw_hi = base + np.maximum(t_bound * w["theme"], 0.0) + np.maximum(w_bound * w["worry"], 0.0)
+    raw_lo = base + np.minimum(t_bound * w["theme"], 0.0) + np.minimum(w_bound * w["worry"], 0.0)
+    # 補正後の点数は素点に対して単調なので、両端の大きい方が上限になる
+    priority = context.priority[candidates]
+    upper = np.full(n, -np.inf)
+    upper[candidates] = np.maximum(
+        np.minimum(100.0, _round1(raw_hi * 100) * priority),
+        np.minimum(100.0, _round1(raw_lo * 100) * priority),
+    )
+
+    t_scores = np.full(n, np.nan)
+    w_scores = np.full(n, np.nan)
+    total = np.full(n, -np.inf)
+    scored = np.zeros(n, dtype=bool)
+
+    order = candidates[np.argsort(-upper[candidates], kind="stable")]
+    block = max(top_n, PRUNE_BLOCK_SIZE)
+    threshold = -np.inf
+    pos = 0
+    while pos < len(order):
+        if scored.sum() >= top_n and upper[order[pos]] < threshold:
+            break
+        rows = order[pos:pos + block]
+        pos += block
+        t_scores[rows] = _tag_overlap_matrix([theme_tags], index, index.theme_bits[rows])[0]
+        w_scores[rows] = _tag_overlap_matrix([worry_tags], index, index.worry_bits[rows])[0]
+        total[rows] = _combine_scores(
+            e_scores[rows], a_scores[rows], t_scores[rows], w_scores[rows], w, context.priority[rows],
+        )
+        scored[rows] = True
+        if scored.sum() >= top_n:
+            threshold = np.partition(total[scored], -top_n)[-top_n]
+
+    pruned = len(candidates) - int(scored.sum())
+    with _pruning_lock:
+        _pruning_stats["requests"] += 1
+        _pruning_stats["candidates"] += len(candidates)
+        _pruning_stats["pruned"] += pruned
+    logger.info("候補枝刈り: %d/%d件をスキップ", pruned, len(candidates))
+
+    return ScoreArrays(e_scores, a_scores, t_scores, w_scores, total), scored
+
+
+def _select_top_rows(total: np.ndarray, enabled: np.ndarray, top_n: int) -> list[int]:
+    """有効な商品のうちスコア上位top_n件の行番号を返す（同点は行順を保つ）"""
+    scores = total.tolist()
+    candidates = np.flatnonzero(enabled).tolist()
+    return heapq.nlargest(top_n, candidates, key=scores.__getitem__)
+
+
+def _breakdown(scores: ScoreArrays, row: int) -> tuple[float, float, float, float, float]:
+    """1商品分の (合計, エレメント, オーラ, テーマ, 悩み) を取り出す"""
+    return (
+        float(scores.total[row]),
+        float(scores.element[row]),
+        float(scores.aura[row]),
+        float(scores.theme[row]),
+        float(scores.worry[row]),
+    )
+
+
+def _decorate(
+    user_profile: dict,
+    context: ScoringContext,
+    row: int,
+    breakdown: tuple[float, float, float, float, float],
+) -> dict:
+    """上位に残った商品だけ石名・色・推薦理由・内訳を付けた結果dictにする"""
+    index = context.index
+    entry = index.entries[row]
+    product = context.products[row]
+    stone_names = entry["stone_names"]
+    total, e_score, a_score, t_score, w_score = breakdown
+    reason = _build_reason(
+        stone_names,
+        index.matched_tags(user_profile.get("theme_tags", []), index.theme_bits[row]),
+        index.matched_tags(user_profile.get("worry_tags", []), index.worry_bits[row]),
+    )
+    return {
+        "score":              total,
+        "score_breakdown": {
+            "element": round(e_score * 100, 1),
+            "aura":    round(a_score * 100, 1),
+            "theme":   round(t_score * 100, 1),
+            "worry":   round(w_score * 100, 1),
+        },
+        "woo_product_id":     product["woo_product_id"],
+        "sku":                product["sku"],
+        "recommendation_reason": reason,
+        "stones":             list(stone_names),
+        "stone_colors":       list(entry["stone_colors"]),
+    }
+
+
+def _build_results(user_profile: dict, context: ScoringContext, picks: list[tuple[int, tuple]]) -> list[dict]:
+    """(行番号, 内訳) の上位リストから順位付きの結果リストを作る"""
+    top = []
+    for row, breakdown in picks:
+        try:
+            top.append(_decorate(user_profile, context, row, breakdown))
+        except Exception as e:
+            logger.error("商品結果生成エラー woo_product_id=%s: %s",
+                         context.products[row].get("woo_product_id"), e)
+            continue
+
+    for i, item in enumerate(top, start=1):
+        item["rank"] = i
+    return top
+
+
+# ===== 推薦結果キャッシュ =====
+# 診断由来のプロファイルは入力が離散的なので同一プロファイルが繰り返し現れる。
+# キーはコンテキスト版数（マスター・config）＋プロファイルの正規化ハッシュ＋件数。
+
+RESULT_CACHE_SIZE = 2048
+
+_result_cache = LRUCache("recommendations", RESULT_CACHE_SIZE)
+
+
+def _profile_cache_key(user_profile: dict) -> str:
+    """ユーザープロファイルの正規化ハッシュを返す（数値は小数9桁に量子化、タグは順序込み）"""
+    canonical = {
+        "element": sorted((k, round(float(v), 9)) for k, v in user_profile["element"].items()),
+        "aura":    sorted((k, round(float(v), 9)) for k, v in user_profile["aura"].items()),
+        "theme_tags": list(user_profile.get("theme_tags", [])),
+        "worry_tags": list(user_profile.get("worry_tags", [])),
+    }
+    payload = json.dumps(canonical, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def get_recommendation_cache_stats() -> dict:
+    """推薦結果キャッシュの件数とヒット率を返す"""
+    return _result_cache.stats()
+
+
+def invalidate_recommendation_cache() -> None:
+    """推薦結果キャッシュを破棄する"""
+    _result_cache.invalidate()
+
+
 # ===== メイン推薦関数 =====
 
 def recommend_products(
     user_profile: dict,
     top_n: int = 3,
+    context: ScoringContext | None = None,
+    gender: str | None = None,
 ) -> list[dict]:
     """
     ユーザープロファイルに対して一致率上位3商品を返す。
+    context を省略するとconfigを1回読み込んでコンテキストを作る。
+    gender（"女性"/"男性"/"female"/"male"）を渡すと、その性別向けと unisex の商品だけを候補にする。
+    全商品は数値スコアだけで比較し、結果dictは上位N件分だけ作る。
+    上位N件に入り得ない商品は上限値で枝刈りする（結果は全件計算と同一）。
+    同じマスター・config・プロファイルの結果はLRUキャッシュから返す。
 
     戻り値の形式:
     [
@@ -241,56 +606,167 @@ def recommend_products(
       ...
     ]
     """
-    try:
-        from api.utils_sheet import get_config
-        cfg = get_config()
-    except Exception:
-        cfg = {}
-    enabled_products = get_enabled_products(cfg)
-    results = []
+    if context is None:
+        context = build_scoring_context()
+
+    if top_n <= 0:
+        return []
+
+    cache_key = (context.version, _profile_cache_key(user_profile), top_n, normalize_gender(gender))
+    cached = _result_cache.get(cache_key)
+    stats = _result_cache.stats()
+    if cached is not None:
+        logger.info("推薦キャッシュヒット（ヒット率 %.1f%%, %d/%d）",
+                    stats["hit_rate"] * 100, stats["hits"], stats["hits"] + stats["misses"])
+        return copy.deepcopy(cached)
+    logger.info("推薦キャッシュミス（ヒット率 %.1f%%, %d/%d）",
+                stats["hit_rate"] * 100, stats["hits"], stats["hits"] + stats["misses"])
+
+    scores, scored = _score_with_pruning(user_profile, context, top_n, gender)
+    picks = [(row, _breakdown(scores, row)) for row in _select_top_rows(scores.total, scored, top_n)]
+    top = _build_results(user_profile, context, picks)
+
+    _result_cache.set(cache_key, copy.deepcopy(top))
+    return top
 
-    for product in enabled_products:
-        try:
-            product_profile = _calc_product_profile(product)
-            score_data = _score_product(user_profile, product_profile)
-            # priority_weight による補正（最大±5点）
-            total = min(100.0, score_data["total"] * product.get("priority_weight", 1.0))
-
-            stone_names = []
-            stone_colors = []  # 石ごとの代表色（color_tagsの先頭）
-            for part in product["parts"]:
-                stone = get_stone(part["stone_id"])
-                if stone:
-                    stone_names.append(stone["stone_name"])
-                    tags = stone.get("color_tags", [])
-                    stone_colors.append(tags[0] if tags else "")
-
-            reason = _build_reason(user_profile, product_profile, product)
-
-            results.append({
-                "score":              total,
-                "score_breakdown": {
-                    "element": score_data["element"],
-                    "aura":    score_data["aura"],
-                    "theme":   score_data["theme"],
-                    "worry":   score_data["worry"],
-                },
-                "woo_product_id":     product["woo_product_id"],
-                "sku":                product["sku"],
-                "recommendation_reason": reason,
-                "stones":             stone_names,
-                "stone_colors":       stone_colors,
-            })
-        except Exception as e:
-            logger.error("商品スコア計算エラー woo_product_id=%s: %s",
-                         product.get("woo_product_id"), e)
-            continue
 
-    # スコア降順ソート → 上位N件
-    results.sort(key=lambda x: x["score"], reverse=True)
-    top = results[:top_n]
+# 一括推薦で1回に計算するスコア行列の最大要素数（ユーザー数 × 商品数 × ビットセット長）
+BATCH_MAX_CELLS = 2_000_000
 
-    for i, item in enumerate(top, start=1):
-        item["rank"] = i
 
-    return top
+def _iter_batch_picks(
+    profiles: list[dict],
+    context: ScoringContext,
+    top_n: int,
+    genders: list[str | None] | None = None,
+):
+    """プロファイルをチャンクに分けて一括採点し、(番号, 上位の (行番号, 内訳) リスト) を順に返す
+
+    genders はプロファイルごとの性別（省略時は全員指定なし）。
+    """
+    index = context.index
+    masks = [_candidate_mask(context, g) for g in (genders or [None] * len(profiles))]
+    per_user_cells = max(1, len(index) * index.theme_bits.shape[1])
+    chunk_size = max(1, BATCH_MAX_CELLS // per_user_cells)
+
+    for start in range(0, len(profiles), chunk_size):
+        chunk = profiles[start:start + chunk_size]
+        scores = _score_matrix(chunk, context)
+
+        # 無効商品・性別の対象外を除外し、同点は行順を保ったまま降順に並べる
+        chunk_masks = np.array(masks[start:start + chunk_size]).reshape(len(chunk), -1)
+        masked = np.where(chunk_masks, scores.total, -np.inf)
+        order = np.argsort(-masked, axis=1, kind="stable")[:, :top_n]
+
+        for j in range(len(chunk)):
+            user_scores = ScoreArrays(*(arr[j] for arr in scores))
+            picks = []
+            for row in order[j].tolist():
+                if not chunk_masks[j, row]:
+                    break
+                picks.append((row, _breakdown(user_scores, row)))
+            yield start + j, picks
+
+
+def recommend_products_batch(
+    profiles: list[dict],
+    top_n: int = 3,
+    context: ScoringContext | None = None,
+    genders: list[str | None] | None = None,
+) -> list[list[dict]]:
+    """
+    複数ユーザープロファイルをまとめて推薦する（診断ログの再スコアリング・配信用の事前計算向け）。
+
+    configとマスターは最初に1回だけ読み込み、全ユーザーを行列演算でまとめて採点する。
+    genders を渡すとプロファイルごとにその性別の候補だけから選ぶ（profiles と同じ長さ）。
+    戻り値は profiles と同じ順序で、各要素は recommend_products と同じ形式のリスト。
+    """
+    if context is None:
+        context = build_scoring_context()
+    if not profiles or top_n <= 0:
+        return [[] for _ in profiles]
+
+    results = [
+        _build_results(profiles[i], context, picks)
+        for i, picks in _iter_batch_picks(profiles, context, top_n, genders)
+    ]
+    logger.info("一括推薦完了: %d件 (商品%d件)", len(profiles), len(context.index))
+    return results
+
+
+# ===== 推薦テーブル（全入力パターンの事前計算） =====
+
+class RecommendationTable(NamedTuple):
+    """入力パターンごとの上位N件をまとめた事前計算テーブル
+
+    rows は商品の行番号（件数不足は-1）、scores は (合計, エレメント, オーラ, テーマ, 悩み)。
+    結果dictは引き当て時に作るので、テーブル自体は数値配列だけを持つ。
+    """
+    version: str            # 作成時の ScoringContext.version
+    top_n: int
+    gender: str | None      # 候補を絞った性別（正規化済み、None=指定なし）
+    slots: dict             # 入力パターンのキー → テーブルの行番号
+    rows: np.ndarray        # (パターン数, top_n) int32
+    scores: np.ndarray      # (パターン数, top_n, 5) float64
+
+
+def build_recommendation_table(
+    profiles_by_key: dict,
+    top_n: int = 3,
+    context: ScoringContext | None = None,
+    gender: str | None = None,
+) -> RecommendationTable:
+    """キー → ユーザープロファイル の全パターンを一括採点し、上位N件のテーブルを作る
+
+    性別ごとに候補が異なるため、テーブルは性別1つにつき1つ作る。
+    """
+    if context is None:
+        context = build_scoring_context()
+    keys = list(profiles_by_key)
+    profiles = [profiles_by_key[k] for k in keys]
+    rows = np.full((len(keys), top_n), -1, dtype=np.int32)
+    scores = np.zeros((len(keys), top_n, 5))
+
+    for i, picks in _iter_batch_picks(profiles, context, top_n, [gender] * len(profiles)):
+        for rank, (row, breakdown) in enumerate(picks):
+            rows[i, rank] = row
+            scores[i, rank] = breakdown
+
+    logger.info("推薦テーブルを作成しました: %dパターン (商品%d件)", len(keys), len(context.index))
+    return RecommendationTable(
+        version=context.version,
+        top_n=top_n,
+        gender=normalize_gender(gender),
+        slots={k: i for i, k in enumerate(keys)},
+        rows=rows,
+        scores=scores,
+    )
+
+
+def lookup_recommendation_table(
+    table: RecommendationTable,
+    key,
+    user_profile: dict,
+    context: ScoringContext,
+    top_n: int = 3,
+    gender: str | None = None,
+) -> list[dict] | None:
+    """
+    テーブルから推薦結果を引き当てる。版数・性別違い、未登録キー、件数超過はNone。
+
+    user_profile はキーに対応するプロファイルと同じスコアになるもの（タグの順序違いは可）を渡す。
+    推薦理由のタグはこのプロファイルの順序で並べる。
+    """
+    if table.version != context.version or top_n > table.top_n:
+        return None
+    if table.gender != normalize_gender(gender):
+        return None
+    slot = table.slots.get(key)
+    if slot is None:
+        return None
+    picks = [
+        (row, tuple(table.scores[slot, rank].tolist()))
+        for rank, row in enumerate(table.rows[slot, :top_n].tolist())
+        if row >= 0
+    ]
+    return _build_results(user_profile, context, picks)
@@ -0,0 +1,435 @@
+"""マッチング用コンパイル済み商品インデックス
+
+石・組み合わせ・商品マスターのスナップショットから全商品のプロファイルを
+事前計算し、リクエスト間で再利用する。
+いずれかのマスターのSheetCacheが破棄・再読み込みされ、内容が変わったときだけ再構築する。
+構築結果は /tmp にスナップショット（.npz）として保存し、コールドスタート時は
+マスターの版数が一致すればプロファイルを再計算せずに読み込む。
+
+テーマ・悩みタグは1つの語彙に登録（インターン）し、商品ごとのタグ集合を
+uint64配列のビットセットで持つ。一致数は AND のポップカウントで求める。
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import TypedDict
+
+import numpy as np
+
+from api.stone_master import get_stone_master_data
+from api.stone_combination_master import get_combination_master_data
+from api.product_master import get_product_master_data, ProductEntry, product_gender_mode, gender_modes_for
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledProduct(TypedDict):
+    product_id: str           # 商品マスターのキー
+    product: ProductEntry     # 商品マスターの元データ（configオーバーライド前）
+    profile: dict             # _calc_product_profile の結果
+    stone_names: list[str]
+    stone_colors: list[str]   # 石ごとの代表色（color_tagsの先頭）
+
+
+class ProductIndex:
+    """マスタースナップショット1つ分のコンパイル済み商品プロファイル
+
+    element_matrix / aura_matrix は entries と同じ行順で、各行をL2正規化済み。
+    ユーザーベクトル（正規化済み）との行列ベクトル積で全商品のコサイン類似度が得られる。
+    theme_bits / worry_bits も同じ行順で、1行が語彙サイズ分のビットセット（uint64配列）。
+    theme_postings / worry_postings はタグ → そのタグを持つ商品の行番号配列（転置インデックス）。
+    pair_products は石ペア（ソート済みタプル）→ その2石を含む商品IDのリスト。
+    gender_masks は gender_mode（male/female/unisex）→ その商品の行マスク（性別ごとの候補分割）。
+    """
+
+    def __init__(
+        self,
+        version: str,
+        sources: tuple,
+        entries: list[CompiledProduct],
+        element_matrix: np.ndarray,
+        aura_matrix: np.ndarray,
+        vocab: dict[str, int],
+        theme_bits: np.ndarray,
+        worry_bits: np.ndarray,
+    ):
+        self.version = version    # マスター内容のフィンガープリント
+        self.sources = sources    # (石, 組み合わせ, 商品) マスターのdict本体
+        self.entries = entries
+        self.by_id: dict[str, CompiledProduct] = {e["product_id"]: e for e in entries}
+        self.element_matrix = element_matrix   # (商品数, 4)
+        self.aura_matrix = aura_matrix         # (商品数, 8)
+        self.vocab = vocab                     # タグ → ビット位置
+        self.theme_bits = theme_bits           # (商品数, ワード数)
+        self.worry_bits = worry_bits           # (商品数, ワード数)
+        self.theme_counts = np.bitwise_count(theme_bits).sum(axis=1)   # 商品ごとのタグ数
+        self.worry_counts = np.bitwise_count(worry_bits).sum(axis=1)
+        self.theme_postings = _build_postings(theme_bits, vocab)
+        self.worry_postings = _build_postings(worry_bits, vocab)
+        self._pair_products: dict[tuple[str, str], list[str]] | None = None
+        modes = [product_gender_mode(e["product"]) for e in entries]
+        self.gender_masks: dict[str, np.ndarray] = {
+            mode: np.array([m == mode for m in modes], dtype=bool) for mode in set(modes)
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def pair_products(self) -> dict[tuple[str, str], list[str]]:
+        """管理画面での組み合わせ編集時にしか使わないので初回アクセスで作る"""
+        if self._pair_products is None:
+            self._pair_products = _build_pair_products(self.entries)
+        return self._pair_products
+
+    def gender_mask(self, gender: str | None) -> np.ndarray:
+        """リクエストの性別で推薦対象になる商品の行マスクを返す（指定なしは全商品）"""
+        mask = np.zeros(len(self.entries), dtype=bool)
+        for mode in gender_modes_for(gender):
+            if mode in self.gender_masks:
+                mask |= self.gender_masks[mode]
+        return mask
+
+    def encode_tags(self, tags: list[str]) -> tuple[np.ndarray, int]:
+        """タグリストをビットセットに変換し、(ビットセット, 重複除去後のタグ数) を返す
+
+        語彙にないタグはどの商品とも一致しないのでビットを立てないが、タグ数には数える。
+        """
+        unique = set(tags)
+        return _tags_to_bits(unique, self.vocab), len(unique)
+
+    def tag_overlap_bound(self, tags: list[str], kind: str) -> np.ndarray:
+        """タグ一致率（0.0〜1.0）の商品ごとの上限を返す
+
+        転置インデックスでユーザーのタグを1つも持たない商品は0、
+        それ以外は min(商品のタグ数, ユーザーのタグ数) / ユーザーのタグ数 とする。
+        kind は "theme" または "worry"。
+        """
+        unique = set(tags)
+        bound = np.zeros(len(self.entries))
+        if not unique:
+            return bound
+        postings = self.theme_postings if kind == "theme" else self.worry_postings
+        counts = self.theme_counts if kind == "theme" else self.worry_counts
+        rows = [postings[t] for t in unique if t in postings]
+        if rows:
+            touched = np.unique(np.concatenate(rows))
+            bound[touched] = np.minimum(counts[touched], len(unique)) / len(unique)
+        return bound
+
+    def matched_tags(self, tags: list[str], bits: np.ndarray) -> list[str]:
+        """tags のうちビットセット bits に含まれるものを tags の順序で返す"""
+        matched = []
+        for tag in dict.fromkeys(tags):
+            pos = self.vocab.get(tag)
+            if pos is not None and (int(bits[pos >> 6]) >> (pos & 63)) & 1:
+                matched.append(tag)
+        return matched
+
+
+def _tags_to_bits(tags, vocab: dict[str, int]) -> np.ndarray:
+    """タグ集合を語彙に沿ったuint64ビットセットに変換する"""
+    bits = np.zeros(_word_count(vocab), dtype=np.uint64)
+    for tag in tags:
+        pos = vocab.get(tag)
+        if pos is not None:
+            bits[pos >> 6] |= np.uint64(1 << (pos & 63))
+    return bits
+
+
+def _build_postings(bits: np.ndarray, vocab: dict[str, int]) -> dict[str, np.ndarray]:
+    """タグ → そのタグを持つ商品の行番号配列 の転置インデックスをビットセットから作る"""
+    # (商品数, ワード数) のuint64を (商品数, 語彙サイズ) の真偽値に展開する
+    flags = np.unpackbits(
+        np.ascontiguousarray(bits, dtype="<u8").view(np.uint8), axis=1, bitorder="little",
+    )
+    postings: dict[str, np.ndarray] = {}
+    for tag, pos in vocab.items():
+        rows = np.flatnonzero(flags[:, pos])
+        if len(rows):
+            postings[tag] = rows.astype(np.intp)
+    return postings
+
+
+def _build_pair_products(entries: list[CompiledProduct]) -> dict[tuple[str, str], list[str]]:
+    """石ペア → その2石を同時に含む商品IDのリスト を作る"""
+    pairs: dict[tuple[str, str], list[str]] = {}
+    for entry in entries:
+        stone_ids = [part["stone_id"] for part in entry["product"]["parts"]]
+        seen = set()
+        for i, stone_a in enumerate(stone_ids):
+            for stone_b in stone_ids[i + 1:]:
+                key = tuple(sorted((stone_a, stone_b)))
+                if key not in seen:
+                    seen.add(key)
+                    pairs.setdefault(key, []).append(entry["product_id"])
+    return pairs
+
+
+def _word_count(vocab: dict[str, int]) -> int:
+    return max(1, (len(vocab) + 63) // 64)
+
+
+def _build_vocab(stones: dict, combos: dict) -> dict[str, int]:
+    """石・組み合わせマスターと診断側のタグ変換表からタグ語彙を作る"""
+    vocab: dict[str, int] = {}
+
+    def add(tags):
+        for tag in tags:
+            if tag not in vocab:
+                vocab[tag] = len(vocab)
+
+    for stone in stones.values():
+        add(stone.get("theme_tags", []))
+        add(stone.get("worry_tags", []))
+    for effect in combos.values():
+        add(effect.get("theme_tags", []))
+        add(effect.get("worry_tags", []))
+
+    # ユーザー側のタグ（悩みカテゴリ・problemキーワード由来）も同じ語彙に登録する
+    try:
+        from api.diagnose import CONCERN_THEME_MAP, CONCERN_WORRY_MAP, PROBLEM_KEYWORD_MAP
+        for tags in CONCERN_THEME_MAP.values():
+            add(tags)
+        for tags in CONCERN_WORRY_MAP.values():
+            add(tags)
+        for _, worry, theme in PROBLEM_KEYWORD_MAP:
+            add(worry)
+            add(theme)
+    except ImportError as e:
+        logger.warning("診断側のタグ変換表を読み込めません（商品タグのみで語彙を作成）: %s", e)
+    return vocab
+
+
+_index: dict = {"index": None}
+_lock = threading.Lock()
+
+
+def _master_fingerprint(stones: dict, combos: dict, products: dict) -> str:
+    """3マスターの内容から版数（SHA1の先頭16桁）を計算する"""
+    payload = json.dumps(
+        {
+            "stones": stones,
+            # 組み合わせマスターのキーはfrozensetなのでソート済み文字列に変換
+            "combos": {"|".join(sorted(k)): v for k, v in combos.items()},
+            "products": products,
+        },
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _compile(version: str, stones: dict, combos: dict, products: dict) -> ProductIndex:
+    """全商品のプロファイルを計算してインデックスを構築する"""
+    from api.matching import _calc_product_profile, _unit_vector, ELEMENT_KEYS, AURA_KEYS
+
+    entries: list[CompiledProduct] = []
+    for pid, product in products.items():
+        try:
+            profile = _calc_product_profile(product, stones, combos)
+        except Exception as e:
+            logger.error("商品プロファイル計算エラー product_id=%s: %s", pid, e)
+            continue
+
+        stone_names = []
+        stone_colors = []
+        for part in product["parts"]:
+            stone = stones.get(part["stone_id"])
+            if stone:
+                stone_names.append(stone["stone_name"])
+                tags = stone.get("color_tags", [])
+                stone_colors.append(tags[0] if tags else "")
+
+        entries.append({
+            "product_id":   pid,
+            "product":      product,
+            "profile":      profile,
+            "stone_names":  stone_names,
+            "stone_colors": stone_colors,
+        })
+
+    vocab = _build_vocab(stones, combos)
+    words = _word_count(vocab)
+    element_matrix = np.zeros((len(entries), len(ELEMENT_KEYS)))
+    aura_matrix = np.zeros((len(entries), len(AURA_KEYS)))
+    theme_bits = np.zeros((len(entries), words), dtype=np.uint64)
+    worry_bits = np.zeros((len(entries), words), dtype=np.uint64)
+    for i, entry in enumerate(entries):
+        profile = entry["profile"]
+        element_matrix[i] = _unit_vector(profile["element"], ELEMENT_KEYS)
+        aura_matrix[i] = _unit_vector(profile["aura"], AURA_KEYS)
+        theme_bits[i] = _tags_to_bits(profile["theme_tags"], vocab)
+        worry_bits[i] = _tags_to_bits(profile["worry_tags"], vocab)
+
+    logger.info("商品インデックスを構築しました: version=%s (%d件, タグ語彙%d語)",
+                version, len(entries), len(vocab))
+    return ProductIndex(
+        version, (stones, combos, products), entries,
+        element_matrix, aura_matrix, vocab, theme_bits, worry_bits,
+    )
+
+
+# ===== ディスクスナップショット =====
+
+# スナップショットの形式。配列やメタデータの構成を変えたら上げる
+SNAPSHOT_FORMAT = 1
+
+_SNAPSHOT_DIR = os.path.join(os.environ.get("TMPDIR", "/tmp"), "atlas_matching")
+try:
+    os.makedirs(_SNAPSHOT_DIR, exist_ok=True)
+except Exception:
+    _SNAPSHOT_DIR = ""
+
+
+def _snapshot_path() -> str:
+    return os.path.join(_SNAPSHOT_DIR, "product_index.npz")
+
+
+def save_index_snapshot(index: ProductIndex) -> None:
+    """インデックスの行列・ビットセット・商品メタデータを .npz に保存する"""
+    if not _SNAPSHOT_DIR:
+        return
+    meta = {
+        "format":       SNAPSHOT_FORMAT,
+        "version":      index.version,
+        "vocab":        index.vocab,
+        "product_ids":  [e["product_id"] for e in index.entries],
+        # 商品プロファイルのタグは語彙のビット位置で持つ（ベクトルは配列側）
+        "theme_tags":   [[index.vocab[t] for t in e["profile"]["theme_tags"]] for e in index.entries],
+        "worry_tags":   [[index.vocab[t] for t in e["profile"]["worry_tags"]] for e in index.entries],
+        "stone_names":  [e["stone_names"] for e in index.entries],
+        "stone_colors": [e["stone_colors"] for e in index.entries],
+    }
+    from api.matching import ELEMENT_KEYS, AURA_KEYS
+
+    element_raw = np.array([[e["profile"]["element"][k] for k in ELEMENT_KEYS] for e in index.entries])
+    aura_raw = np.array([[e["profile"]["aura"][k] for k in AURA_KEYS] for e in index.entries])
+    path = _snapshot_path()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                meta=np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+                element_matrix=index.element_matrix,
+                aura_matrix=index.aura_matrix,
+                element_raw=element_raw.reshape(len(index.entries), len(ELEMENT_KEYS)),
+                aura_raw=aura_raw.reshape(len(index.entries), len(AURA_KEYS)),
+                theme_bits=index.theme_bits,
+                worry_bits=index.worry_bits,
+            )
+        # 書き込み途中のファイルを他インスタンスが読まないよう置き換えで公開する
+        os.replace(tmp_path, path)
+        logger.info("商品インデックスのスナップショットを保存しました: version=%s", index.version)
+    except Exception as e:
+        logger.debug("スナップショット保存エラー: %s", e)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def load_index_snapshot(version: str, stones: dict, combos: dict, products: dict) -> ProductIndex | None:
+    """版数が一致するスナップショットがあればインデックスとして読み込む（なければNone）"""
+    from api.matching import ELEMENT_KEYS, AURA_KEYS
+
+    if not _SNAPSHOT_DIR:
+        return None
+    path = _snapshot_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            if meta.get("format") != SNAPSHOT_FORMAT or meta.get("version") != version:
+                logger.info("スナップショットの版数が一致しません（再構築）: %s != %s",
+                            meta.get("version"), version)
+                return None
+            # 診断側のタグ変換表が変わっていたら語彙がずれるので使わない
+            if meta["vocab"] != _build_vocab(stones, combos):
+                logger.info("スナップショットのタグ語彙が一致しません（再構築）")
+                return None
+            arrays = {k: data[k] for k in (
+                "element_matrix", "aura_matrix", "element_raw", "aura_raw", "theme_bits", "worry_bits",
+            )}
+
+        tags = sorted(meta["vocab"], key=meta["vocab"].get)
+        entries: list[CompiledProduct] = [
+            {
+                "product_id":   pid,
+                "product":      products[pid],
+                "profile": {
+                    "element":    dict(zip(ELEMENT_KEYS, element)),
+                    "aura":       dict(zip(AURA_KEYS, aura)),
+                    "theme_tags": [tags[i] for i in theme_ids],
+                    "worry_tags": [tags[i] for i in worry_ids],
+                },
+                "stone_names":  names,
+                "stone_colors": colors,
+            }
+            for pid, element, aura, theme_ids, worry_ids, names, colors in zip(
+                meta["product_ids"], arrays["element_raw"].tolist(), arrays["aura_raw"].tolist(),
+                meta["theme_tags"], meta["worry_tags"], meta["stone_names"], meta["stone_colors"],
+            )
+        ]
+    except Exception as e:
+        logger.warning("スナップショット読み込みエラー（再構築）: %s", e)
+        return None
+
+    logger.info("商品インデックスをスナップショットから読み込みました: version=%s (%d件)",
+                version, len(entries))
+    return ProductIndex(
+        version, (stones, combos, products), entries,
+        arrays["element_matrix"], arrays["aura_matrix"], meta["vocab"],
+        arrays["theme_bits"], arrays["worry_bits"],
+    )
+
+
+def get_product_index() -> ProductIndex:
+    """現在のマスタースナップショットに対応するコンパイル済みインデックスを返す
+
+    マスターのdictが前回と同一オブジェクトならそのまま再利用する。
+    キャッシュ期限切れで再読み込みされても内容が同じなら再計算しない。
+    """
+    stones = get_stone_master_data()
+    combos = get_combination_master_data()
+    products = get_product_master_data()
+    sources = (stones, combos, products)
+
+    current = _index["index"]
+    if current is not None and all(a is b for a, b in zip(current.sources, sources)):
+        return current
+
+    with _lock:
+        current = _index["index"]
+        if current is not None and all(a is b for a, b in zip(current.sources, sources)):
+            return current
+
+        version = _master_fingerprint(stones, combos, products)
+        if current is not None and current.version == version:
+            current.sources = sources
+            return current
+
+        # コールドスタート時は前回インスタンスが保存したスナップショットを使う
+        index = load_index_snapshot(version, stones, combos, products)
+        if index is None:
+            index = _compile(version, stones, combos, products)
+            save_index_snapshot(index)
+        _index["index"] = index
+        return index
+
+
+def get_products_affected_by_combination(stone_id_a: str, stone_id_b: str) -> list[str]:
+    """組み合わせ効果を編集したときにプロファイルが変わる商品IDの一覧を返す"""
+    key = tuple(sorted((stone_id_a, stone_id_b)))
+    return list(get_product_index().pair_products.get(key, []))
+
+
+def invalidate_product_index() -> None:
+    """コンパイル済みインデックスを破棄して次回アクセスで再構築させる"""
+    with _lock:
+        _index["index"] = None
+    logger.info("商品インデックスを破棄しました")
@@ -163,13 +163,13 @@ _cache = SheetCache("product_master")
 
 
 def get_product_master_data() -> dict:
-    """シート優先で商品マスターを返す（失敗時はハードコードにフォールバック）"""
+    """ストレージ（既定はシート）優先で商品マスターを返す（失敗時はハードコードにフォールバック）"""
     cached = _cache.get()
     if cached is not None:
         return cached
     try:
-        from api.utils_sheet import get_product_master_from_sheet
-        data = get_product_master_from_sheet()
+        from api.storage import get_storage
+        data = get_storage().get_product_master()
         if data:
             _cache.set(data)
             return data
@@ -188,21 +188,59 @@ def get_product(product_id: int | str) -> ProductEntry | None:
     return get_product_master_data().get(str(product_id))
 
 
+# ===== 性別による候補の絞り込み =====
+
+GENDER_MODES = ("male", "female", "unisex")
+
+# 診断リクエストの gender（LIFFは日本語で送る）→ 正規化後の性別
+GENDER_ALIASES: dict[str, str] = {
+    "女性": "female", "female": "female",
+    "男性": "male",   "male": "male",
+}
+
+
+def normalize_gender(gender: str | None) -> str | None:
+    """リクエストの性別を "female" / "male" に正規化する。それ以外（未指定・その他）はNone。"""
+    if not gender:
+        return None
+    return GENDER_ALIASES.get(str(gender).strip().lower())
+
+
+def product_gender_mode(product: ProductEntry) -> str:
+    """商品の gender_mode を返す（未設定・不明な値は unisex 扱い）"""
+    mode = str(product.get("gender_mode") or "").strip().lower()
+    return mode if mode in GENDER_MODES else "unisex"
+
+
+def gender_modes_for(gender: str | None) -> tuple[str, ...]:
+    """性別ごとに推薦対象とする商品の gender_mode（性別指定なしは全商品）"""
+    normalized = normalize_gender(gender)
+    if normalized is None:
+        return GENDER_MODES
+    return (normalized, "unisex")
+
+
+def apply_config_overrides(product_id: str, product: ProductEntry, config: dict | None) -> ProductEntry:
+    """configシートの product_<id>_enabled / product_<id>_priority を反映したコピーを返す"""
+    entry = dict(product)
+    if config:
+        enabled_key = f"product_{product_id}_enabled"
+        priority_key = f"product_{product_id}_priority"
+        if enabled_key in config:
+            entry["enabled"] = str(config[enabled_key]).lower() == "true"
+        if priority_key in config:
+            try:
+                entry["priority_weight"] = float(config[priority_key])
+            except (ValueError, TypeError):
+                pass
+    return entry
+
+
 def get_enabled_products(config: dict | None = None) -> list[ProductEntry]:
     """有効な商品構成の一覧を返す（configオーバーライド対応）"""
     result = []
     for pid, p in get_product_master_data().items():
-        entry = dict(p)
-        if config:
-            enabled_key = f"product_{pid}_enabled"
-            priority_key = f"product_{pid}_priority"
-            if enabled_key in config:
-                entry["enabled"] = str(config[enabled_key]).lower() == "true"
-            if priority_key in config:
-                try:
-                    entry["priority_weight"] = float(config[priority_key])
-                except (ValueError, TypeError):
-                    pass
+        entry = apply_config_overrides(pid, p, config)
         if entry["enabled"]:
             result.append(entry)
     return result
@@ -0,0 +1,312 @@
+"""スプレッドシートのSQLite読み取りレプリカ
+
+EXPECTED_HEADERS の各シートを /tmp のSQLiteに写し、読み取りをローカルで返す。
+SHEETS_REPLICA=1 のときだけ有効。
+
+- 各シートは1テーブル（列はヘッダー名、_row はシート上の行番号）。キー列にインデックスを張る
+- 最終同期から SHEETS_REPLICA_MAX_STALENESS 秒を超えたシートは、読む前に同期する
+- 追記専用のシート（注文・ブレスレット選択記録）は前回の行数より後ろだけを読み足し、
+  SHEETS_REPLICA_FULL_SYNC 秒ごとに全体を読み直して他インスタンスの削除を取り込む
+- diagnosis_logs・profiles は既存行が書き換わるため毎回全体を読む。
+  キーが見つからないときだけ末尾の新しい行を読み足す（他インスタンスが追加した直後の行）
+- 書き込みは従来どおりSheetsに行い、成功したらレプリカにも反映する（write-through）
+- バックグラウンドスレッドが定期的に、MAX_STALENESS を超えたシートだけ同期する
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+from gspread.utils import a1_to_rowcol, numericise_all, rowcol_to_a1
+
+logger = logging.getLogger(__name__)
+
+REPLICA_ENABLED = os.environ.get("SHEETS_REPLICA", "") == "1"
+MAX_STALENESS = float(os.environ.get("SHEETS_REPLICA_MAX_STALENESS", "60"))
+FULL_SYNC_INTERVAL = float(os.environ.get("SHEETS_REPLICA_FULL_SYNC", "600"))
+SYNC_INTERVAL = float(os.environ.get("SHEETS_REPLICA_SYNC_INTERVAL", "30"))
+
+_DB_PATH = os.path.join(os.environ.get("TMPDIR", "/tmp"), "atlas_sheet_replica.sqlite3")
+
+# キー列（インデックスを張る列）。未指定のシートは1列目
+KEY_COLUMNS: dict[str, tuple[str, ...]] = {
+    "stone_combinations": ("stone_id_a", "stone_id_b"),
+}
+
+
+def _append_only_sheets() -> set[str]:
+    """追記だけで既存行を書き換えないシート（差分同期できる）"""
+    from api.utils_sheet import ORDER_SHEET_NAME, BRACELET_SELECTION_SHEET_NAME
+    return {ORDER_SHEET_NAME, BRACELET_SELECTION_SHEET_NAME}
+
+
+def _growing_sheets() -> set[str]:
+    """新しい行が末尾に追記されるシート（未知のキーは末尾を読み足して探す）"""
+    from api.utils_sheet import LOG_SHEET_NAME, PROFILE_SHEET_NAME
+    return _append_only_sheets() | {LOG_SHEET_NAME, PROFILE_SHEET_NAME}
+
+
+def _headers(sheet_name: str) -> list[str]:
+    from api.utils_sheet import EXPECTED_HEADERS
+    return EXPECTED_HEADERS[sheet_name]
+
+
+def quote_identifier(name: str) -> str:
+    """シート名・ヘッダー名をSQLiteの識別子として引用符で囲む"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SheetReplica:
+    """EXPECTED_HEADERS の全シートを写すSQLiteデータベース"""
+
+    def __init__(self, path: str = _DB_PATH):
+        from api.utils_sheet import EXPECTED_HEADERS
+
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.RLock()
+        self._sheet_locks = {name: threading.Lock() for name in EXPECTED_HEADERS}
+        self._thread: threading.Thread | None = None
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS _sync ("
+                " sheet TEXT PRIMARY KEY, synced_at REAL, full_synced_at REAL, row_count INTEGER)"
+            )
+            for name, headers in EXPECTED_HEADERS.items():
+                self._create_table(name, headers)
+
+    # ----- スキーマ -----
+
+    def _create_table(self, sheet_name: str, headers: list[str]) -> None:
+        table = quote_identifier(sheet_name)
+        existing = [r[1] for r in self._conn.execute(f"PRAGMA table_info({table})")]
+        if existing and existing != ["_row"] + headers:
+            # ヘッダー定義が変わったら作り直して全件同期させる
+            self._conn.execute(f"DROP TABLE {table}")
+            self._conn.execute("DELETE FROM _sync WHERE sheet = ?", (sheet_name,))
+        columns = ", ".join(f"{quote_identifier(h)} TEXT NOT NULL DEFAULT ''" for h in headers)
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (_row INTEGER PRIMARY KEY, {columns})")
+        key_cols = KEY_COLUMNS.get(sheet_name, (headers[0],))
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote_identifier(f'idx_{sheet_name}_key')} "
+            f"ON {table} ({', '.join(quote_identifier(c) for c in key_cols)})"
+        )
+
+    # ----- 同期 -----
+
+    def _sync_state(self, sheet_name: str) -> tuple[float, float, int]:
+        row = self._conn.execute(
+            "SELECT synced_at, full_synced_at, row_count FROM _sync WHERE sheet = ?", (sheet_name,)
+        ).fetchone()
+        return row if row else (0.0, 0.0, 0)
+
+    def ensure_fresh(self, sheet_name: str) -> None:
+        """最終同期が MAX_STALENESS 秒より古ければ同期する"""
+        with self._lock:
+            synced_at, _, _ = self._sync_state(sheet_name)
+        if time.time() - synced_at > MAX_STALENESS:
+            self.sync(sheet_name)
+
+    def sync(self, sheet_name: str, full: bool = False, tail: bool = False) -> int:
+        """シートから変更行を取り込み、変更した行数を返す
+
+        tail=True は前回の行数より後ろだけを読み足す。書き換えは取り込めないので、
+        追記専用でないシートでは最終同期時刻を進めない。
+        """
+        from api.utils_sheet import _get_worksheet
+
+        with self._sheet_locks[sheet_name]:
+            with self._lock:
+                synced_at, full_synced_at, row_count = self._sync_state(sheet_name)
+            now = time.time()
+            if tail and full_synced_at == 0:
+                tail = False  # まだ全体を読んでいなければ全体同期
+            incremental = tail or (
+                not full
+                and sheet_name in _append_only_sheets()
+                and full_synced_at > 0
+                and now - full_synced_at < FULL_SYNC_INTERVAL
+            )
+            if incremental and sheet_name not in _append_only_sheets():
+                now = synced_at
+
+            ws = _get_worksheet(sheet_name)
+            headers = _headers(sheet_name)
+            if incremental:
+                start = row_count + 1
+                end_col = rowcol_to_a1(1, len(headers)).rstrip("0123456789")
+                values = ws.get(f"A{start}:{end_col}")
+            else:
+                start = 2
+                values = ws.get_all_values()[1:]
+
+            rows = {start + i: self._pad(v, headers) for i, v in enumerate(values)}
+            with self._lock:
+                changed = self._apply(sheet_name, rows, delete_after=None if incremental else start + len(rows))
+                new_count = max(row_count, start + len(rows) - 1) if incremental else start + len(rows) - 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO _sync (sheet, synced_at, full_synced_at, row_count) VALUES (?, ?, ?, ?)",
+                    (sheet_name, now, full_synced_at if incremental else now, new_count),
+                )
+        if changed:
+            logger.info("レプリカ同期: %s %d行を更新 (%s)", sheet_name, changed,
+                        "差分" if incremental else "全体")
+        return changed
+
+    def _pad(self, values: list, headers: list[str]) -> tuple:
+        values = ["" if v is None else str(v) for v in values[:len(headers)]]
+        return tuple(values + [""] * (len(headers) - len(values)))
+
+    def _apply(self, sheet_name: str, rows: dict[int, tuple], delete_after: int | None) -> int:
+        """（_lock 取得中に呼ぶ）行番号 → 値 のうち変わった行だけを書き込む"""
+        table = quote_identifier(sheet_name)
+        headers = _headers(sheet_name)
+        placeholders = ", ".join("?" for _ in range(len(headers) + 1))
+        changed = 0
+        self._conn.execute("BEGIN")
+        try:
+            if rows:
+                lo, hi = min(rows), max(rows)
+                current = {
+                    r[0]: tuple(r[1:])
+                    for r in self._conn.execute(
+                        f"SELECT * FROM {table} WHERE _row BETWEEN ? AND ?", (lo, hi)
+                    )
+                }
+                updates = [(row,) + values for row, values in rows.items() if current.get(row) != values]
+                self._conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", updates)
+                changed += len(updates)
+            if delete_after is not None:
+                changed += self._conn.execute(f"DELETE FROM {table} WHERE _row >= ?", (delete_after,)).rowcount
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return changed
+
+    def invalidate(self, sheet_name: str) -> None:
+        """次の読み取りで全体を同期させる"""
+        with self._lock:
+            self._conn.execute("DELETE FROM _sync WHERE sheet = ?", (sheet_name,))
+
+    # ----- write-through -----
+
+    def record_append(self, sheet_name: str, rows: list[list], start_row: int | None) -> None:
+        """Sheetsへの追記を反映する（行番号が分からなければ次回同期に任せる）"""
+        if sheet_name not in self._sheet_locks:
+            return
+        if not start_row:
+            self.invalidate(sheet_name)
+            return
+        headers = _headers(sheet_name)
+        with self._lock:
+            self._apply(sheet_name, {
+                start_row + i: self._pad([sheet_value(v) for v in row], headers) for i, row in enumerate(rows)
+            }, delete_after=None)
+
+    def record_ranges(self, sheet_name: str, data: list[dict]) -> None:
+        """batch_update の範囲更新（1行ずつ）を反映する"""
+        if sheet_name not in self._sheet_locks:
+            return
+        table = quote_identifier(sheet_name)
+        headers = _headers(sheet_name)
+        with self._lock:
+            for d in data:
+                row, col = a1_to_rowcol(d["range"].split(":")[0])
+                values = d["values"][0]
+                names = headers[col - 1:col - 1 + len(values)]
+                if len(names) != len(values):
+                    self.invalidate(sheet_name)
+                    return
+                assignments = ", ".join(f"{quote_identifier(n)} = ?" for n in names)
+                cur = self._conn.execute(
+                    f"UPDATE {table} SET {assignments} WHERE _row = ?",
+                    [sheet_value(v) for v in values] + [row],
+                )
+                if cur.rowcount == 0:
+                    # まだ取り込んでいない行なら次回同期に任せる
+                    self.invalidate(sheet_name)
+
+    # ----- 読み取り -----
+
+    def get_record(self, sheet_name: str, key: str) -> dict | None:
+        """キー列（1列目）が key の最初の行を ヘッダー名 → 値（文字列）で返す"""
+        self.ensure_fresh(sheet_name)
+        record = self._select_one(sheet_name, key)
+        if record is None and sheet_name in _growing_sheets():
+            # 他インスタンスが追記したばかりの行を読み足して1回だけ引き直す
+            self.sync(sheet_name, tail=True)
+            record = self._select_one(sheet_name, key)
+        return record
+
+    def _select_one(self, sheet_name: str, key: str) -> dict | None:
+        headers = _headers(sheet_name)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT * FROM {quote_identifier(sheet_name)} WHERE {quote_identifier(headers[0])} = ? ORDER BY _row LIMIT 1",
+                (key,),
+            ).fetchone()
+        return dict(zip(headers, row[1:])) if row else None
+
+    def get_all_records(self, sheet_name: str) -> list[dict]:
+        """get_all_records と同じく数値らしい値を数値にしたレコードのリストを返す"""
+        self.ensure_fresh(sheet_name)
+        headers = _headers(sheet_name)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT * FROM {quote_identifier(sheet_name)} ORDER BY _row").fetchall()
+        return [dict(zip(headers, numericise_all(list(r[1:])))) for r in rows]
+
+    # ----- バックグラウンド同期 -----
+
+    def start_background_sync(self, interval: float = SYNC_INTERVAL) -> None:
+        """古くなったシートを定期的に同期するデーモンスレッドを起動する（起動済みなら何もしない）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._sync_loop, args=(interval,), daemon=True)
+            self._thread.start()
+
+    def _sync_loop(self, interval: float) -> None:
+        from api.sheets_client import background_retries
+
+        with background_retries():
+            while True:
+                time.sleep(interval)
+                for sheet_name in self._sheet_locks:
+                    try:
+                        # 最近同期したシートは読まない（クォータを使わない）
+                        self.ensure_fresh(sheet_name)
+                    except Exception as e:
+                        logger.warning("レプリカのバックグラウンド同期エラー (%s): %s", sheet_name, e)
+
+
+def sheet_value(value) -> str:
+    """書き込んだ値をシートから読んだときの表示形式に寄せる"""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    return "" if value is None else str(value)
+
+
+_replica: dict = {"replica": None}
+_replica_lock = threading.Lock()
+
+
+def get_replica() -> SheetReplica | None:
+    """レプリカを返す（無効・初期化失敗時はNone）"""
+    if not REPLICA_ENABLED:
+        return None
+    if _replica["replica"] is None:
+        with _replica_lock:
+            if _replica["replica"] is None:
+                try:
+                    replica = SheetReplica(_DB_PATH)
+                    replica.start_background_sync()
+                    _replica["replica"] = replica
+                    logger.info("SQLiteレプリカを開きました: %s", _DB_PATH)
+                except Exception as e:
+                    logger.warning("SQLiteレプリカ初期化エラー（Sheetsを直接読みます）: %s", e)
+                    return None
+    return _replica["replica"]
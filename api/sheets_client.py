@@ -0,0 +1,196 @@
+"""Google Sheets APIのクォータ管理付きHTTPクライアント
+
+gspread の全リクエストが通る HTTPClient.request を差し替えて、
+- 読み取り（GET）・書き込み（それ以外）を1分あたりのクォータに合わせたトークンバケットで計量する
+- エラーを分類する（quota=429 / auth=401 / transient=408・5xx・接続エラー / fatal=その他）
+- quota・transient はジッター付き指数バックオフでリトライする
+  （リクエスト処理中は SHEETS_RETRY_DEADLINE 秒、background_retries() の中では
+  SHEETS_BACKGROUND_RETRY_DEADLINE 秒を超えるリトライはしない）
+- auth はアクセストークンだけを取り直してリトライする（クライアントやワークシートは作り直さない）
+- 使用量を quota_usage() で返す
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import Counter, deque
+
+import requests
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+logger = logging.getLogger(__name__)
+
+# 1分あたりのリクエスト数上限（Sheets APIのユーザーごとの既定値は読み取り・書き込みとも60）
+READ_QUOTA_PER_MIN = int(os.environ.get("SHEETS_READ_QUOTA_PER_MIN", "60"))
+WRITE_QUOTA_PER_MIN = int(os.environ.get("SHEETS_WRITE_QUOTA_PER_MIN", "60"))
+MAX_RETRIES = int(os.environ.get("SHEETS_MAX_RETRIES", "5"))
+BACKOFF_BASE = 1.0   # 秒
+BACKOFF_MAX = 32.0   # 秒
+# 1回の呼び出しでリトライに使ってよい合計秒数。リクエスト処理中はVercelの関数タイムアウトより短くする
+REQUEST_RETRY_DEADLINE = float(os.environ.get("SHEETS_RETRY_DEADLINE", "20"))
+BACKGROUND_RETRY_DEADLINE = float(os.environ.get("SHEETS_BACKGROUND_RETRY_DEADLINE", "300"))
+
+# background_retries() の中だけ BACKGROUND_RETRY_DEADLINE を使う（スレッドごとに独立）
+_background = contextvars.ContextVar("sheets_background_retries", default=False)
+
+TRANSIENT_STATUS = {408, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """1分あたり per_minute 回まで通すトークンバケット（スレッドセーフ）"""
+
+    def __init__(self, name: str, per_minute: int):
+        self.name = name
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._recent: deque = deque()  # 直近1分の取得時刻
+        self.acquired = 0
+        self.waited = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, deadline: float | None = None) -> float:
+        """トークンを1つ取る。足りなければ補充されるまで待ち、待った秒数を返す
+
+        deadline（time.monotonic() の時刻）までに取れない見込みなら待たずに TimeoutError を送出する。
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.acquired += 1
+                    self.waited += waited
+                    self._recent.append(now)
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                logger.warning("Sheets APIクォータ待ち (%s): リトライ期限を超えるため中止します", self.name)
+                raise TimeoutError(f"Sheets APIクォータ待ちがリトライ期限を超えます ({self.name})")
+            if waited == 0.0:
+                logger.info("Sheets APIクォータ待ち (%s): %.2f秒", self.name, wait)
+            time.sleep(wait)
+            waited += wait
+
+    def usage(self) -> dict:
+        """直近1分の使用数・上限・残りトークン・累計待ち時間を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+            return {
+                "used_last_minute": len(self._recent),
+                "limit_per_minute": int(self.capacity),
+                "available": int(self._tokens),
+                "total": self.acquired,
+                "waited_ms": round(self.waited * 1000),
+            }
+
+
+_buckets = {
+    "read": TokenBucket("read", READ_QUOTA_PER_MIN),
+    "write": TokenBucket("write", WRITE_QUOTA_PER_MIN),
+}
+_stats_lock = threading.Lock()
+_errors: Counter = Counter()   # エラー分類 → 件数
+_retries: Counter = Counter()  # エラー分類 → リトライ回数
+
+
+def classify_error(error: Exception) -> str:
+    """例外を quota / auth / transient / fatal に分類する"""
+    if isinstance(error, APIError):
+        if error.code == 429:
+            return "quota"
+        if error.code == 401:
+            return "auth"
+        if error.code in TRANSIENT_STATUS:
+            return "transient"
+        return "fatal"
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return "transient"
+    return "fatal"
+
+
+def backoff_delay(attempt: int) -> float:
+    """attempt 回目（0始まり）のリトライ前に待つ秒数（指数バックオフ＋ジッター）"""
+    ceiling = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+@contextmanager
+def background_retries():
+    """バックグラウンド処理（レプリカ同期・遅延バッファ書き込み）用の長いリトライ期限を使う"""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+def retry_deadline() -> float:
+    """現在の処理でリトライに使ってよい合計秒数"""
+    return BACKGROUND_RETRY_DEADLINE if _background.get() else REQUEST_RETRY_DEADLINE
+
+
+class QuotaHTTPClient(HTTPClient):
+    """クォータ計量・エラー分類・リトライ付きの gspread HTTPClient"""
+
+    def request(self, method: str, endpoint: str, *args, **kwargs):
+        bucket = _buckets["read" if method.lower() == "get" else "write"]
+        auth_refreshed = False
+        attempt = 0
+        deadline = time.monotonic() + retry_deadline()
+        while True:
+            bucket.acquire(deadline)
+            try:
+                return super().request(method, endpoint, *args, **kwargs)
+            except Exception as e:
+                kind = classify_error(e)
+                with _stats_lock:
+                    _errors[kind] += 1
+                if kind == "auth" and not auth_refreshed:
+                    # 壊れているのはアクセストークンだけなので取り直して1回だけやり直す
+                    logger.warning("Sheets API認証エラー。トークンを再取得します: %s", e)
+                    self.login()
+                    auth_refreshed = True
+                elif kind in ("quota", "transient") and attempt < MAX_RETRIES:
+                    delay = backoff_delay(attempt)
+                    if time.monotonic() + delay > deadline:
+                        logger.warning("Sheets APIエラー（%s）: リトライ期限を超えるため中止します: %s", kind, e)
+                        raise
+                    logger.warning(
+                        "Sheets APIエラー（%s、試行 %d/%d）: %s. %.1f秒後にリトライ...",
+                        kind, attempt + 1, MAX_RETRIES + 1, e, delay,
+                    )
+                    time.sleep(delay)
+                    attempt += 1
+                else:
+                    raise
+                with _stats_lock:
+                    _retries[kind] += 1
+
+
+def quota_usage() -> dict:
+    """読み取り・書き込みのクォータ使用状況とエラー・リトライ件数を返す"""
+    with _stats_lock:
+        errors = dict(_errors)
+        retries = dict(_retries)
+    return {
+        "read": _buckets["read"].usage(),
+        "write": _buckets["write"].usage(),
+        "errors": errors,
+        "retries": retries,
+    }
@@ -3,8 +3,10 @@
 石同士の相乗効果を定義する。
 単石の意味を超えた、組み合わせ固有の意味・補正値を持つ。
 キーはstone_idのfrozenset（順序不問）。
+マッチング用に stone_id → {相手stone_id → 効果} の隣接インデックスも提供する。
 """
 
+import threading
 from typing import TypedDict
 
 
@@ -139,13 +141,13 @@ _cache = SheetCache("stone_combinations")
 
 
 def get_combination_master_data() -> dict:
-    """シート優先で組み合わせマスターを返す（失敗時はハードコードにフォールバック）"""
+    """ストレージ（既定はシート）優先で組み合わせマスターを返す（失敗時はハードコードにフォールバック）"""
     cached = _cache.get()
     if cached is not None:
         return cached
     try:
-        from api.utils_sheet import get_combination_master_from_sheet
-        data = get_combination_master_from_sheet()
+        from api.storage import get_storage
+        data = get_storage().get_combination_master()
         if data:
             _cache.set(data)
             return data
@@ -159,7 +161,42 @@ def invalidate_combination_master_cache() -> None:
     _cache.invalidate()
 
 
+# ===== 隣接インデックス =====
+# 組み合わせマスターのdict本体ごとに1回だけ構築する
+
+_adjacency: dict = {"source": None, "index": {}}
+_adjacency_lock = threading.Lock()
+
+
+def build_combination_adjacency(combo_master: dict) -> dict[str, dict[str, CombinationEffect]]:
+    """組み合わせマスターから stone_id → {相手stone_id → 効果} の隣接インデックスを作る"""
+    adjacency: dict[str, dict[str, CombinationEffect]] = {}
+    for key, effect in combo_master.items():
+        ids = sorted(key)
+        stone_a, stone_b = ids[0], ids[-1]  # 同じ石同士の組み合わせはキーが1要素
+        adjacency.setdefault(stone_a, {})[stone_b] = effect
+        adjacency.setdefault(stone_b, {})[stone_a] = effect
+    return adjacency
+
+
+def get_combination_adjacency(combo_master: dict | None = None) -> dict[str, dict[str, CombinationEffect]]:
+    """組み合わせマスター（省略時は現在のマスター）に対応する隣接インデックスを返す"""
+    if combo_master is None:
+        combo_master = get_combination_master_data()
+    if _adjacency["source"] is combo_master:
+        return _adjacency["index"]
+    with _adjacency_lock:
+        if _adjacency["source"] is not combo_master:
+            _adjacency["index"] = build_combination_adjacency(combo_master)
+            _adjacency["source"] = combo_master
+        return _adjacency["index"]
+
+
+def get_combination_partners(stone_id: str) -> dict[str, CombinationEffect]:
+    """石IDと組み合わせ効果を持つ相手石の一覧を返す"""
+    return get_combination_adjacency().get(stone_id, {})
+
+
 def get_combination_effect(stone_id_a: str, stone_id_b: str) -> CombinationEffect | None:
     """2つの石IDの組み合わせ効果を取得する。なければNoneを返す。"""
-    key = frozenset({stone_id_a, stone_id_b})
-    return get_combination_master_data().get(key)
+    return get_combination_partners(stone_id_a).get(stone_id_b)
@@ -299,13 +299,13 @@ _cache = SheetCache("stone_master")
 
 
 def get_stone_master_data() -> dict:
-    """シート優先でマスターデータを返す（失敗時はハードコードにフォールバック）"""
+    """ストレージ（既定はシート）優先でマスターデータを返す（失敗時はハードコードにフォールバック）"""
     cached = _cache.get()
     if cached is not None:
         return cached
     try:
-        from api.utils_sheet import get_stone_master_from_sheet
-        data = get_stone_master_from_sheet()
+        from api.storage import get_storage
+        data = get_storage().get_stone_master()
         if data:
             _cache.set(data)
             return data
@@ -0,0 +1,669 @@
+"""ストレージバックエンド
+
+プロフィール・診断ログ・注文・ブレスレット選択記録・config・3つのマスターの読み書きを
+StorageBackend の共通インターフェースにまとめ、STORAGE_BACKEND で実装を切り替える。
+
+- sheets（既定）: 従来どおりGoogle Sheets（api/utils_sheet.py）
+- sqlite: SQLiteファイル（STORAGE_SQLITE_PATH が必須）
+- memory: プロセス内のdict（負荷試験・ローカル開発用。再起動で消える）
+
+sqlite / memory の行はシートと同じヘッダー・値の形式（文字列、真偽値は TRUE/FALSE）で持ち、
+行の組み立てとマスターの変換は api/utils_sheet.py の関数を共用する。
+マスターが空のときは各マスターモジュールのハードコード値が使われる。
+
+sqlite は1台のサーバーで永続ディスクを持つ構成向け。Vercel などのサーバーレス環境では
+/tmp がインスタンスごとで再起動やスケールアウトのたびに消えるため使えない。
+既定パスは持たず、STORAGE_SQLITE_PATH に永続ボリューム上のパスを明示する。
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+from gspread.utils import numericise_all
+
+from api import utils_sheet
+from api.utils_sheet import (
+    EXPECTED_HEADERS,
+    LOG_SHEET_NAME,
+    ORDER_SHEET_NAME,
+    PROFILE_SHEET_NAME,
+    CONFIG_SHEET_NAME,
+    STONE_MASTER_SHEET_NAME,
+    STONE_COMBO_SHEET_NAME,
+    PRODUCT_MASTER_SHEET_NAME,
+    BRACELET_SELECTION_SHEET_NAME,
+)
+from api.sheet_replica import quote_identifier, sheet_value
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sheets")
+STORAGE_SQLITE_PATH = os.environ.get("STORAGE_SQLITE_PATH", "")
+
+
+class StorageBackend(ABC):
+    """ストレージの共通インターフェース（未実装のメソッドがあるとインスタンス化できない）"""
+
+    name = ""
+
+    # ----- 診断ログ -----
+    @abstractmethod
+    def add_diagnosis(self, data: dict) -> None:
+        ...
+
+    @abstractmethod
+    def update_diagnosis(self, diagnosis_id: str, stones: str, product_slug: str) -> None:
+        ...
+
+    @abstractmethod
+    def mark_purchased(self, diagnosis_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def get_diagnosis(self, diagnosis_id: str) -> dict | None:
+        ...
+
+    # ----- 注文・ブレスレット選択記録 -----
+    @abstractmethod
+    def add_order(self, data: dict) -> None:
+        ...
+
+    @abstractmethod
+    def add_bracelet_selection(self, data: dict) -> None:
+        ...
+
+    # ----- プロフィール -----
+    @abstractmethod
+    def upsert_profile(self, profile: dict) -> dict | None:
+        """追加または更新し、書き込んだプロフィール（get_profile と同じ形式）を返す"""
+        ...
+
+    @abstractmethod
+    def get_profile(self, user_id: str) -> dict | None:
+        ...
+
+    # ----- config -----
+    @abstractmethod
+    def get_config(self) -> dict:
+        ...
+
+    @abstractmethod
+    def set_config(self, key: str, value: str, note: str = "") -> None:
+        ...
+
+    # ----- マスター（データなし・エラーはNone） -----
+    @abstractmethod
+    def get_stone_master(self) -> dict | None:
+        ...
+
+    @abstractmethod
+    def get_combination_master(self) -> dict | None:
+        ...
+
+    @abstractmethod
+    def get_product_master(self) -> dict | None:
+        ...
+
+    @abstractmethod
+    def write_stone_master(self, stone_master: dict) -> None:
+        ...
+
+    @abstractmethod
+    def write_combination_master(self, combo_master: dict) -> None:
+        ...
+
+    @abstractmethod
+    def write_product_master(self, product_master: dict) -> None:
+        ...
+
+    # ----- マスターの1件操作（管理画面） -----
+    @abstractmethod
+    def upsert_stone(self, stone_id: str, stone_data: dict) -> None:
+        ...
+
+    @abstractmethod
+    def delete_stone(self, stone_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def upsert_combination(self, stone_id_a: str, stone_id_b: str, effect: dict) -> None:
+        ...
+
+    @abstractmethod
+    def delete_combination(self, stone_id_a: str, stone_id_b: str) -> bool:
+        ...
+
+    @abstractmethod
+    def generate_external_product_id(self) -> str:
+        ...
+
+    @abstractmethod
+    def upsert_product(self, product_id: str, product_data: dict) -> None:
+        ...
+
+    @abstractmethod
+    def delete_product(self, product_id: str) -> bool:
+        """Xプレフィックスの外部商品だけ削除できる"""
+        ...
+
+    def warm_caches(self) -> bool:
+        """コールドスタート時の一括読み込み（必要なバックエンドだけ実装）"""
+        return False
+
+    def needs_warm_up(self) -> bool:
+        """warm_caches で読み込むものがあればTrue"""
+        return False
+
+
+class SheetsStorage(StorageBackend):
+    """Google Sheets（api/utils_sheet.py の関数をそのまま呼ぶ）"""
+
+    name = "sheets"
+
+    def add_diagnosis(self, data):
+        utils_sheet.add_diagnosis(data)
+
+    def update_diagnosis(self, diagnosis_id, stones, product_slug):
+        utils_sheet.update_diagnosis(diagnosis_id, stones, product_slug)
+
+    def mark_purchased(self, diagnosis_id):
+        utils_sheet.mark_purchased(diagnosis_id)
+
+    def get_diagnosis(self, diagnosis_id):
+        return utils_sheet.get_diagnosis(diagnosis_id)
+
+    def add_order(self, data):
+        utils_sheet.add_order(data)
+
+    def add_bracelet_selection(self, data):
+        utils_sheet.add_bracelet_selection(data)
+
+    def upsert_profile(self, profile):
+        return utils_sheet.upsert_profile(profile)
+
+    def get_profile(self, user_id):
+        return utils_sheet.get_profile(user_id)
+
+    def get_config(self):
+        return utils_sheet.get_config()
+
+    def set_config(self, key, value, note=""):
+        utils_sheet.set_config(key, value, note)
+
+    def get_stone_master(self):
+        return utils_sheet.get_stone_master_from_sheet()
+
+    def get_combination_master(self):
+        return utils_sheet.get_combination_master_from_sheet()
+
+    def get_product_master(self):
+        return utils_sheet.get_product_master_from_sheet()
+
+    def write_stone_master(self, stone_master):
+        utils_sheet.write_stone_master_to_sheet(stone_master)
+
+    def write_combination_master(self, combo_master):
+        utils_sheet.write_combination_master_to_sheet(combo_master)
+
+    def write_product_master(self, product_master):
+        utils_sheet.write_product_master_to_sheet(product_master)
+
+    def upsert_stone(self, stone_id, stone_data):
+        utils_sheet.upsert_stone(stone_id, stone_data)
+
+    def delete_stone(self, stone_id):
+        return utils_sheet.delete_stone(stone_id)
+
+    def upsert_combination(self, stone_id_a, stone_id_b, effect):
+        utils_sheet.upsert_combination(stone_id_a, stone_id_b, effect)
+
+    def delete_combination(self, stone_id_a, stone_id_b):
+        return utils_sheet.delete_combination(stone_id_a, stone_id_b)
+
+    def generate_external_product_id(self):
+        return utils_sheet.generate_external_product_id()
+
+    def upsert_product(self, product_id, product_data):
+        utils_sheet.upsert_product(product_id, product_data)
+
+    def delete_product(self, product_id):
+        return utils_sheet.delete_product(product_id)
+
+    def warm_caches(self):
+        return utils_sheet.warm_master_caches()
+
+    def needs_warm_up(self):
+        return utils_sheet.needs_warm_up()
+
+
+class _RowStorage(StorageBackend):
+    """シートと同じ行形式で持つバックエンドの共通実装
+
+    サブクラスは1列目をキーとする行の追加・検索・更新・削除・全件取得・全置換を実装する。
+    """
+
+    @abstractmethod
+    def _append(self, table: str, row: list) -> None:
+        ...
+
+    @abstractmethod
+    def _find(self, table: str, key: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def _update(self, table: str, key: str, fields: dict) -> bool:
+        ...
+
+    @abstractmethod
+    def _records(self, table: str) -> list[dict]:
+        ...
+
+    @abstractmethod
+    def _replace_all(self, table: str, rows: list[list]) -> None:
+        ...
+
+    @abstractmethod
+    def _delete(self, table: str, key: str) -> bool:
+        ...
+
+    def _cells(self, table: str, row: list) -> list[str]:
+        """行をヘッダー幅の文字列リストにする"""
+        width = len(EXPECTED_HEADERS[table])
+        cells = [sheet_value(v) for v in row[:width]]
+        return cells + [""] * (width - len(cells))
+
+    def _numeric_records(self, table: str) -> list[dict]:
+        """get_all_records と同じく数値らしい値を数値にしたレコード"""
+        return [dict(zip(r.keys(), numericise_all(list(r.values())))) for r in self._records(table)]
+
+    def add_diagnosis(self, data):
+        self._append(LOG_SHEET_NAME, utils_sheet.diagnosis_row(data))
+
+    def update_diagnosis(self, diagnosis_id, stones, product_slug):
+        fields = {"stones": stones}
+        if product_slug:
+            fields["product_slug"] = product_slug
+        if not self._update(LOG_SHEET_NAME, diagnosis_id, fields):
+            logger.warning(f"更新対象の診断が見つかりません: {diagnosis_id}")
+
+    def mark_purchased(self, diagnosis_id):
+        if not self._update(LOG_SHEET_NAME, diagnosis_id, {"purchased": True}):
+            logger.warning(f"購入マーク対象の診断が見つかりません: {diagnosis_id}")
+
+    def get_diagnosis(self, diagnosis_id):
+        return self._find(LOG_SHEET_NAME, diagnosis_id) if diagnosis_id else None
+
+    def add_order(self, data):
+        self._append(ORDER_SHEET_NAME, utils_sheet.order_row(data))
+
+    def add_bracelet_selection(self, data):
+        self._append(BRACELET_SELECTION_SHEET_NAME, utils_sheet.selection_row(data))
+
+    def upsert_profile(self, profile):
+        user_id = profile.get("user_id")
+        if not user_id:
+            logger.warning("upsert_profile: user_idが未指定です")
+            return None
+        row = self._cells(PROFILE_SHEET_NAME, utils_sheet.profile_row(profile))
+        record = dict(zip(EXPECTED_HEADERS[PROFILE_SHEET_NAME], row))
+        if not self._update(PROFILE_SHEET_NAME, user_id, record):
+            self._append(PROFILE_SHEET_NAME, row)
+        return utils_sheet.profile_from_record(record)
+
+    def get_profile(self, user_id):
+        record = self._find(PROFILE_SHEET_NAME, user_id) if user_id else None
+        return utils_sheet.profile_from_record(record) if record else None
+
+    def get_config(self):
+        return utils_sheet.parse_config(self._numeric_records(CONFIG_SHEET_NAME))
+
+    def set_config(self, key, value, note=""):
+        now = datetime.now(timezone.utc).isoformat()
+        if not self._update(CONFIG_SHEET_NAME, key, {"value": str(value), "updated_at": now, "note": note}):
+            self._append(CONFIG_SHEET_NAME, [key, str(value), now, note])
+
+    def get_stone_master(self):
+        return utils_sheet.parse_stone_master(self._numeric_records(STONE_MASTER_SHEET_NAME))
+
+    def get_combination_master(self):
+        return utils_sheet.parse_combination_master(self._numeric_records(STONE_COMBO_SHEET_NAME))
+
+    def get_product_master(self):
+        return utils_sheet.parse_product_master(self._numeric_records(PRODUCT_MASTER_SHEET_NAME))
+
+    def write_stone_master(self, stone_master):
+        self._replace_all(STONE_MASTER_SHEET_NAME, utils_sheet.stone_master_rows(stone_master)[1:])
+
+    def write_combination_master(self, combo_master):
+        self._replace_all(STONE_COMBO_SHEET_NAME, utils_sheet.combination_master_rows(combo_master)[1:])
+
+    def write_product_master(self, product_master):
+        self._replace_all(PRODUCT_MASTER_SHEET_NAME, utils_sheet.product_master_rows(product_master)[1:])
+
+    def _upsert(self, table: str, row: list) -> None:
+        cells = self._cells(table, row)
+        if not self._update(table, cells[0], dict(zip(EXPECTED_HEADERS[table], cells))):
+            self._append(table, cells)
+
+    def upsert_stone(self, stone_id, stone_data):
+        self._upsert(STONE_MASTER_SHEET_NAME, utils_sheet.stone_master_rows({stone_id: stone_data})[1])
+        from api.stone_master import invalidate_stone_master_cache
+        invalidate_stone_master_cache()
+
+    def delete_stone(self, stone_id):
+        if not self._delete(STONE_MASTER_SHEET_NAME, stone_id):
+            return False
+        from api.stone_master import invalidate_stone_master_cache
+        invalidate_stone_master_cache()
+        return True
+
+    def _combination_rows(self, stone_id_a: str, stone_id_b: str) -> tuple[list[list], bool]:
+        """組み合わせ (a, b) 以外の行と、(a, b) があったかを返す"""
+        pair = frozenset({stone_id_a, stone_id_b})
+        rows, found = [], False
+        for r in self._records(STONE_COMBO_SHEET_NAME):
+            if not found and frozenset({r["stone_id_a"], r["stone_id_b"]}) == pair:
+                found = True
+                continue
+            rows.append(list(r.values()))
+        return rows, found
+
+    def upsert_combination(self, stone_id_a, stone_id_b, effect):
+        key = tuple(sorted([stone_id_a, stone_id_b]))
+        rows, _ = self._combination_rows(stone_id_a, stone_id_b)
+        rows.append(utils_sheet.combination_master_rows({key: effect})[1])
+        self._replace_all(STONE_COMBO_SHEET_NAME, rows)
+        from api.stone_combination_master import invalidate_combination_master_cache
+        invalidate_combination_master_cache()
+
+    def delete_combination(self, stone_id_a, stone_id_b):
+        rows, found = self._combination_rows(stone_id_a, stone_id_b)
+        if not found:
+            return False
+        self._replace_all(STONE_COMBO_SHEET_NAME, rows)
+        from api.stone_combination_master import invalidate_combination_master_cache
+        invalidate_combination_master_cache()
+        return True
+
+    def generate_external_product_id(self):
+        ids = [r["product_id"] for r in self._records(PRODUCT_MASTER_SHEET_NAME)]
+        return utils_sheet.next_external_product_id(ids)
+
+    def upsert_product(self, product_id, product_data):
+        self._upsert(PRODUCT_MASTER_SHEET_NAME, utils_sheet.product_master_rows({product_id: product_data})[1])
+        from api.product_master import invalidate_product_master_cache
+        invalidate_product_master_cache()
+
+    def delete_product(self, product_id):
+        if not str(product_id).startswith("X") or not self._delete(PRODUCT_MASTER_SHEET_NAME, product_id):
+            return False
+        from api.product_master import invalidate_product_master_cache
+        invalidate_product_master_cache()
+        return True
+
+
+class MemoryStorage(_RowStorage):
+    """プロセス内のdictに持つバックエンド（キー → 行位置 のインデックス付き）"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows: dict[str, list[dict]] = {name: [] for name in EXPECTED_HEADERS}
+        self._index: dict[str, dict[str, int]] = {name: {} for name in EXPECTED_HEADERS}
+
+    def _append(self, table, row):
+        record = dict(zip(EXPECTED_HEADERS[table], self._cells(table, row)))
+        with self._lock:
+            rows = self._rows[table]
+            key = next(iter(record.values()))
+            if key and key not in self._index[table]:
+                self._index[table][key] = len(rows)
+            rows.append(record)
+
+    def _find(self, table, key):
+        with self._lock:
+            pos = self._index[table].get(key)
+            return dict(self._rows[table][pos]) if pos is not None else None
+
+    def _update(self, table, key, fields):
+        headers = EXPECTED_HEADERS[table]
+        with self._lock:
+            pos = self._index[table].get(key)
+            if pos is None:
+                return False
+            record = self._rows[table][pos]
+            record.update({k: sheet_value(v) for k, v in fields.items() if k in headers})
+            return True
+
+    def _delete(self, table, key):
+        with self._lock:
+            pos = self._index[table].get(key)
+            if pos is None:
+                return False
+            del self._rows[table][pos]
+            # 後ろの行の位置がずれるので作り直す（同じキーは先頭の行を指す）
+            index: dict[str, int] = {}
+            for i, record in enumerate(self._rows[table]):
+                k = next(iter(record.values()))
+                if k and k not in index:
+                    index[k] = i
+            self._index[table] = index
+            return True
+
+    def _records(self, table):
+        with self._lock:
+            return [dict(r) for r in self._rows[table]]
+
+    def _replace_all(self, table, rows):
+        with self._lock:
+            self._rows[table] = []
+            self._index[table] = {}
+        for row in rows:
+            self._append(table, row)
+
+
+class SQLiteStorage(_RowStorage):
+    """SQLiteファイルに持つバックエンド（各テーブルの1列目にインデックス）"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str | None = None):
+        path = path or STORAGE_SQLITE_PATH
+        if not path:
+            # /tmp の既定パスに黙って書くとインスタンスが入れ替わったときにデータが消える
+            raise RuntimeError("STORAGE_BACKEND=sqlite には STORAGE_SQLITE_PATH（永続ディスク上のパス）が必要です")
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._lock:
+            for table, headers in EXPECTED_HEADERS.items():
+                columns = ", ".join(f"{quote_identifier(h)} TEXT NOT NULL DEFAULT ''" for h in headers)
+                self._conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {quote_identifier(table)} (_row INTEGER PRIMARY KEY, {columns})"
+                )
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {quote_identifier(f'idx_{table}_key')} "
+                    f"ON {quote_identifier(table)} ({quote_identifier(headers[0])})"
+                )
+
+    def _append(self, table, row):
+        headers = EXPECTED_HEADERS[table]
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO {quote_identifier(table)} ({', '.join(quote_identifier(h) for h in headers)}) "
+                f"VALUES ({', '.join('?' for _ in headers)})",
+                self._cells(table, row),
+            )
+
+    def _find(self, table, key):
+        headers = EXPECTED_HEADERS[table]
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(quote_identifier(h) for h in headers)} FROM {quote_identifier(table)} "
+                f"WHERE {quote_identifier(headers[0])} = ? ORDER BY _row LIMIT 1",
+                (key,),
+            ).fetchone()
+        return dict(zip(headers, row)) if row else None
+
+    def _update(self, table, key, fields):
+        headers = EXPECTED_HEADERS[table]
+        fields = {k: sheet_value(v) for k, v in fields.items() if k in headers}
+        if not fields:
+            return self._find(table, key) is not None
+        assignments = ", ".join(f"{quote_identifier(k)} = ?" for k in fields)
+        with self._lock:
+            cur = self._conn.execute(
+                f"UPDATE {quote_identifier(table)} SET {assignments} WHERE _row = ("
+                f"SELECT _row FROM {quote_identifier(table)} WHERE {quote_identifier(headers[0])} = ? ORDER BY _row LIMIT 1)",
+                list(fields.values()) + [key],
+            )
+        return cur.rowcount > 0
+
+    def _delete(self, table, key):
+        headers = EXPECTED_HEADERS[table]
+        with self._lock:
+            cur = self._conn.execute(
+                f"DELETE FROM {quote_identifier(table)} WHERE _row = ("
+                f"SELECT _row FROM {quote_identifier(table)} WHERE {quote_identifier(headers[0])} = ? "
+                f"ORDER BY _row LIMIT 1)",
+                (key,),
+            )
+        return cur.rowcount > 0
+
+    def _records(self, table):
+        headers = EXPECTED_HEADERS[table]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(quote_identifier(h) for h in headers)} FROM {quote_identifier(table)} ORDER BY _row"
+            ).fetchall()
+        return [dict(zip(headers, r)) for r in rows]
+
+    def _replace_all(self, table, rows):
+        headers = EXPECTED_HEADERS[table]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(f"DELETE FROM {quote_identifier(table)}")
+                self._conn.executemany(
+                    f"INSERT INTO {quote_identifier(table)} ({', '.join(quote_identifier(h) for h in headers)}) "
+                    f"VALUES ({', '.join('?' for _ in headers)})",
+                    [self._cells(table, r) for r in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+_BACKENDS = {
+    "sheets": SheetsStorage,
+    "sqlite": SQLiteStorage,
+    "memory": MemoryStorage,
+}
+
+_storage: dict = {"backend": None}
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    """STORAGE_BACKEND で選んだバックエンドを返す（未知の値はsheets）"""
+    if _storage["backend"] is None:
+        with _storage_lock:
+            if _storage["backend"] is None:
+                cls = _BACKENDS.get(STORAGE_BACKEND)
+                if cls is None:
+                    logger.warning("不明な STORAGE_BACKEND です（sheetsを使います）: %s", STORAGE_BACKEND)
+                    cls = SheetsStorage
+                _storage["backend"] = cls()
+                logger.info("ストレージバックエンド: %s", _storage["backend"].name)
+    return _storage["backend"]
+
+
+def set_storage(backend: StorageBackend | None) -> None:
+    """バックエンドを差し替える（Noneで STORAGE_BACKEND から選び直す）。テスト・負荷試験用"""
+    with _storage_lock:
+        _storage["backend"] = backend
+
+
+# ===== 呼び出し側向けの関数（api/utils_sheet.py と同じ名前） =====
+
+def add_diagnosis(data: dict) -> None:
+    get_storage().add_diagnosis(data)
+
+
+def update_diagnosis(diagnosis_id: str, stones: str, product_slug: str) -> None:
+    get_storage().update_diagnosis(diagnosis_id, stones, product_slug)
+
+
+def mark_purchased(diagnosis_id: str) -> None:
+    get_storage().mark_purchased(diagnosis_id)
+
+
+def get_diagnosis(diagnosis_id: str) -> dict | None:
+    return get_storage().get_diagnosis(diagnosis_id)
+
+
+def add_order(data: dict) -> None:
+    get_storage().add_order(data)
+
+
+def add_bracelet_selection(data: dict) -> None:
+    get_storage().add_bracelet_selection(data)
+
+
+def upsert_profile(profile: dict) -> dict | None:
+    return get_storage().upsert_profile(profile)
+
+
+def get_profile(user_id: str) -> dict | None:
+    return get_storage().get_profile(user_id)
+
+
+def get_config() -> dict:
+    return get_storage().get_config()
+
+
+def set_config(key: str, value: str, note: str = "") -> None:
+    get_storage().set_config(key, value, note)
+
+
+def upsert_stone(stone_id: str, stone_data: dict) -> None:
+    get_storage().upsert_stone(stone_id, stone_data)
+
+
+def delete_stone(stone_id: str) -> bool:
+    return get_storage().delete_stone(stone_id)
+
+
+def upsert_combination(stone_id_a: str, stone_id_b: str, effect: dict) -> None:
+    get_storage().upsert_combination(stone_id_a, stone_id_b, effect)
+
+
+def delete_combination(stone_id_a: str, stone_id_b: str) -> bool:
+    return get_storage().delete_combination(stone_id_a, stone_id_b)
+
+
+def generate_external_product_id() -> str:
+    return get_storage().generate_external_product_id()
+
+
+def upsert_product(product_id: str, product_data: dict) -> None:
+    get_storage().upsert_product(product_id, product_data)
+
+
+def delete_product(product_id: str) -> bool:
+    return get_storage().delete_product(product_id)
+
+
+def warm_caches() -> bool:
+    return get_storage().warm_caches()
+
+
+def needs_warm_up() -> bool:
+    return get_storage().needs_warm_up()
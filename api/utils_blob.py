@@ -0,0 +1,200 @@
+"""診断テキストのブロブストア
+
+診断ログの長文列（運命の地図・過去・現在と未来・エレメント詳細）を
+1つの gzip 圧縮JSONドキュメントにまとめ、内容の SHA-256 をキーに保存する。
+シートには "blob:<sha256>" というポインタだけを残す。
+
+保存先は utils_image.py と同じ3層:
+  1. インメモリ（LRU）
+  2. /tmp ファイル
+  3. Google Cloud Storage（恒久保存。GCS_BUCKET_NAMEが必須。公開はしない）
+
+内容アドレスなので同じキーの中身は変わらず、キャッシュに有効期限はない。
+GCS に保存できたときだけシートの長文をポインタに置き換える（/tmp だけでは他のインスタンスから読めない）。
+
+環境変数:
+    DIAGNOSIS_TEXT_OFFLOAD : "1" のとき add_diagnosis で長文をブロブストアに逃がす（GCS_BUCKET_NAME も必要）
+"""
+
+import os
+import json
+import gzip
+import hashlib
+import logging
+
+from api.cache import LRUCache
+from api import utils_image
+
+logger = logging.getLogger(__name__)
+
+DIAGNOSIS_TEXT_OFFLOAD = os.environ.get("DIAGNOSIS_TEXT_OFFLOAD", "") == "1"
+
+# ブロブに逃がす列（ポインタは先頭の horoscope_full 列に入れる）
+TEXT_FIELDS = ("horoscope_full", "past", "present_future", "element_detail")
+TEXT_REF_PREFIX = "blob:"
+
+_documents = LRUCache("diagnosis_text", max_size=256)
+
+_BLOB_DIR = os.path.join(os.environ.get("TMPDIR", "/tmp"), "atlas_text_blobs")
+try:
+    os.makedirs(_BLOB_DIR, exist_ok=True)
+except Exception:
+    _BLOB_DIR = ""
+
+
+def _encode(doc: dict) -> tuple[str, bytes]:
+    """ドキュメントを (sha256, gzip圧縮JSON) にする（同じ内容なら同じキー）"""
+    raw = json.dumps(doc, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode()
+    # mtime を固定して圧縮結果も決定的にする
+    return hashlib.sha256(raw).hexdigest(), gzip.compress(raw, mtime=0)
+
+
+def _gcs_blob_name(digest: str) -> str:
+    return f"atlas_text/{digest}.json.gz"
+
+
+def _file_path(digest: str) -> str:
+    return os.path.join(_BLOB_DIR, f"{digest}.json.gz")
+
+
+def _write_file(digest: str, data: bytes) -> bool:
+    if not _BLOB_DIR:
+        return False
+    try:
+        path = _file_path(digest)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return True
+    except Exception as e:
+        logger.debug("ブロブファイル保存エラー: %s", e)
+        return False
+
+
+def _read_file(digest: str) -> bytes | None:
+    if not _BLOB_DIR:
+        return None
+    try:
+        with open(_file_path(digest), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.debug("ブロブファイル読み込みエラー: %s", e)
+        return None
+
+
+def _upload_to_gcs(digest: str, data: bytes) -> bool:
+    client = utils_image._get_gcs_client()
+    if not client:
+        return False
+    try:
+        blob = client.bucket(utils_image.GCS_BUCKET_NAME).blob(_gcs_blob_name(digest))
+        if not blob.exists():
+            blob.upload_from_string(data, content_type="application/gzip")
+        return True
+    except Exception as e:
+        logger.warning("ブロブGCSアップロードエラー: %s", e)
+        return False
+
+
+def _download_from_gcs(digest: str) -> bytes | None:
+    client = utils_image._get_gcs_client()
+    if not client:
+        return None
+    try:
+        blob = client.bucket(utils_image.GCS_BUCKET_NAME).blob(_gcs_blob_name(digest))
+        return blob.download_as_bytes()
+    except Exception as e:
+        logger.warning("ブロブGCS取得エラー (%s): %s", digest, e)
+        return None
+
+
+def put_document(doc: dict) -> str | None:
+    """ドキュメントを保存して sha256 を返す。GCS に保存できなければ None
+
+    /tmp はコンテナごとで再起動すると消えるため恒久保存とはみなさず、
+    GCS_BUCKET_NAME が未設定またはアップロードに失敗したら None を返す（長文はシートに残る）。
+    /tmp には同じコンテナでの再読み込み用に書くだけ。
+    """
+    if not utils_image.GCS_BUCKET_NAME:
+        return None
+    digest, data = _encode(doc)
+    if not _upload_to_gcs(digest, data):
+        return None
+    _write_file(digest, data)
+    _documents.set(digest, doc)
+    return digest
+
+
+def get_document(digest: str) -> dict | None:
+    """sha256 からドキュメントを返す（メモリ → /tmp → GCS の順に探す）"""
+    doc = _documents.get(digest)
+    if doc is not None:
+        return doc
+
+    data = _read_file(digest)
+    from_file = data is not None
+    if data is None:
+        data = _download_from_gcs(digest)
+    if data is None:
+        return None
+
+    try:
+        raw = gzip.decompress(data)
+    except Exception as e:
+        logger.warning("ブロブ展開エラー (%s): %s", digest, e)
+        return None
+    if hashlib.sha256(raw).hexdigest() != digest:
+        logger.warning("ブロブの内容がハッシュと一致しません: %s", digest)
+        return None
+
+    doc = json.loads(raw)
+    if not from_file:
+        _write_file(digest, data)
+    _documents.set(digest, doc)
+    return doc
+
+
+def offload_text(data: dict) -> dict:
+    """診断データの長文列をブロブに逃がし、ポインタに置き換えたコピーを返す
+
+    DIAGNOSIS_TEXT_OFFLOAD が無効、または GCS に保存できなかった場合は data をそのまま返す。
+    """
+    if not DIAGNOSIS_TEXT_OFFLOAD:
+        return data
+    doc = {field: data.get(field, "") for field in TEXT_FIELDS}
+    if not any(doc.values()):
+        return data
+    digest = put_document(doc)
+    if digest is None:
+        logger.warning("診断テキストをGCSに保存できないためシートに直接書きます: %s",
+                       data.get("diagnosis_id"))
+        return data
+    offloaded = {**data, **{field: "" for field in TEXT_FIELDS}}
+    offloaded[TEXT_FIELDS[0]] = f"{TEXT_REF_PREFIX}{digest}"
+    return offloaded
+
+
+def text_ref(record: dict) -> str | None:
+    """レコードのブロブポインタ（sha256）を返す。長文がシートにあれば None"""
+    value = str(record.get(TEXT_FIELDS[0]) or "")
+    if not value.startswith(TEXT_REF_PREFIX):
+        return None
+    return value[len(TEXT_REF_PREFIX):]
+
+
+def resolve_text(record: dict) -> dict:
+    """ポインタを持つレコードの長文列をブロブから埋めたコピーを返す
+
+    ポインタがなければそのまま返す。ブロブが読めなければ長文列を空にして返す。
+    """
+    digest = text_ref(record)
+    if digest is None:
+        return record
+    doc = get_document(digest)
+    if doc is None:
+        logger.warning("診断テキストのブロブが見つかりません: %s", digest)
+        doc = {}
+    return {**record, **{field: doc.get(field, "") for field in TEXT_FIELDS}}
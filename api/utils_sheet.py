@@ -5,18 +5,29 @@ gspread ライブラリを使用してGoogle Sheets APIにアクセスする。
 
 改善点:
 - クライアントとワークシートのキャッシュ（レイテンシ改善）
-- 書き込みリトライロジック（信頼性向上）
+- クォータ計量・エラー分類・リトライ付きのHTTPクライアント（api/sheets_client.py）
 - ヘッダー行の自動作成（初回セットアップ対応）
+- ログ系シートへの追記の遅延バッファ（SHEETS_WRITE_BEHIND=1 のとき）
+- SQLite読み取りレプリカ（SHEETS_REPLICA=1 のとき。api/sheet_replica.py）
 """
 
 import os
+import re
 import json
 import time
+import atexit
 import logging
+import threading
+import uuid
 from datetime import datetime, timezone
 import gspread
+from gspread.utils import numericise, numericise_all, rowcol_to_a1
 from google.oauth2.service_account import Credentials
 
+from api import sheet_replica, utils_blob
+from api.sheets_client import QuotaHTTPClient, background_retries, classify_error
+from api.cache import LRUCache
+
 logger = logging.getLogger(__name__)
 
 # シート名定義
@@ -82,6 +93,44 @@ EXPECTED_HEADERS = {
     ],
 }
 
+# ===== 診断ログの月次パーティション =====
+# DIAGNOSIS_LOG_PARTITIONED=1 のとき、新しい診断は作成月のシート（diagnosis_logs_2026_10）に書く。
+# diagnosis_id はUUIDの形のまま（WooCommerceプラグインは ^[0-9a-f\-]{32,36}$ しか受け付けない）、
+# 先頭グループの6桁に作成月を入れ、バージョン桁を 8（RFC 9562 のカスタム形式）にする。
+# 例: 202610a3-5f1c-8d2e-9b40-0c6e1f2a7d35。従来のID（uuid4、バージョン桁は 4）は diagnosis_logs。
+# 読み書きはIDから直接シートを決め、月が変わると最初の書き込みでシートが作られる。
+DIAGNOSIS_LOG_PARTITIONED = os.environ.get("DIAGNOSIS_LOG_PARTITIONED", "") == "1"
+
+_PARTITIONED_ID = re.compile(
+    r"^(\d{4})(0[1-9]|1[0-2])[0-9a-f]{2}-[0-9a-f]{4}-8[0-9a-f]{3}-[0-9a-f]{4}-[0-9a-f]{12}$"
+)
+_PARTITION_SHEET = re.compile(rf"^{LOG_SHEET_NAME}_\d{{4}}_\d{{2}}$")
+
+
+def new_diagnosis_id(now: datetime | None = None) -> str:
+    """新しい diagnosis_id を返す（パーティション有効時は作成月入りのUUID形式）"""
+    if not DIAGNOSIS_LOG_PARTITIONED:
+        return str(uuid.uuid4())
+    now = now or datetime.now(timezone.utc)
+    rand = uuid.uuid4().hex
+    return f"{now:%Y%m}{rand[:2]}-{rand[2:6]}-8{rand[7:10]}-{rand[10:14]}-{rand[14:26]}"
+
+
+def diagnosis_partition(diagnosis_id: str) -> str:
+    """diagnosis_id の行があるシート名を返す"""
+    m = _PARTITIONED_ID.match(diagnosis_id or "")
+    if not m:
+        return LOG_SHEET_NAME
+    return f"{LOG_SHEET_NAME}_{m.group(1)}_{m.group(2)}"
+
+
+def _headers_for(sheet_name: str) -> list[str] | None:
+    """シートの期待するヘッダー行（パーティションは diagnosis_logs と同じ）"""
+    if _PARTITION_SHEET.match(sheet_name):
+        return EXPECTED_HEADERS[LOG_SHEET_NAME]
+    return EXPECTED_HEADERS.get(sheet_name)
+
+
 # ===== キャッシュ =====
 
 # キャッシュの有効期間（秒）: Vercelのコールドスタート対策
@@ -90,6 +139,9 @@ CACHE_TTL = 300  # 5分
 
 _client_cache: dict = {"client": None, "expires": 0}
 _worksheet_cache: dict = {}  # {sheet_name: {"ws": worksheet, "expires": timestamp}}
+_spreadsheet_cache: dict = {"client": None, "sh": None}
+_verified_headers: dict = {}  # {sheet_name: (sheetId, 列数)} ヘッダー確認済みのシート
+_metadata_lock = threading.Lock()
 
 
 def _get_client() -> gspread.Client:
@@ -105,7 +157,7 @@ def _get_client() -> gspread.Client:
 
     info = json.loads(creds_json)
     creds = Credentials.from_service_account_info(info, scopes=SCOPES)
-    client = gspread.authorize(creds)
+    client = gspread.authorize(creds, http_client=QuotaHTTPClient)
 
     _client_cache["client"] = client
     _client_cache["expires"] = now + CACHE_TTL
@@ -122,57 +174,128 @@ def _get_sheet_id() -> str:
     return sheet_id
 
 
+def _get_spreadsheet() -> gspread.Spreadsheet:
+    """スプレッドシートを返す（クライアントが作り直されるまで使い回す）"""
+    client = _get_client()
+    if _spreadsheet_cache["sh"] is None or _spreadsheet_cache["client"] is not client:
+        _spreadsheet_cache["sh"] = client.open_by_key(_get_sheet_id())
+        _spreadsheet_cache["client"] = client
+    return _spreadsheet_cache["sh"]
+
+
+def _prefetch_worksheets() -> dict[str, gspread.Worksheet]:
+    """1回のメタデータ取得で全ワークシートを解決してキャッシュに入れる
+
+    未確認（またはシートの作り直し・列数の変化を検出した）シートのヘッダー行も
+    まとめて1回で確認する。
+    """
+    sh = _get_spreadsheet()
+    now = time.time()
+    worksheets = {ws.title: ws for ws in sh.worksheets()}
+    for name, ws in worksheets.items():
+        _worksheet_cache[name] = {"ws": ws, "expires": now + CACHE_TTL}
+    _verify_headers(sh, [ws for name, ws in worksheets.items() if _headers_for(name)])
+    logger.info("ワークシートのメタデータを取得しました: %d枚", len(worksheets))
+    return worksheets
+
+
 def _get_worksheet(sheet_name: str) -> gspread.Worksheet:
     """指定名のワークシートを返す（キャッシュ付き）"""
-    now = time.time()
     cached = _worksheet_cache.get(sheet_name)
-
-    if cached and now < cached["expires"]:
+    if cached and time.time() < cached["expires"]:
         return cached["ws"]
 
-    client = _get_client()
-    sh = client.open_by_key(_get_sheet_id())
+    with _metadata_lock:
+        # 待っている間に他スレッドが取得していればそれを使う
+        cached = _worksheet_cache.get(sheet_name)
+        if cached and time.time() < cached["expires"]:
+            return cached["ws"]
+
+        ws = _prefetch_worksheets().get(sheet_name)
+        if ws is None:
+            # ワークシートが存在しない場合は新規作成
+            logger.info(f"ワークシート '{sheet_name}' が見つかりません。新規作成します。")
+            ws = _add_worksheet(sheet_name)
+            _ensure_headers(ws, sheet_name)
+            _worksheet_cache[sheet_name] = {"ws": ws, "expires": time.time() + CACHE_TTL}
+    return ws
+
+
+def _add_worksheet(sheet_name: str) -> gspread.Worksheet:
+    """ワークシートを作成する。他インスタンスが先に作っていた場合はそれを返す
 
+    月初のパーティションなどは複数インスタンスが同時に作ろうとし、後の方は
+    "already exists"（400、リトライされない）になるため、取り直して使う。
+    """
+    sh = _get_spreadsheet()
     try:
-        ws = sh.worksheet(sheet_name)
-    except gspread.exceptions.WorksheetNotFound:
-        # ワークシートが存在しない場合は新規作成
-        logger.info(f"ワークシート '{sheet_name}' が見つかりません。新規作成します。")
-        ws = sh.add_worksheet(title=sheet_name, rows=1000, cols=20)
+        return sh.add_worksheet(title=sheet_name, rows=1000, cols=20)
+    except gspread.exceptions.APIError as e:
+        try:
+            ws = sh.worksheet(sheet_name)
+        except gspread.exceptions.WorksheetNotFound:
+            raise e
+        logger.info("ワークシート '%s' は他のインスタンスが作成済みでした", sheet_name)
+        return ws
 
-    # ヘッダー行の確認・作成
-    _ensure_headers(ws, sheet_name)
 
-    _worksheet_cache[sheet_name] = {"ws": ws, "expires": now + CACHE_TTL}
-    return ws
+def _header_signature(ws: gspread.Worksheet) -> tuple:
+    """ヘッダー確認をやり直すべきかの判定に使う (sheetId, 列数)"""
+    return (ws.id, ws.col_count)
 
 
-def _ensure_headers(ws: gspread.Worksheet, sheet_name: str):
-    """ヘッダー行を確認し、期待する列と一致しない場合は1行目を更新する"""
-    expected = EXPECTED_HEADERS.get(sheet_name)
-    if not expected:
+def _verify_headers(sh: gspread.Spreadsheet, worksheets: list[gspread.Worksheet]) -> None:
+    """確認が必要なシートのヘッダー行を values.batchGet 1回で読み、必要なら直す"""
+    pending = [ws for ws in worksheets if _verified_headers.get(ws.title) != _header_signature(ws)]
+    if not pending:
         return
 
     try:
-        first_row = ws.row_values(1)
-        if first_row == expected:
-            return  # 一致しているので何もしない
+        ranges = ["'{}'!1:1".format(ws.title.replace("'", "''")) for ws in pending]
+        value_ranges = sh.values_batch_get(ranges).get("valueRanges", [])
+        first_rows = [(vr.get("values") or [[]])[0] for vr in value_ranges]
+    except Exception as e:
+        logger.warning("ヘッダー行の一括取得エラー（シートごとに確認します）: %s", e)
+        first_rows = [None] * len(pending)
 
-        # 空、または期待と異なる場合は1行目を上書き
-        ws.update('A1', [expected], value_input_option='USER_ENTERED')
-        logger.info("ヘッダー行を更新しました: %s (%d列)", sheet_name, len(expected))
+    for ws, first_row in zip(pending, first_rows):
+        _ensure_headers(ws, ws.title, first_row)
+
+
+def _ensure_headers(ws: gspread.Worksheet, sheet_name: str, first_row: list | None = None):
+    """ヘッダー行を確認し、期待する列と一致しない場合は1行目を更新する
+
+    確認できたシートはプロセス内で記録し、シートの作り直しや列数の変化を検出するまで再確認しない。
+    first_row を渡した場合は1行目を読み直さない。
+    """
+    expected = _headers_for(sheet_name)
+    if not expected:
+        return
+
+    try:
+        if first_row is None:
+            first_row = ws.row_values(1)
+        if first_row != expected:
+            # 空、または期待と異なる場合は1行目を上書き
+            ws.update('A1', [expected], value_input_option='USER_ENTERED')
+            logger.info("ヘッダー行を更新しました: %s (%d列)", sheet_name, len(expected))
+        _verified_headers[sheet_name] = _header_signature(ws)
     except Exception as e:
         logger.warning("ヘッダー行確認エラー (%s): %s", sheet_name, e)
 
 
 def _invalidate_cache(sheet_name: str = None):
-    """キャッシュを無効化する"""
+    """キャッシュを無効化する（シート名指定時はレプリカも次の読み取りで全体同期させる）"""
     if sheet_name:
         _worksheet_cache.pop(sheet_name, None)
+        replica = sheet_replica.get_replica()
+        if replica is not None:
+            replica.invalidate(sheet_name)
     else:
         _worksheet_cache.clear()
         _client_cache["client"] = None
         _client_cache["expires"] = 0
+        _spreadsheet_cache["sh"] = None
 
 
 def _get_log_sheet() -> gspread.Worksheet:
@@ -189,73 +312,446 @@ def _get_profile_sheet() -> gspread.Worksheet:
 
 # ===== リトライ付き書き込み =====
 
-def _append_row_with_retry(sheet: gspread.Worksheet, row: list, max_retries: int = 3):
+def _append_row_with_retry(sheet: gspread.Worksheet, row: list):
     """リトライ付きで行を追加する
 
-    Google Sheets APIのレート制限やネットワークエラーに対応。
+    Google Sheets APIのレート制限やネットワークエラーに対応（リトライは QuotaHTTPClient が行う）。
     value_input_option='USER_ENTERED' を使用して正しく書き込む。
+    戻り値は append のAPIレスポンス（追記先の範囲 updates.updatedRange を含む）。
     """
-    for attempt in range(max_retries):
+    return _append_rows_with_retry(sheet, [row])
+
+
+def _append_rows_with_retry(sheet: gspread.Worksheet, rows: list[list]):
+    """リトライ付きで複数行を1回の values.append で追加する"""
+    try:
+        response = sheet.append_rows(
+            rows,
+            value_input_option='USER_ENTERED',
+        )
+    except Exception as e:
+        _drop_broken_worksheet(sheet, e)
+        logger.error(f"Sheets API書き込み最終エラー: {e}")
+        raise
+    _write_through(sheet, lambda r: r.record_append(sheet.title, rows, _appended_row_number(response)))
+    return response
+
+
+def _batch_update_with_retry(sheet: gspread.Worksheet, data: list[dict]):
+    """リトライ付きで複数範囲を1回の values.batchUpdate で更新する"""
+    try:
+        sheet.batch_update(data, value_input_option='USER_ENTERED')
+    except Exception as e:
+        _drop_broken_worksheet(sheet, e)
+        logger.error(f"セル更新最終エラー: {e}")
+        raise
+    _write_through(sheet, lambda r: r.record_ranges(sheet.title, data))
+
+
+def _drop_broken_worksheet(sheet: gspread.Worksheet, error: Exception) -> None:
+    """リトライで解消しないエラー（シート削除・範囲不正など）なら、そのシートのハンドルだけ捨てる
+
+    クォータ・一時的なエラー・認証エラーはクライアント側で処理済みなので、
+    クライアントや他のワークシートは作り直さない。
+    """
+    if classify_error(error) == "fatal":
+        _worksheet_cache.pop(sheet.title, None)
+
+
+def _write_through(sheet: gspread.Worksheet, apply) -> None:
+    """Sheetsへの書き込み成功後、レプリカにも反映する（失敗したらレプリカ側を全体同期させる）"""
+    replica = sheet_replica.get_replica()
+    if replica is None:
+        return
+    try:
+        apply(replica)
+    except Exception as e:
+        logger.warning("レプリカへの書き込み反映エラー (%s): %s", sheet.title, e)
+        replica.invalidate(sheet.title)
+
+
+def _get_all_records(sheet_name: str) -> list[dict]:
+    """シートの全レコードを返す（レプリカ有効時はSQLiteから）"""
+    replica = sheet_replica.get_replica()
+    if replica is not None:
         try:
-            sheet.append_row(
-                row,
-                value_input_option='USER_ENTERED',
-            )
-            return
-        except gspread.exceptions.APIError as e:
-            if attempt < max_retries - 1:
-                wait_time = (attempt + 1) * 1.5
-                logger.warning(
-                    f"Sheets API書き込みエラー (試行 {attempt + 1}/{max_retries}): {e}. "
-                    f"{wait_time}秒後にリトライ..."
-                )
-                time.sleep(wait_time)
-                # キャッシュを無効化して再取得を強制
-                _invalidate_cache()
-            else:
-                logger.error(f"Sheets API書き込み最終エラー: {e}")
-                raise
+            return replica.get_all_records(sheet_name)
         except Exception as e:
-            if attempt < max_retries - 1:
-                logger.warning(f"書き込みエラー (試行 {attempt + 1}/{max_retries}): {e}")
-                time.sleep(1)
-                _invalidate_cache()
-            else:
-                raise
-
-
-def _update_cell_with_retry(
-    sheet: gspread.Worksheet, row: int, col: int, value, max_retries: int = 3
-):
-    """リトライ付きでセルを更新する"""
-    for attempt in range(max_retries):
+            logger.warning("レプリカ読み込みエラー（Sheetsから読みます） (%s): %s", sheet_name, e)
+    return _get_worksheet(sheet_name).get_all_records()
+
+
+def _get_replica_record(sheet_name: str, key: str) -> tuple[bool, dict | None]:
+    """レプリカから1件引く。(レプリカで引けたか, レコード) を返す"""
+    replica = sheet_replica.get_replica()
+    if replica is None or sheet_name not in EXPECTED_HEADERS:
+        return False, None
+    try:
+        return True, replica.get_record(sheet_name, key)
+    except Exception as e:
+        logger.warning("レプリカ読み込みエラー（Sheetsから読みます） (%s): %s", sheet_name, e)
+        return False, None
+
+
+# ===== 行インデックス =====
+
+_UPDATED_RANGE_ROW = re.compile(r"![A-Z]+(\d+)")
+
+
+def _appended_row_number(response) -> int | None:
+    """append のAPIレスポンスから追記された行番号を取り出す（取れなければNone）"""
+    try:
+        updated_range = response["updates"]["updatedRange"]
+    except (TypeError, KeyError):
+        return None
+    match = _UPDATED_RANGE_ROW.search(updated_range)
+    return int(match.group(1)) if match else None
+
+
+class _RowIndex:
+    """A列のキー → 行番号 のプロセス内インデックス（追記専用シート向け）
+
+    初回に1回だけA列全体を読み込み、未知のキーを引いたときは
+    前回読み込んだ行より後ろだけを読み足す。自分で追記した行は
+    append の応答から行番号を登録する。行の削除・並べ替えは想定しない。
+    """
+
+    def __init__(self, sheet_name: str):
+        self.sheet_name = sheet_name
+        self._rows: dict[str, int] = {}
+        self._loaded_rows = 0   # 読み込み済みの行数（ヘッダー行を含む）
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def find(self, sheet: gspread.Worksheet, key: str) -> int | None:
+        """キーの行番号を返す。シートにもなければNone。"""
+        with self._lock:
+            if not self._loaded:
+                self._load(sheet)
+            elif key not in self._rows:
+                self._refresh(sheet)
+            return self._rows.get(key)
+
+    def record_append(self, key: str, row: int | None) -> None:
+        """自分で追記した行を登録する"""
+        if not key or not row:
+            return
+        with self._lock:
+            self._rows.setdefault(key, row)
+            # 読み込み済み範囲の直後なら範囲を進める（他インスタンスの追記を飛ばさないため）
+            if self._loaded and row == self._loaded_rows + 1:
+                self._loaded_rows = row
+
+    def invalidate(self) -> None:
+        """インデックスを破棄して次回アクセスでA列全体を読み直させる"""
+        with self._lock:
+            self._rows = {}
+            self._loaded_rows = 0
+            self._loaded = False
+
+    def _load(self, sheet: gspread.Worksheet) -> None:
+        ids = sheet.col_values(1)
+        self._rows = {}
+        self._add(ids, 1)
+        self._loaded_rows = len(ids)
+        self._loaded = True
+        logger.info("行インデックスを読み込みました: %s (%d行)", self.sheet_name, len(ids))
+
+    def _refresh(self, sheet: gspread.Worksheet) -> None:
+        start = self._loaded_rows + 1
+        values = sheet.get(f"A{start}:A")
+        ids = [r[0] if r else "" for r in values]
+        self._add(ids, start)
+        self._loaded_rows += len(ids)
+        if ids:
+            logger.info("行インデックスを差分更新しました: %s (+%d行)", self.sheet_name, len(ids))
+
+    def _add(self, ids: list, start: int) -> None:
+        for offset, key in enumerate(ids):
+            key = str(key)
+            # 同じキーが複数行あれば先頭の行を使う（list.index と同じ）
+            if key and key not in self._rows:
+                self._rows[key] = start + offset
+
+
+# 診断ログの diagnosis_id → 行番号、プロフィールの user_id → 行番号
+_diagnosis_rows = _RowIndex(LOG_SHEET_NAME)
+_profile_rows = _RowIndex(PROFILE_SHEET_NAME)
+
+_ROW_INDEXES: dict[str, _RowIndex] = {
+    LOG_SHEET_NAME: _diagnosis_rows,
+    PROFILE_SHEET_NAME: _profile_rows,
+}
+_row_indexes_lock = threading.Lock()
+
+
+def _row_index(sheet_name: str) -> _RowIndex | None:
+    """シートの行インデックスを返す（診断ログのパーティションは初回に作る）"""
+    index = _ROW_INDEXES.get(sheet_name)
+    if index is None and _PARTITION_SHEET.match(sheet_name):
+        with _row_indexes_lock:
+            index = _ROW_INDEXES.setdefault(sheet_name, _RowIndex(sheet_name))
+    return index
+
+
+def _find_verified_row(sheet_name: str, sheet: gspread.Worksheet, key: str) -> int | None:
+    """行インデックスで行番号を引き、A列が key のままか確かめてから返す
+
+    行の削除や並べ替えでずれていたらインデックスを読み直して1回だけ引き直す。
+    読み直しても見つからなければNone（別の行に書き込まないため）。
+    """
+    index = _row_index(sheet_name)
+    row = index.find(sheet, key)
+    if row is None:
+        return None
+    if sheet.acell(rowcol_to_a1(row, 1)).value == key:
+        return row
+
+    logger.warning("行インデックスがずれています。再読み込みします: %s %s", sheet_name, key)
+    index.invalidate()
+    return index.find(sheet, key)
+
+
+def batch_update_row_fields(sheet_name: str, key: str, fields: dict) -> bool:
+    """A列が key の行の複数列を1回の batch_update で更新する。行がなければFalse。
+
+    列番号は EXPECTED_HEADERS から求める（ヘッダー行は読まない）。
+    隣り合う列は1つの範囲にまとめる。行番号は行インデックスのあるシートのみ対応。
+    """
+    headers = _headers_for(sheet_name)
+    columns = []
+    for name, value in fields.items():
+        if name not in headers:
+            logger.warning("%sカラムが見つかりません (%s)", name, sheet_name)
+            continue
+        columns.append((headers.index(name) + 1, value))
+    if not columns:
+        return False
+
+    _flush_if_pending(sheet_name, key)
+    sheet = _get_worksheet(sheet_name)
+    row = _find_verified_row(sheet_name, sheet, key)
+    if row is None:
+        return False
+
+    # 連続する列を [開始列, 値...] のまとまりにする
+    runs: list[list] = []
+    for col, value in sorted(columns, key=lambda c: c[0]):
+        if runs and runs[-1][0] + len(runs[-1]) - 1 == col:
+            runs[-1].append(value)
+        else:
+            runs.append([col, value])
+    data = [
+        {
+            "range": f"{rowcol_to_a1(row, run[0])}:{rowcol_to_a1(row, run[0] + len(run) - 2)}",
+            "values": [run[1:]],
+        }
+        for run in runs
+    ]
+    _batch_update_with_retry(sheet, data)
+    return True
+
+
+# ===== 追記の遅延バッファ（write-behind） =====
+# リクエストスレッドでは行をバッファとローカルのスプールファイルに積むだけにし、
+# N行たまるかTミリ秒経過したら1回の values.append でまとめて書き込む。
+# サーバーレス環境ではレスポンス後にプロセスが凍結されうるため既定では無効。
+
+WRITE_BEHIND_ENABLED = os.environ.get("SHEETS_WRITE_BEHIND", "") == "1"
+WRITE_BEHIND_MAX_ROWS = int(os.environ.get("SHEETS_WRITE_BEHIND_MAX_ROWS", "20"))
+WRITE_BEHIND_INTERVAL_MS = int(os.environ.get("SHEETS_WRITE_BEHIND_INTERVAL_MS", "2000"))
+
+_SPOOL_DIR = os.path.join(os.environ.get("TMPDIR", "/tmp"), "atlas_sheet_spool")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except Exception:
+        return True
+    return True
+
+
+class _BufferedAppender:
+    """シート1枚分の追記バッファ
+
+    積んだ行はプロセス別のスプールファイル（JSON Lines）にも書き、
+    プロセスが落ちても次に起動したプロセスが引き継いで書き込む。
+    row_index を渡すと、書き込み後に各行のA列の値と行番号を登録する。
+    """
+
+    def __init__(self, sheet_name: str, row_index: "_RowIndex | None" = None):
+        self.sheet_name = sheet_name
+        self.row_index = row_index
+        self._pending: list[list] = []
+        self._lock = threading.Lock()         # _pending とスプールファイルを保護
+        self._flush_lock = threading.Lock()   # 書き込みは同時に1つだけ
+        self._timer: threading.Timer | None = None
+        self._spool_path = ""
+        if _SPOOL_DIR:
+            try:
+                os.makedirs(_SPOOL_DIR, exist_ok=True)
+                self._spool_path = os.path.join(_SPOOL_DIR, f"{sheet_name}.{os.getpid()}.jsonl")
+                self._recover_spools()
+            except Exception as e:
+                logger.warning("スプール初期化エラー（%s、スプールなしで継続）: %s", sheet_name, e)
+                self._spool_path = ""
+
+    def append(self, row: list) -> None:
+        """行をバッファに積む。上限に達したらその場で書き込む。"""
+        with self._lock:
+            self._pending.append(row)
+            self._spool_write([row], mode="a")
+            full = len(self._pending) >= WRITE_BEHIND_MAX_ROWS
+            if not full:
+                self._schedule()
+        if full:
+            self.flush()
+
+    def has_pending(self, key: str) -> bool:
+        """A列の値が key の行がまだ書き込まれていなければTrue"""
+        with self._lock:
+            return any(row and row[0] == key for row in self._pending)
+
+    def flush(self) -> int:
+        """積んである行をまとめて書き込み、書き込んだ行数を返す（失敗時は例外、行は残る）"""
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._pending)
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not rows:
+                return 0
+
+            response = _append_rows_with_retry(_get_worksheet(self.sheet_name), rows)
+
+            with self._lock:
+                del self._pending[:len(rows)]
+                self._spool_write(self._pending, mode="w")
+            if self.row_index is not None:
+                start = _appended_row_number(response)
+                for offset, row in enumerate(rows):
+                    self.row_index.record_append(str(row[0]), start + offset if start else None)
+            logger.info("遅延バッファを書き込みました: %s (%d行)", self.sheet_name, len(rows))
+            return len(rows)
+
+    def _flush_quietly(self) -> None:
         try:
-            sheet.update_cell(row, col, value)
+            with background_retries():
+                self.flush()
+        except Exception as e:
+            logger.error("遅延バッファ書き込みエラー（%s、次回再試行）: %s", self.sheet_name, e)
+            with self._lock:
+                self._schedule()
+
+    def _schedule(self) -> None:
+        """（_lock 取得中に呼ぶ）Tミリ秒後の書き込みを予約する"""
+        if self._timer is None and self._pending:
+            self._timer = threading.Timer(WRITE_BEHIND_INTERVAL_MS / 1000, self._flush_quietly)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _spool_write(self, rows: list[list], mode: str) -> None:
+        """（_lock 取得中に呼ぶ）スプールファイルに追記（a）または全体を書き直す（w）"""
+        if not self._spool_path:
             return
-        except gspread.exceptions.APIError as e:
-            if attempt < max_retries - 1:
-                wait_time = (attempt + 1) * 1.5
-                logger.warning(
-                    f"セル更新エラー (試行 {attempt + 1}/{max_retries}): {e}. "
-                    f"{wait_time}秒後にリトライ..."
-                )
-                time.sleep(wait_time)
-            else:
-                logger.error(f"セル更新最終エラー: {e}")
-                raise
+        try:
+            if mode == "w" and not rows:
+                if os.path.exists(self._spool_path):
+                    os.remove(self._spool_path)
+                return
+            with open(self._spool_path, mode, encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            logger.warning("スプール書き込みエラー (%s): %s", self.sheet_name, e)
+
+    def _recover_spools(self) -> None:
+        """自分と終了済みプロセスのスプールを引き継いでバッファに戻す"""
+        prefix = f"{self.sheet_name}."
+        recovered: list[list] = []
+        for name in sorted(os.listdir(_SPOOL_DIR)):
+            if not (name.startswith(prefix) and name.endswith(".jsonl")):
+                continue
+            pid_part = name[len(prefix):-len(".jsonl")]
+            if not pid_part.isdigit():
+                continue
+            path = os.path.join(_SPOOL_DIR, name)
+            pid = int(pid_part)
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            # 同時に起動した他プロセスと取り合わないよう、改名できた側だけが引き継ぐ
+            claimed = f"{path}.claimed.{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            with open(claimed, encoding="utf-8") as f:
+                recovered.extend(json.loads(line) for line in f if line.strip())
+            os.remove(claimed)
+
+        if recovered:
+            self._pending.extend(recovered)
+            self._spool_write(recovered, mode="a")
+            self._schedule()
+            logger.warning("未書き込みのスプールを引き継ぎました: %s (%d行)", self.sheet_name, len(recovered))
+
+
+_appenders: dict[str, _BufferedAppender] = {}
+_appenders_lock = threading.Lock()
+
+
+def _get_appender(sheet_name: str) -> _BufferedAppender:
+    appender = _appenders.get(sheet_name)
+    if appender is None:
+        with _appenders_lock:
+            appender = _appenders.get(sheet_name)
+            if appender is None:
+                appender = _BufferedAppender(sheet_name, _row_index(sheet_name))
+                _appenders[sheet_name] = appender
+    return appender
+
+
+def _append_log_row(sheet_name: str, row: list):
+    """ログ系シートへの追記。遅延バッファ有効時は積むだけで、APIレスポンスはNone。"""
+    if WRITE_BEHIND_ENABLED:
+        _get_appender(sheet_name).append(row)
+        return None
+    return _append_row_with_retry(_get_worksheet(sheet_name), row)
+
+
+def _flush_if_pending(sheet_name: str, key: str) -> None:
+    """key の行がバッファに残っていれば先に書き込む（直後の読み書きで見つかるように）"""
+    appender = _appenders.get(sheet_name)
+    if appender is not None and appender.has_pending(key):
+        appender.flush()
+
+
+def flush_sheet_buffers() -> int:
+    """全シートの遅延バッファを書き込み、書き込んだ行数の合計を返す"""
+    total = 0
+    for appender in list(_appenders.values()):
+        try:
+            total += appender.flush()
         except Exception as e:
-            if attempt < max_retries - 1:
-                time.sleep(1)
-            else:
-                raise
+            logger.error("遅延バッファ書き込みエラー (%s): %s", appender.sheet_name, e)
+    return total
+
+
+# 終了時に残りを書き込む（書き込めなかった行はスプールに残り、次のプロセスが引き継ぐ）
+atexit.register(flush_sheet_buffers)
 
 
 # ===== ブレスレット選択記録 =====
 
-def add_bracelet_selection(data: dict):
-    """ユーザーがブレスレットを選んで商品ページへ進んだ記録をシートに追記する"""
-    sheet = _get_worksheet(BRACELET_SELECTION_SHEET_NAME)
-    row = [
+def selection_row(data: dict) -> list:
+    """ブレスレット選択記録をヘッダー順の行にする"""
+    return [
         data.get("selection_id", ""),
         data.get("created_at", ""),
         data.get("user_id", ""),
@@ -266,18 +762,20 @@ def add_bracelet_selection(data: dict):
         data.get("product_name", ""),
         data.get("score", ""),
     ]
-    _append_row_with_retry(sheet, row)
+
+
+def add_bracelet_selection(data: dict):
+    """ユーザーがブレスレットを選んで商品ページへ進んだ記録をシートに追記する"""
+    _append_log_row(BRACELET_SELECTION_SHEET_NAME, selection_row(data))
     logger.info("ブレスレット選択記録: user_id=%s, sku=%s",
                 data.get("user_id"), data.get("sku"))
 
 
 # ===== 注文操作 =====
 
-def add_order(data: dict):
-    """注文データをスプレッドシートに追加する"""
-    sheet = _get_order_sheet()
-
-    row = [
+def order_row(data: dict) -> list:
+    """注文データをヘッダー順の行にする"""
+    return [
         data.get("order_id", ""),
         data.get("created_at", ""),
         data.get("status", ""),
@@ -294,17 +792,74 @@ def add_order(data: dict):
         data.get("payment_method", ""),
     ]
 
-    _append_row_with_retry(sheet, row)
+
+def add_order(data: dict):
+    """注文データをスプレッドシートに追加する"""
+    _append_log_row(ORDER_SHEET_NAME, order_row(data))
     logger.info(f"注文追加完了: order_id={data.get('order_id')}")
 
 
 # ===== 診断ログ操作 =====
 
-def add_diagnosis(data: dict):
-    """診断結果をスプレッドシートに追加する"""
-    sheet = _get_log_sheet()
+# diagnosis_id → (有効期限, 読み込んだレコード)。他インスタンスの更新はTTLで反映する
+_diagnosis_records = LRUCache("diagnosis_records", max_size=1024)
 
-    row = [
+
+def _cached_record(cache: LRUCache, key: str) -> dict | None:
+    entry = cache.get(key)
+    if entry is None or time.time() >= entry[0]:
+        return None
+    return entry[1]
+
+
+def _cache_record(cache: LRUCache, key: str, record: dict) -> None:
+    cache.set(key, (time.time() + CACHE_TTL, record))
+
+
+def _cached_diagnosis(diagnosis_id: str) -> dict | None:
+    return _cached_record(_diagnosis_records, diagnosis_id)
+
+
+def _update_cached_diagnosis(diagnosis_id: str, fields: dict) -> None:
+    record = _cached_diagnosis(diagnosis_id)
+    if record is not None:
+        record.update(fields)
+
+
+def _read_indexed_record(sheet_name: str, key: str) -> dict | None:
+    """行インデックスで行を特定して row_values 1回でレコード（ヘッダー名 → 値）を読む
+
+    行がずれていたらインデックスを読み直して1回だけ引き直す。
+    """
+    sheet = _get_worksheet(sheet_name)
+    index = _row_index(sheet_name)
+    row_index = index.find(sheet, key)
+    if row_index is None:
+        return None
+
+    row_data = sheet.row_values(row_index)
+    if not row_data or row_data[0] != key:
+        logger.warning("行インデックスがずれています。再読み込みします: %s %s", sheet_name, key)
+        index.invalidate()
+        row_index = index.find(sheet, key)
+        if row_index is None:
+            return None
+        row_data = sheet.row_values(row_index)
+
+    return dict(zip(_headers_for(sheet_name), row_data))
+
+
+def invalidate_diagnosis_index() -> None:
+    """診断ログ（全パーティション）の行インデックスとレコードキャッシュを破棄する"""
+    for name, index in list(_ROW_INDEXES.items()):
+        if name == LOG_SHEET_NAME or _PARTITION_SHEET.match(name):
+            index.invalidate()
+    _diagnosis_records.invalidate()
+
+
+def diagnosis_row(data: dict) -> list:
+    """診断結果をヘッダー順の行にする"""
+    return [
         data.get("diagnosis_id", ""),
         data.get("created_at", ""),
         data.get("stone_name", ""),
@@ -321,71 +876,59 @@ def add_diagnosis(data: dict):
         False,  # purchased フラグ
     ]
 
-    _append_row_with_retry(sheet, row)
+
+def add_diagnosis(data: dict):
+    """診断結果をスプレッドシートに追加する（DIAGNOSIS_TEXT_OFFLOAD=1 なら長文はブロブに逃がす）"""
+    data = utils_blob.offload_text(data)
+    diagnosis_id = data.get("diagnosis_id", "")
+    sheet_name = diagnosis_partition(diagnosis_id)
+    response = _append_log_row(sheet_name, diagnosis_row(data))
+    _row_index(sheet_name).record_append(diagnosis_id, _appended_row_number(response))
     logger.info(f"診断ログ追加完了: diagnosis_id={data.get('diagnosis_id')}")
 
 
 def update_diagnosis(diagnosis_id: str, stones: str, product_slug: str):
     """診断レコードの石情報と商品スラッグを更新する"""
-    sheet = _get_log_sheet()
-    id_column = sheet.col_values(1)
+    fields = {"stones": stones}
+    if product_slug:
+        fields["product_slug"] = product_slug
 
-    if diagnosis_id not in id_column:
+    if not batch_update_row_fields(diagnosis_partition(diagnosis_id), diagnosis_id, fields):
         logger.warning(f"更新対象の診断が見つかりません: {diagnosis_id}")
         return
-
-    row = id_column.index(diagnosis_id) + 1
-    headers = sheet.row_values(1)
-
-    try:
-        stones_col = headers.index("stones") + 1
-        _update_cell_with_retry(sheet, row, stones_col, stones)
-    except ValueError:
-        logger.warning("stonesカラムが見つかりません")
-
-    if product_slug:
-        try:
-            slug_col = headers.index("product_slug") + 1
-            _update_cell_with_retry(sheet, row, slug_col, product_slug)
-        except ValueError:
-            logger.warning("product_slugカラムが見つかりません")
+    _update_cached_diagnosis(diagnosis_id, fields)
 
 
 def mark_purchased(diagnosis_id: str):
     """診断レコードの購入済みフラグを更新する"""
-    sheet = _get_log_sheet()
-    id_column = sheet.col_values(1)
-
-    if diagnosis_id not in id_column:
+    if not batch_update_row_fields(diagnosis_partition(diagnosis_id), diagnosis_id, {"purchased": True}):
         logger.warning(f"購入マーク対象の診断が見つかりません: {diagnosis_id}")
         return
-
-    row = id_column.index(diagnosis_id) + 1
-    headers = sheet.row_values(1)
-
-    try:
-        col_index = headers.index("purchased") + 1
-        _update_cell_with_retry(sheet, row, col_index, True)
-    except ValueError:
-        logger.warning("purchasedカラムが見つかりません")
+    _update_cached_diagnosis(diagnosis_id, {"purchased": "TRUE"})
 
 
 def get_diagnosis(diagnosis_id: str) -> dict | None:
-    """diagnosis_idで診断レコードを1件取得する"""
+    """diagnosis_idで診断レコードを1件取得する
+
+    キャッシュ済み（CACHE_TTL以内に読んだもの）ならAPI呼び出しなし、
+    それ以外は行インデックスで行を特定して row_values 1回。
+    """
     if not diagnosis_id:
         return None
 
-    sheet = _get_log_sheet()
-    id_column = sheet.col_values(1)
+    cached = _cached_diagnosis(diagnosis_id)
+    if cached is not None:
+        return dict(cached)
 
-    if diagnosis_id not in id_column:
+    sheet_name = diagnosis_partition(diagnosis_id)
+    _flush_if_pending(sheet_name, diagnosis_id)
+    served, record = _get_replica_record(sheet_name, diagnosis_id)
+    if not served:
+        record = _read_indexed_record(sheet_name, diagnosis_id)
+    if record is None:
         return None
-
-    row_index = id_column.index(diagnosis_id) + 1
-    row_data = sheet.row_values(row_index)
-    headers = sheet.row_values(1)
-
-    return dict(zip(headers, row_data))
+    _cache_record(_diagnosis_records, diagnosis_id, record)
+    return dict(record)
 
 
 def format_stones(stone_counts: dict) -> str:
@@ -399,25 +942,47 @@ def format_stones(stone_counts: dict) -> str:
 
 # ===== プロフィール操作 =====
 
-def upsert_profile(profile: dict):
-    """ユーザープロフィールを追加または更新する（バッチ書き込みで1回のAPI呼び出し）
+# user_id → (有効期限, レコード)。書き込んだレコードもそのまま入れる
+_profile_records = LRUCache("profile_records", max_size=1024)
+
+
+def upsert_profile(profile: dict) -> dict | None:
+    """ユーザープロフィールを追加または更新し、書き込んだプロフィールを返す
+
+    行インデックスで既存行を特定して batch_update 1回、なければ append 1回。
+    書き込んだレコードはキャッシュに入れるので、直後の get_profile はAPIを呼ばない。
 
     Args:
         profile: user_id, gender, birth{date,time,place}, wrist_inner_cm 等を含む辞書
     """
-    ws = _get_profile_sheet()
-
     user_id = profile.get("user_id")
     if not user_id:
         logger.warning("upsert_profile: user_idが未指定です")
-        return
+        return None
 
-    birth = profile.get("birth", {}) or {}
-    now = datetime.now(timezone.utc).isoformat()
+    row_values = profile_row(profile)
+    record = dict(zip(EXPECTED_HEADERS[PROFILE_SHEET_NAME], row_values))
 
-    # ヘッダー順に合わせた行データを一括構築
-    row_values = [
-        user_id,
+    # 既存行があれば行インデックスで特定して一括上書き（1回のAPI呼び出し）
+    if batch_update_row_fields(PROFILE_SHEET_NAME, user_id, record):
+        logger.info("プロフィール更新: user_id=%s", user_id)
+    else:
+        # 新規行を追加（1回のAPI呼び出し）
+        response = _append_row_with_retry(_get_profile_sheet(), row_values)
+        _profile_rows.record_append(user_id, _appended_row_number(response))
+        logger.info("プロフィール新規作成: user_id=%s", user_id)
+
+    # シートから読んだときと同じ文字列の形でキャッシュする
+    record = {k: sheet_replica.sheet_value(v) for k, v in record.items()}
+    _cache_record(_profile_records, user_id, record)
+    return profile_from_record(record)
+
+
+def profile_row(profile: dict) -> list:
+    """プロフィールをヘッダー順の行にする（last_updated は現在時刻）"""
+    birth = profile.get("birth", {}) or {}
+    return [
+        profile.get("user_id"),
         profile.get("name", ""),
         profile.get("gender", ""),
         birth.get("date", ""),
@@ -426,36 +991,68 @@ def upsert_profile(profile: dict):
         profile.get("wrist_inner_cm", ""),
         profile.get("bead_size_mm", ""),
         profile.get("bracelet_type", ""),
-        now,
+        datetime.now(timezone.utc).isoformat(),
     ]
 
-    # 既存行を検索（first column = user_id）
-    id_col = ws.col_values(1)
-    if user_id in id_col:
-        row_num = id_col.index(user_id) + 1
-        # 既存行を一括上書き（1回のAPI呼び出し）
-        headers = EXPECTED_HEADERS[PROFILE_SHEET_NAME]
-        col_end = chr(ord('A') + len(headers) - 1)
-        ws.update(f"A{row_num}:{col_end}{row_num}", [row_values],
-                  value_input_option="USER_ENTERED")
-        logger.info("プロフィール更新: user_id=%s", user_id)
-    else:
-        # 新規行を追加（1回のAPI呼び出し）
-        _append_row_with_retry(ws, row_values)
-        logger.info("プロフィール新規作成: user_id=%s", user_id)
-
 
 # ===== 設定マスター操作 =====
 
+# 直接シートを編集した場合も CONFIG_CACHE_TTL 秒以内に反映される
+CONFIG_CACHE_TTL = float(os.environ.get("CONFIG_CACHE_TTL", "30"))
+CONFIG_ERROR_TTL = 5  # 読み込み失敗（空dict）をキャッシュする秒数
+
+_config_cache: dict = {"config": None, "expires": 0}
+_config_lock = threading.Lock()
+
+
 def get_config() -> dict:
-    """configシートの全設定をキーバリュー辞書で返す。取得失敗時は空dictを返す。"""
-    try:
-        ws = _get_worksheet(CONFIG_SHEET_NAME)
-        rows = ws.get_all_records()
-        return {r["key"]: r["value"] for r in rows if r.get("key")}
-    except Exception as e:
-        logger.warning("config読み込みエラー: %s", e)
-        return {}
+    """configシートの全設定をキーバリュー辞書で返す。取得失敗時は空dictを返す。
+
+    読み込んだ設定は1つのスナップショットとして CONFIG_CACHE_TTL 秒キャッシュし、そのコピーを返す。
+    失敗時の空dictも CONFIG_ERROR_TTL 秒キャッシュして、毎回の再試行を避ける。
+    """
+    cached = _config_cache["config"]
+    if cached is not None and time.time() < _config_cache["expires"]:
+        return dict(cached)
+
+    with _config_lock:
+        # 待っている間に他スレッドが読み込んでいればそれを使う
+        cached = _config_cache["config"]
+        if cached is not None and time.time() < _config_cache["expires"]:
+            return dict(cached)
+        try:
+            config = parse_config(_get_all_records(CONFIG_SHEET_NAME))
+            ttl = CONFIG_CACHE_TTL
+        except Exception as e:
+            logger.warning("config読み込みエラー: %s", e)
+            config = {}
+            ttl = CONFIG_ERROR_TTL
+        _config_cache.update({"config": config, "expires": time.time() + ttl})
+    return dict(config)
+
+
+def parse_config(rows: list[dict]) -> dict:
+    """configシートのレコードをキーバリュー辞書にする"""
+    return {r["key"]: r["value"] for r in rows if r.get("key")}
+
+
+def invalidate_config_cache() -> None:
+    """configキャッシュを破棄し、次の get_config でシートを読み直させる"""
+    with _config_lock:
+        _config_cache.update({"config": None, "expires": 0})
+
+
+def _write_through_config(key: str, value: str) -> None:
+    """set_config の書き込みをキャッシュ済みのスナップショットに反映する"""
+    with _config_lock:
+        cached = _config_cache["config"]
+        if cached is None:
+            return
+        # シートから読み直したときと同じく数値らしい値は数値にする
+        _config_cache.update({
+            "config": {**cached, key: numericise(value)},
+            "expires": time.time() + CONFIG_CACHE_TTL,
+        })
 
 
 def set_config(key: str, value: str, note: str = "") -> None:
@@ -470,26 +1067,33 @@ def set_config(key: str, value: str, note: str = "") -> None:
     else:
         ws.append_row([key, str(value), now, note], value_input_option="USER_ENTERED")
     _invalidate_cache(CONFIG_SHEET_NAME)
+    _write_through_config(key, str(value))
     logger.info("config更新: %s = %s", key, value)
 
 
 def get_profile(user_id: str) -> dict | None:
-    """ユーザーIDでプロフィールを取得する"""
+    """ユーザーIDでプロフィールを取得する
+
+    キャッシュ済み（CACHE_TTL以内に読み書きしたもの）ならAPI呼び出しなし、
+    それ以外は行インデックスで行を特定して row_values 1回。
+    """
     if not user_id:
         return None
 
-    sheet = _get_profile_sheet()
-    id_column = sheet.col_values(1)
-
-    if user_id not in id_column:
-        return None
+    data = _cached_record(_profile_records, user_id)
+    if data is None:
+        served, data = _get_replica_record(PROFILE_SHEET_NAME, user_id)
+        if not served:
+            data = _read_indexed_record(PROFILE_SHEET_NAME, user_id)
+        if data is None:
+            return None
+        _cache_record(_profile_records, user_id, data)
 
-    row_index = id_column.index(user_id) + 1
-    row_data = sheet.row_values(row_index)
-    headers = sheet.row_values(1)
+    return profile_from_record(data)
 
-    data = dict(zip(headers, row_data))
 
+def profile_from_record(data: dict) -> dict:
+    """profilesシートのレコード（ヘッダー名 → 値）をAPIのプロフィール形式にする"""
     return {
         "user_id": data.get("user_id"),
         "gender": data.get("gender"),
@@ -534,48 +1138,50 @@ def _safe_bool(val) -> bool:
 def get_stone_master_from_sheet() -> dict | None:
     """stone_masterシートから石マスターを読み込んでdictで返す。データなし or エラーはNone。"""
     try:
-        ws = _get_worksheet(STONE_MASTER_SHEET_NAME)
-        rows = ws.get_all_records()
-        if not rows:
-            return None
-        result = {}
-        for r in rows:
-            sid = r.get("stone_id", "").strip()
-            if not sid:
-                continue
-            result[sid] = {
-                "stone_name":  r.get("stone_name", sid),
-                "description": r.get("description", ""),
-                "element_profile": {
-                    "fire":  _safe_float(r.get("fire",  0)),
-                    "earth": _safe_float(r.get("earth", 0)),
-                    "air":   _safe_float(r.get("air",   0)),
-                    "water": _safe_float(r.get("water", 0)),
-                },
-                "aura_profile": {
-                    k: _safe_float(r.get(f"aura_{k}", 0))
-                    for k in ["intuition", "clarity", "stability", "vitality",
-                               "protection", "love", "expression", "courage"]
-                },
-                "zodiac":              _split_tags(r.get("zodiac", "")),
-                "planet":              _split_tags(r.get("planet", "")),
-                "birth_month":         [int(x) for x in _split_tags(r.get("birth_month", "")) if x.isdigit()],
-                "numerology_affinity": [int(x) for x in _split_tags(r.get("numerology_affinity", "")) if x.isdigit()],
-                "color_tags":          _split_tags(r.get("color_tags", "")),
-                "theme_tags":          _split_tags(r.get("theme_tags", "")),
-                "worry_tags":          _split_tags(r.get("worry_tags", "")),
-                "weight":              _safe_float(r.get("weight", 1.0), 1.0),
-            }
-        logger.info("石マスターをシートから読み込みました: %d件", len(result))
-        return result if result else None
+        return parse_stone_master(_get_all_records(STONE_MASTER_SHEET_NAME))
     except Exception as e:
         logger.warning("石マスターシート読み込みエラー: %s", e)
         return None
 
 
-def write_stone_master_to_sheet(stone_master: dict) -> None:
-    """石マスターdictをstone_masterシートに書き込む（全上書き）"""
-    ws = _get_worksheet(STONE_MASTER_SHEET_NAME)
+def parse_stone_master(rows: list[dict]) -> dict | None:
+    """stone_masterシートのレコードを石マスターdictに変換する。データなしはNone。"""
+    if not rows:
+        return None
+    result = {}
+    for r in rows:
+        sid = r.get("stone_id", "").strip()
+        if not sid:
+            continue
+        result[sid] = {
+            "stone_name":  r.get("stone_name", sid),
+            "description": r.get("description", ""),
+            "element_profile": {
+                "fire":  _safe_float(r.get("fire",  0)),
+                "earth": _safe_float(r.get("earth", 0)),
+                "air":   _safe_float(r.get("air",   0)),
+                "water": _safe_float(r.get("water", 0)),
+            },
+            "aura_profile": {
+                k: _safe_float(r.get(f"aura_{k}", 0))
+                for k in ["intuition", "clarity", "stability", "vitality",
+                           "protection", "love", "expression", "courage"]
+            },
+            "zodiac":              _split_tags(r.get("zodiac", "")),
+            "planet":              _split_tags(r.get("planet", "")),
+            "birth_month":         [int(x) for x in _split_tags(r.get("birth_month", "")) if x.isdigit()],
+            "numerology_affinity": [int(x) for x in _split_tags(r.get("numerology_affinity", "")) if x.isdigit()],
+            "color_tags":          _split_tags(r.get("color_tags", "")),
+            "theme_tags":          _split_tags(r.get("theme_tags", "")),
+            "worry_tags":          _split_tags(r.get("worry_tags", "")),
+            "weight":              _safe_float(r.get("weight", 1.0), 1.0),
+        }
+    logger.info("石マスターをシートから読み込みました: %d件", len(result))
+    return result if result else None
+
+
+def stone_master_rows(stone_master: dict) -> list[list]:
+    """石マスターdictをヘッダー行付きの行リストにする"""
     headers = EXPECTED_HEADERS[STONE_MASTER_SHEET_NAME]
     rows = [headers]
     for sid, s in stone_master.items():
@@ -598,6 +1204,13 @@ def write_stone_master_to_sheet(stone_master: dict) -> None:
             _join_tags(s.get("worry_tags", [])),
             s.get("weight", 1.0),
         ])
+    return rows
+
+
+def write_stone_master_to_sheet(stone_master: dict) -> None:
+    """石マスターdictをstone_masterシートに書き込む（全上書き）"""
+    ws = _get_worksheet(STONE_MASTER_SHEET_NAME)
+    rows = stone_master_rows(stone_master)
     ws.clear()
     ws.update("A1", rows, value_input_option="USER_ENTERED")
     _invalidate_cache(STONE_MASTER_SHEET_NAME)
@@ -609,44 +1222,46 @@ def write_stone_master_to_sheet(stone_master: dict) -> None:
 def get_combination_master_from_sheet() -> dict | None:
     """stone_combinationsシートから組み合わせマスターを読み込む。キーはfrozenset。"""
     try:
-        ws = _get_worksheet(STONE_COMBO_SHEET_NAME)
-        rows = ws.get_all_records()
-        if not rows:
-            return None
-        result = {}
-        for r in rows:
-            sid_a = r.get("stone_id_a", "").strip()
-            sid_b = r.get("stone_id_b", "").strip()
-            if not sid_a or not sid_b:
-                continue
-            key = frozenset({sid_a, sid_b})
-            result[key] = {
-                "theme_tags": _split_tags(r.get("theme_tags", "")),
-                "worry_tags": _split_tags(r.get("worry_tags", "")),
-                "element_bonus": {
-                    "fire":  _safe_float(r.get("bonus_fire",  0)),
-                    "earth": _safe_float(r.get("bonus_earth", 0)),
-                    "air":   _safe_float(r.get("bonus_air",   0)),
-                    "water": _safe_float(r.get("bonus_water", 0)),
-                },
-                "aura_bonus": {
-                    k: _safe_float(r.get(f"aura_bonus_{k}", 0))
-                    for k in ["intuition", "clarity", "stability", "vitality",
-                               "protection", "love", "expression", "courage"]
-                },
-                "meaning": r.get("meaning", ""),
-                "weight":  _safe_float(r.get("weight", 1.0), 1.0),
-            }
-        logger.info("組み合わせマスターをシートから読み込みました: %d件", len(result))
-        return result if result else None
+        return parse_combination_master(_get_all_records(STONE_COMBO_SHEET_NAME))
     except Exception as e:
         logger.warning("組み合わせマスターシート読み込みエラー: %s", e)
         return None
 
 
-def write_combination_master_to_sheet(combo_master: dict) -> None:
-    """組み合わせマスターdictをstone_combinationsシートに書き込む（全上書き）"""
-    ws = _get_worksheet(STONE_COMBO_SHEET_NAME)
+def parse_combination_master(rows: list[dict]) -> dict | None:
+    """stone_combinationsシートのレコードを組み合わせマスターdictに変換する。データなしはNone。"""
+    if not rows:
+        return None
+    result = {}
+    for r in rows:
+        sid_a = r.get("stone_id_a", "").strip()
+        sid_b = r.get("stone_id_b", "").strip()
+        if not sid_a or not sid_b:
+            continue
+        key = frozenset({sid_a, sid_b})
+        result[key] = {
+            "theme_tags": _split_tags(r.get("theme_tags", "")),
+            "worry_tags": _split_tags(r.get("worry_tags", "")),
+            "element_bonus": {
+                "fire":  _safe_float(r.get("bonus_fire",  0)),
+                "earth": _safe_float(r.get("bonus_earth", 0)),
+                "air":   _safe_float(r.get("bonus_air",   0)),
+                "water": _safe_float(r.get("bonus_water", 0)),
+            },
+            "aura_bonus": {
+                k: _safe_float(r.get(f"aura_bonus_{k}", 0))
+                for k in ["intuition", "clarity", "stability", "vitality",
+                           "protection", "love", "expression", "courage"]
+            },
+            "meaning": r.get("meaning", ""),
+            "weight":  _safe_float(r.get("weight", 1.0), 1.0),
+        }
+    logger.info("組み合わせマスターをシートから読み込みました: %d件", len(result))
+    return result if result else None
+
+
+def combination_master_rows(combo_master: dict) -> list[list]:
+    """組み合わせマスターdictをヘッダー行付きの行リストにする"""
     headers = EXPECTED_HEADERS[STONE_COMBO_SHEET_NAME]
     rows = [headers]
     for key, effect in combo_master.items():
@@ -664,6 +1279,13 @@ def write_combination_master_to_sheet(combo_master: dict) -> None:
             effect.get("meaning", ""),
             effect.get("weight", 1.0),
         ])
+    return rows
+
+
+def write_combination_master_to_sheet(combo_master: dict) -> None:
+    """組み合わせマスターdictをstone_combinationsシートに書き込む（全上書き）"""
+    ws = _get_worksheet(STONE_COMBO_SHEET_NAME)
+    rows = combination_master_rows(combo_master)
     ws.clear()
     ws.update("A1", rows, value_input_option="USER_ENTERED")
     _invalidate_cache(STONE_COMBO_SHEET_NAME)
@@ -675,41 +1297,43 @@ def write_combination_master_to_sheet(combo_master: dict) -> None:
 def get_product_master_from_sheet() -> dict | None:
     """product_masterシートから商品マスターを読み込む。キーはproduct_id文字列。"""
     try:
-        import json as _json
-        ws = _get_worksheet(PRODUCT_MASTER_SHEET_NAME)
-        rows = ws.get_all_records()
-        if not rows:
-            return None
-        result = {}
-        for r in rows:
-            pid = str(r.get("product_id", "")).strip()
-            if not pid:
-                continue
-            parts_raw = r.get("parts_json", "[]")
-            try:
-                parts = _json.loads(parts_raw) if parts_raw else []
-            except Exception:
-                parts = []
-            result[pid] = {
-                "woo_product_id": int(r.get("woo_product_id", 0)) if r.get("woo_product_id") else 0,
-                "sku":            str(r.get("sku", "")),
-                "parts":          parts,
-                "gender_mode":    str(r.get("gender_mode", "unisex")),
-                "enabled":        _safe_bool(r.get("enabled", True)),
-                "priority_weight": _safe_float(r.get("priority_weight", 1.0), 1.0),
-                "product_url":    str(r.get("product_url", "")),
-            }
-        logger.info("商品マスターをシートから読み込みました: %d件", len(result))
-        return result if result else None
+        return parse_product_master(_get_all_records(PRODUCT_MASTER_SHEET_NAME))
     except Exception as e:
         logger.warning("商品マスターシート読み込みエラー: %s", e)
         return None
 
 
-def write_product_master_to_sheet(product_master: dict) -> None:
-    """商品マスターdictをproduct_masterシートに書き込む（全上書き）"""
+def parse_product_master(rows: list[dict]) -> dict | None:
+    """product_masterシートのレコードを商品マスターdictに変換する。データなしはNone。"""
+    import json as _json
+    if not rows:
+        return None
+    result = {}
+    for r in rows:
+        pid = str(r.get("product_id", "")).strip()
+        if not pid:
+            continue
+        parts_raw = r.get("parts_json", "[]")
+        try:
+            parts = _json.loads(parts_raw) if parts_raw else []
+        except Exception:
+            parts = []
+        result[pid] = {
+            "woo_product_id": int(r.get("woo_product_id", 0)) if r.get("woo_product_id") else 0,
+            "sku":            str(r.get("sku", "")),
+            "parts":          parts,
+            "gender_mode":    str(r.get("gender_mode", "unisex")),
+            "enabled":        _safe_bool(r.get("enabled", True)),
+            "priority_weight": _safe_float(r.get("priority_weight", 1.0), 1.0),
+            "product_url":    str(r.get("product_url", "")),
+        }
+    logger.info("商品マスターをシートから読み込みました: %d件", len(result))
+    return result if result else None
+
+
+def product_master_rows(product_master: dict) -> list[list]:
+    """商品マスターdictをヘッダー行付きの行リストにする"""
     import json as _json
-    ws = _get_worksheet(PRODUCT_MASTER_SHEET_NAME)
     headers = EXPECTED_HEADERS[PRODUCT_MASTER_SHEET_NAME]
     rows = [headers]
     for pid, p in product_master.items():
@@ -723,12 +1347,110 @@ def write_product_master_to_sheet(product_master: dict) -> None:
             p.get("priority_weight", 1.0),
             p.get("product_url", ""),
         ])
+    return rows
+
+
+def write_product_master_to_sheet(product_master: dict) -> None:
+    """商品マスターdictをproduct_masterシートに書き込む（全上書き）"""
+    ws = _get_worksheet(PRODUCT_MASTER_SHEET_NAME)
+    rows = product_master_rows(product_master)
     ws.clear()
     ws.update("A1", rows, value_input_option="USER_ENTERED")
     _invalidate_cache(PRODUCT_MASTER_SHEET_NAME)
     logger.info("商品マスターをシートに書き込みました: %d件", len(product_master))
 
 
+# ----- 一括読み込み（コールドスタート対策） -----
+
+# シート名 → レコードのパーサー。シート名は各マスターの SheetCache の名前と同じ
+_MASTER_PARSERS = {
+    STONE_MASTER_SHEET_NAME:   parse_stone_master,
+    STONE_COMBO_SHEET_NAME:    parse_combination_master,
+    PRODUCT_MASTER_SHEET_NAME: parse_product_master,
+}
+
+
+def _records_from_values(values: list[list]) -> list[dict]:
+    """1行目をヘッダーとして get_all_records と同じ形式（数値らしい値は数値）のレコードにする"""
+    if not values:
+        return []
+    headers = values[0]
+    return [
+        dict(zip(headers, numericise_all(row + [""] * (len(headers) - len(row)))))
+        for row in values[1:]
+    ]
+
+
+def _stale_warm_ranges() -> list[str]:
+    """一括読み込みで読むべき（キャッシュが未設定・期限切れの）シート名"""
+    # SheetCache を登録させるため各マスターモジュールを読み込んでおく
+    import api.stone_master  # noqa: F401
+    import api.stone_combination_master  # noqa: F401
+    import api.product_master  # noqa: F401
+    from api.cache import get_sheet_cache
+
+    names = []
+    for name in _MASTER_PARSERS:
+        cache = get_sheet_cache(name)
+        if cache is not None and cache.get() is None:
+            names.append(name)
+    if _config_cache["config"] is None or time.time() >= _config_cache["expires"]:
+        names.append(CONFIG_SHEET_NAME)
+    return names
+
+
+def needs_warm_up() -> bool:
+    """warm_master_caches で読み込むものがあればTrue（レプリカ有効時は常にFalse）"""
+    return sheet_replica.get_replica() is None and bool(_stale_warm_ranges())
+
+
+def warm_master_caches() -> bool:
+    """石・組み合わせ・商品マスターとconfigのうち期限切れのものを values.batchGet 1回で読み、各キャッシュを埋める
+
+    有効なキャッシュは読み直さない（データの同一性が変わると商品インデックス等が作り直されるため）。
+    全キャッシュが有効なら何もしない。レプリカ有効時は読み込みがローカルで済むので行わない。
+    失敗しても例外は出さず、各ローダーの個別読み込みに任せる。読み込んだらTrue。
+    """
+    from api.cache import get_sheet_cache
+
+    if sheet_replica.get_replica() is not None:
+        return False
+    names = _stale_warm_ranges()
+    if not names:
+        return False
+
+    try:
+        start = time.time()
+        response = _get_spreadsheet().values_batch_get(["'{}'".format(n) for n in names])
+        value_ranges = response.get("valueRanges", [])
+        if len(value_ranges) != len(names):
+            raise ValueError(f"valueRanges の件数が一致しません: {len(value_ranges)}")
+    except Exception as e:
+        logger.warning("マスター・config一括読み込みエラー（個別に読み込みます）: %s", e)
+        return False
+
+    records = {name: _records_from_values(vr.get("values", [])) for name, vr in zip(names, value_ranges)}
+    for name, parse in _MASTER_PARSERS.items():
+        if name not in records:
+            continue
+        try:
+            data = parse(records[name])
+        except Exception as e:
+            logger.warning("マスター一括読み込みの変換エラー (%s): %s", name, e)
+            continue
+        if data:
+            get_sheet_cache(name).set(data)
+    if CONFIG_SHEET_NAME in records:
+        with _config_lock:
+            _config_cache.update({
+                "config": parse_config(records[CONFIG_SHEET_NAME]),
+                "expires": time.time() + CONFIG_CACHE_TTL,
+            })
+    logger.info("マスター・configを一括読み込みしました: %s (%.0fms)",
+                ", ".join(names), (time.time() - start) * 1000)
+    return True
+
+
 # ===== マスターCRUD（1件操作） =====
 
 def upsert_stone(stone_id: str, stone_data: dict) -> None:
@@ -841,8 +1563,12 @@ def delete_combination(stone_id_a: str, stone_id_b: str) -> bool:
 def generate_external_product_id() -> str:
     """外部商品用のXプレフィックスIDを発番する（例: X001）"""
     ws = _get_worksheet(PRODUCT_MASTER_SHEET_NAME)
-    ids = ws.col_values(1)
-    external_ids = [i for i in ids[1:] if str(i).startswith("X")]
+    return next_external_product_id(ws.col_values(1)[1:])
+
+
+def next_external_product_id(ids: list) -> str:
+    """既存の商品IDから次のXプレフィックスIDを求める"""
+    external_ids = [i for i in ids if str(i).startswith("X")]
     if not external_ids:
         return "X001"
     nums = []
@@ -18,7 +18,7 @@ import hashlib
 import base64
 import logging
 from flask import request, jsonify
-from api.utils_sheet import add_order, get_diagnosis, mark_purchased
+from api.storage import add_order, get_diagnosis, mark_purchased
 from api.utils_line import push_line
 from api.utils_mail import send_order_mail
 
@@ -0,0 +1,246 @@
+"""マッチングエンジンのマイクロベンチマーク
+
+合成した石・組み合わせ・商品マスター（商品10〜10,000件）で
+recommend_products / _calc_product_profile / _score_product の所要時間を計測し、
+実行ごとに比較できるようJSONファイルに書き出す。
+
+configシートとマスターのシート読み込みはメモリ上のダミーに差し替え、Google Sheetsには接続しない。
+インデックス構築時間を測るため、/tmp のスナップショットは使わない。
+pytestの収集対象外（ファイル名が test_ で始まらない）。
+
+使い方:
+    python -m tests.bench_matching
+    python -m tests.bench_matching --sizes 10 100 --repeat 50 --output bench.json
+"""
+
+import argparse
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import numpy as np
+
+from api.matching import (
+    recommend_products,
+    build_user_profile,
+    invalidate_recommendation_cache,
+    _calc_product_profile,
+    _score_product,
+    get_score_weights,
+    ELEMENT_KEYS,
+    AURA_KEYS,
+)
+from api.matching_index import get_product_index, invalidate_product_index
+from api.stone_master import invalidate_stone_master_cache
+from api.stone_combination_master import invalidate_combination_master_cache
+from api.product_master import invalidate_product_master_cache
+from api.diagnose import CONCERN_THEME_MAP, CONCERN_WORRY_MAP
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_OUTPUT = "bench_matching.json"
+
+# 商品構成（役割, サイズ）。先頭から石数分を使う
+PART_LAYOUT = [("main", 12), ("sub", 10), ("sub", 10), ("round", 8), ("round", 8)]
+
+# ユーザー側のタグと一致させるため、悩みカテゴリのタグを語彙に含める
+THEME_POOL = sorted({t for tags in CONCERN_THEME_MAP.values() for t in tags}) + [f"テーマ{i}" for i in range(40)]
+WORRY_POOL = sorted({t for tags in CONCERN_WORRY_MAP.values() for t in tags}) + [f"悩み{i}" for i in range(40)]
+
+
+# ===== 合成マスター =====
+
+def _random_profile(rng: random.Random, keys: list[str]) -> dict[str, float]:
+    return {k: round(rng.random(), 2) for k in keys}
+
+
+def build_synthetic_masters(product_count: int, seed: int = 0) -> tuple[dict, dict, dict]:
+    """商品数に応じた規模の (石, 組み合わせ, 商品) マスターを生成する"""
+    rng = random.Random(seed)
+    stone_count = min(300, max(20, product_count // 20))
+    stones = {}
+    for i in range(stone_count):
+        stones[f"s{i:03d}"] = {
+            "stone_name": f"合成石{i}",
+            "element_profile": _random_profile(rng, ELEMENT_KEYS),
+            "aura_profile": _random_profile(rng, AURA_KEYS),
+            "color_tags": [rng.choice(["clear", "white", "pink", "purple", "blue", "green", "black"])],
+            "theme_tags": rng.sample(THEME_POOL, 4),
+            "worry_tags": rng.sample(WORRY_POOL, 3),
+            "weight": rng.choice([0.9, 1.0, 1.1]),
+        }
+
+    stone_ids = list(stones)
+    combos = {}
+    while len(combos) < stone_count * 3:
+        a, b = rng.sample(stone_ids, 2)
+        combos[frozenset({a, b})] = {
+            "theme_tags": rng.sample(THEME_POOL, 2),
+            "worry_tags": rng.sample(WORRY_POOL, 2),
+            "element_bonus": {rng.choice(ELEMENT_KEYS): 0.1},
+            "aura_bonus": {rng.choice(AURA_KEYS): 0.15},
+            "meaning": "",
+            "weight": 1.0,
+        }
+
+    products = {}
+    for i in range(product_count):
+        layout = PART_LAYOUT[:rng.randint(3, len(PART_LAYOUT))]
+        chosen = rng.sample(stone_ids, len(layout))
+        products[f"B{i:05d}"] = {
+            "woo_product_id": 100000 + i,
+            "sku": f"bench-{i}",
+            "parts": [
+                {"stone_id": sid, "role": role, "size": size}
+                for sid, (role, size) in zip(chosen, layout)
+            ],
+            "gender_mode": rng.choice(["unisex", "female", "male"]),
+            "enabled": rng.random() > 0.05,
+            "priority_weight": rng.choice([0.9, 1.0, 1.1]),
+        }
+    return stones, combos, products
+
+
+def build_synthetic_profiles(count: int, seed: int = 1) -> list[dict]:
+    """ばらつきのあるユーザープロファイルを生成する（推薦キャッシュに当たらないよう全て異なる）"""
+    rng = random.Random(seed)
+    concerns = list(CONCERN_THEME_MAP)
+    profiles = []
+    for _ in range(count):
+        picked = rng.sample(concerns, rng.randint(0, 3))
+        profiles.append(build_user_profile(
+            element_lack=_random_profile(rng, ELEMENT_KEYS),
+            aura_need=_random_profile(rng, AURA_KEYS),
+            theme_tags=[t for c in picked for t in CONCERN_THEME_MAP[c]],
+            worry_tags=[t for c in picked for t in CONCERN_WORRY_MAP[c]],
+        ))
+    return profiles
+
+
+def _invalidate_all() -> None:
+    invalidate_stone_master_cache()
+    invalidate_combination_master_cache()
+    invalidate_product_master_cache()
+    invalidate_product_index()
+    invalidate_recommendation_cache()
+
+
+# ===== 計測 =====
+
+def _summarize(name: str, product_count: int, samples: list[float], **extra) -> dict:
+    """秒単位の計測値をミリ秒の統計値にまとめる"""
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "name": name,
+        "products": product_count,
+        "calls": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 4),
+        "median_ms": round(statistics.median(ms), 4),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 4),
+        "min_ms": round(ms[0], 4),
+        "max_ms": round(ms[-1], 4),
+        **extra,
+    }
+
+
+def bench_catalog(product_count: int, repeat: int, config: dict) -> list[dict]:
+    """商品数1パターン分のベンチマークを実行する"""
+    stones, combos, products = build_synthetic_masters(product_count)
+    profiles = build_synthetic_profiles(repeat)
+    meta = {"stones": len(stones), "combinations": len(combos)}
+    results = []
+
+    with patch('api.utils_sheet.get_config', return_value=config), \
+         patch('api.utils_sheet.get_stone_master_from_sheet', return_value=stones), \
+         patch('api.utils_sheet.get_combination_master_from_sheet', return_value=combos), \
+         patch('api.utils_sheet.get_product_master_from_sheet', return_value=products), \
+         patch('api.matching_index._SNAPSHOT_DIR', ""):
+        _invalidate_all()
+        try:
+            start = time.perf_counter()
+            get_product_index()
+            results.append(_summarize("build_product_index", product_count,
+                                      [time.perf_counter() - start], **meta))
+
+            samples = []
+            for profile in profiles:
+                start = time.perf_counter()
+                recommend_products(profile, top_n=3)
+                samples.append(time.perf_counter() - start)
+            results.append(_summarize("recommend_products", product_count, samples, **meta))
+
+            # 商品プロファイル計算・単品スコアは最大 repeat 件の商品を対象にする
+            sample_products = list(products.values())[:repeat]
+            samples = []
+            product_profiles = []
+            for product in sample_products:
+                start = time.perf_counter()
+                product_profiles.append(_calc_product_profile(product, stones, combos))
+                samples.append(time.perf_counter() - start)
+            results.append(_summarize("_calc_product_profile", product_count, samples, **meta))
+
+            weights = get_score_weights()
+            samples = []
+            for profile, product_profile in zip(profiles, product_profiles):
+                start = time.perf_counter()
+                _score_product(profile, product_profile, weights)
+                samples.append(time.perf_counter() - start)
+            results.append(_summarize("_score_product", product_count, samples, **meta))
+        finally:
+            _invalidate_all()
+
+    return results
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def run(sizes: list[int], repeat: int, config: dict | None = None) -> dict:
+    """全サイズのベンチマークを実行して結果dictを返す"""
+    config = config or {}
+    results = []
+    for size in sizes:
+        results.extend(bench_catalog(size, repeat, config))
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "repeat": repeat,
+        "config": config,
+        "results": results,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="マッチングエンジンのマイクロベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="商品数")
+    parser.add_argument("--repeat", type=int, default=200, help="関数ごとの呼び出し回数")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="結果JSONの出力先")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    report = run(args.sizes, args.repeat)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for r in report["results"]:
+        print(f"{r['name']:<24} products={r['products']:>6}  "
+              f"median={r['median_ms']:.3f}ms  p95={r['p95_ms']:.3f}ms")
+    print(f"結果を書き出しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
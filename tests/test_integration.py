@@ -62,6 +62,16 @@ class TestProfileEndpoint:
         resp = client.post('/api/profile', json={"gender": "女性"})
         assert resp.status_code == 400
 
+    @patch('api.index.get_profile')
+    @patch('api.index.upsert_profile')
+    def test_post_returns_written_profile(self, mock_upsert, mock_get, client):
+        """POSTは書き込んだプロフィールをそのまま返す（読み直さない）"""
+        mock_upsert.return_value = {"user_id": "test123", "gender": "女性"}
+        resp = client.post('/api/profile', json={"user_id": "test123", "gender": "女性"})
+        assert resp.status_code == 200
+        assert resp.get_json()["gender"] == "女性"
+        mock_get.assert_not_called()
+
 
 class TestFortuneDetailEndpoint:
     """診断結果詳細API"""
@@ -0,0 +1,591 @@
+"""マッチングエンジンの単体テスト
+
+マスターデータはハードコード版、configは空dictを使い、Google Sheetsには接続しない。
+"""
+
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from api import matching_index
+from api.matching import (
+    recommend_products,
+    recommend_products_batch,
+    invalidate_recommendation_cache,
+    get_recommendation_cache_stats,
+    build_scoring_context,
+    build_user_profile,
+    _calc_product_profile,
+    _combine_scores,
+    _score_product,
+    _cosine_similarity,
+    _tag_overlap_score,
+    _unit_vector,
+    ELEMENT_KEYS,
+    AURA_KEYS,
+)
+from api.matching_index import get_product_index, invalidate_product_index
+from api.product_master import PRODUCT_MASTER
+from api.stone_master import STONE_MASTER
+from api.stone_combination_master import STONE_COMBINATION_MASTER
+
+
+@pytest.fixture(autouse=True)
+def hardcoded_masters():
+    """シート読み込みを無効化し、テストごとにインデックスと推薦キャッシュを作り直す"""
+    with patch('api.utils_sheet.get_config', return_value={}), \
+         patch('api.utils_sheet.get_stone_master_from_sheet', return_value=None), \
+         patch('api.utils_sheet.get_combination_master_from_sheet', return_value=None), \
+         patch('api.utils_sheet.get_product_master_from_sheet', return_value=None), \
+         patch('api.matching_index._SNAPSHOT_DIR', ""):
+        invalidate_product_index()
+        invalidate_recommendation_cache()
+        yield
+        invalidate_product_index()
+        invalidate_recommendation_cache()
+
+
+def _profile(concern_tags=("直感",), worry_tags=("迷い",)):
+    return build_user_profile(
+        element_lack={"fire": 0.8, "earth": 0.6, "air": 0.2, "water": 0.4},
+        aura_need={"vitality": 0.8, "courage": 0.7, "expression": 0.6},
+        theme_tags=list(concern_tags),
+        worry_tags=list(worry_tags),
+    )
+
+
+class TestProductIndex:
+    """get_product_index: コンパイル済み商品インデックス"""
+
+    def test_covers_all_products(self):
+        index = get_product_index()
+        assert len(index) == len(PRODUCT_MASTER)
+        assert set(index.by_id) == set(PRODUCT_MASTER)
+
+    def test_reused_while_masters_unchanged(self):
+        assert get_product_index() is get_product_index()
+
+    def test_profile_matches_direct_calculation(self):
+        index = get_product_index()
+        for pid, product in PRODUCT_MASTER.items():
+            expected = _calc_product_profile(product, STONE_MASTER, STONE_COMBINATION_MASTER)
+            assert index.by_id[pid]["profile"] == expected
+
+    def test_rebuilt_when_master_content_changes(self):
+        before = get_product_index()
+        changed = dict(PRODUCT_MASTER)
+        changed["X001"] = dict(PRODUCT_MASTER["1203"], sku="external-test")
+        with patch('api.matching_index.get_product_master_data', return_value=changed):
+            after = get_product_index()
+        assert after is not before
+        assert after.version != before.version
+        assert "X001" in after.by_id
+
+    def test_same_content_reload_keeps_index(self):
+        """キャッシュ期限切れで同内容を再読み込みしても再構築しない"""
+        before = get_product_index()
+        reloaded = {k: dict(v) for k, v in PRODUCT_MASTER.items()}
+        with patch('api.matching_index.get_product_master_data', return_value=reloaded), \
+             patch.object(matching_index, '_compile') as mock_compile:
+            after = get_product_index()
+        mock_compile.assert_not_called()
+        assert after is before
+
+
+class TestScoreMatrix:
+    """element_matrix / aura_matrix: 行列演算によるコサイン類似度"""
+
+    def test_matches_dict_cosine_similarity(self):
+        user = _profile()
+        index = get_product_index()
+        e_scores = index.element_matrix @ _unit_vector(user["element"], ELEMENT_KEYS)
+        a_scores = index.aura_matrix @ _unit_vector(user["aura"], AURA_KEYS)
+        for i, entry in enumerate(index.entries):
+            profile = entry["profile"]
+            assert e_scores[i] == pytest.approx(_cosine_similarity(user["element"], profile["element"]))
+            assert a_scores[i] == pytest.approx(_cosine_similarity(user["aura"], profile["aura"]))
+
+    def test_zero_user_vector_scores_zero(self):
+        index = get_product_index()
+        zero = _unit_vector({k: 0.0 for k in ELEMENT_KEYS}, ELEMENT_KEYS)
+        assert not (index.element_matrix @ zero).any()
+
+    def test_half_boundary_rounds_like_score_product(self):
+        """.x5 の境界でも行列側の合計が _score_product と同じ値に丸まる"""
+        weights = {"element": 1.0, "aura": 0.0, "theme": 0.0, "worry": 0.0}
+        # ×100 がそれぞれ 44.45 / 72.65 / 0.35 / 0.15 付近になる（44.45 などは np.round だと逆側に丸まる）
+        values = np.array([0.4445, 0.7265, 0.0035, 0.0015])
+        zeros = np.zeros(len(values))
+        totals = _combine_scores(values, zeros, zeros, zeros, weights, np.ones(len(values)))
+        user = _profile()
+        for value, total in zip(values, totals):
+            with patch('api.matching._cosine_similarity', side_effect=[float(value), 0.0]), \
+                 patch('api.matching._tag_overlap_score', return_value=0.0):
+                expected = _score_product(user, user, weights)["total"]
+            assert total == expected
+
+
+class TestTagBits:
+    """theme_bits / worry_bits: タグ語彙とビットセットによる一致率"""
+
+    def test_overlap_matches_set_intersection(self):
+        index = get_product_index()
+        user_tags = ["直感", "金運", "調和", "語彙にないタグ", "直感"]
+        bits, count = index.encode_tags(user_tags)
+        assert count == 4
+        overlaps = np.bitwise_count(index.theme_bits & bits).sum(axis=1) / count
+        for i, entry in enumerate(index.entries):
+            expected = _tag_overlap_score(user_tags, entry["profile"]["theme_tags"])
+            assert overlaps[i] == pytest.approx(expected)
+
+    def test_user_side_tags_interned(self):
+        """診断側のタグ変換表のタグも語彙に含まれる"""
+        from api.diagnose import CONCERN_WORRY_MAP
+        index = get_product_index()
+        for tags in CONCERN_WORRY_MAP.values():
+            assert all(tag in index.vocab for tag in tags)
+
+    def test_matched_tags_keeps_user_order(self):
+        index = get_product_index()
+        entry = index.by_id["1203"]
+        row = index.entries.index(entry)
+        product_tags = entry["profile"]["theme_tags"]
+        user_tags = list(reversed(product_tags)) + ["語彙にないタグ"]
+        assert index.matched_tags(user_tags, index.theme_bits[row]) == list(reversed(product_tags))
+
+
+class TestScoringContext:
+    """build_scoring_context: リクエスト単位の設定スナップショット"""
+
+    def test_reads_config_once_per_recommendation(self):
+        with patch('api.utils_sheet.get_config', return_value={}) as mock_config:
+            recommend_products(_profile(), top_n=3)
+        assert mock_config.call_count == 1
+
+    def test_explicit_config_skips_sheet(self):
+        with patch('api.utils_sheet.get_config') as mock_config:
+            build_scoring_context({})
+        mock_config.assert_not_called()
+
+    def test_weights_normalised(self):
+        ctx = build_scoring_context({"score_weight_element": "2", "score_weight_aura": "0",
+                                     "score_weight_theme": "1", "score_weight_worry": "1"})
+        assert sum(ctx.weights.values()) == pytest.approx(1.0)
+        assert ctx.weights["element"] == pytest.approx(0.5)
+
+    def test_overrides_applied(self):
+        ctx = build_scoring_context({"product_1203_enabled": "false", "product_1204_priority": "1.3"})
+        rows = {e["product_id"]: i for i, e in enumerate(ctx.index.entries)}
+        assert not ctx.enabled[rows["1203"]]
+        assert ctx.priority[rows["1204"]] == pytest.approx(1.3)
+        # 元の商品マスターは書き換えない
+        assert PRODUCT_MASTER["1203"]["enabled"] is True
+
+
+class TestRecommendProducts:
+    """recommend_products: 上位N件の推薦"""
+
+    def test_returns_ranked_top_n(self):
+        result = recommend_products(_profile(), top_n=3)
+        assert [r["rank"] for r in result] == [1, 2, 3]
+        scores = [r["score"] for r in result]
+        assert scores == sorted(scores, reverse=True)
+
+    def test_result_fields(self):
+        item = recommend_products(_profile(), top_n=1)[0]
+        for key in ["score", "score_breakdown", "woo_product_id", "sku",
+                    "recommendation_reason", "stones", "stone_colors"]:
+            assert key in item
+        assert len(item["stones"]) == len(item["stone_colors"])
+
+    def test_disabled_by_config(self):
+        top = recommend_products(_profile(), top_n=1)[0]
+        pid = str(top["woo_product_id"])
+        cfg = {f"product_{pid}_enabled": "false"}
+        with patch('api.utils_sheet.get_config', return_value=cfg):
+            result = recommend_products(_profile(), top_n=len(PRODUCT_MASTER))
+        assert top["sku"] not in [r["sku"] for r in result]
+
+    def test_top_n_is_prefix_of_full_ranking(self):
+        full = recommend_products(_profile(), top_n=len(PRODUCT_MASTER))
+        top = recommend_products(_profile(), top_n=3)
+        assert [r["sku"] for r in top] == [r["sku"] for r in full[:3]]
+
+    def test_only_winners_are_decorated(self):
+        from api import matching
+        with patch.object(matching, '_decorate', wraps=matching._decorate) as mock_decorate:
+            recommend_products(_profile(), top_n=2)
+        assert mock_decorate.call_count == 2
+
+
+class TestRecommendProductsBatch:
+    """recommend_products_batch: 複数プロファイルの一括推薦"""
+
+    def _profiles(self):
+        from api.diagnose import _build_user_profile_from_chart
+        profiles = []
+        for fire in range(4):
+            for concerns in (["恋愛"], ["仕事", "金運"], []):
+                chart = {"element_balance": {"fire": fire, "earth": 2, "wind": 3 - fire % 2, "water": 1}}
+                profiles.append(_build_user_profile_from_chart(chart, concerns, "お金が不安"))
+        return profiles
+
+    def test_matches_single_recommendation(self):
+        profiles = self._profiles()
+        batch = recommend_products_batch(profiles, top_n=3)
+        assert len(batch) == len(profiles)
+        for profile, result in zip(profiles, batch):
+            assert result == recommend_products(profile, top_n=3)
+
+    def test_chunked_scoring_matches(self):
+        from api import matching
+        profiles = self._profiles()
+        expected = recommend_products_batch(profiles, top_n=3)
+        with patch.object(matching, 'BATCH_MAX_CELLS', 1):
+            assert recommend_products_batch(profiles, top_n=3) == expected
+
+    def test_reads_config_once(self):
+        with patch('api.utils_sheet.get_config', return_value={}) as mock_config:
+            recommend_products_batch(self._profiles(), top_n=3)
+        assert mock_config.call_count == 1
+
+    def test_skips_disabled_products(self):
+        cfg = {f"product_{pid}_enabled": "false" for pid in list(PRODUCT_MASTER)[1:]}
+        with patch('api.utils_sheet.get_config', return_value=cfg):
+            result = recommend_products_batch(self._profiles()[:2], top_n=3)
+        assert all(len(r) == 1 for r in result)
+
+    def test_empty(self):
+        assert recommend_products_batch([]) == []
+
+
+def _synthetic_products(count: int) -> dict:
+    """ハードコードの石を組み合わせた合成商品マスター"""
+    import random
+    rng = random.Random(42)
+    stone_ids = list(STONE_MASTER)
+    products = {}
+    for i in range(count):
+        main, sub, round_ = rng.sample(stone_ids, 3)
+        products[f"X{i:03d}"] = {
+            "woo_product_id": 5000 + i,
+            "sku": f"synthetic-{i}",
+            "parts": [
+                {"stone_id": main,   "role": "main",  "size": 12},
+                {"stone_id": sub,    "role": "sub",   "size": 10},
+                {"stone_id": round_, "role": "round", "size": 8},
+            ],
+            "gender_mode": "unisex",
+            "enabled": True,
+            "priority_weight": rng.choice([0.9, 1.0, 1.1]),
+        }
+    return products
+
+
+class TestCandidatePruning:
+    """上限値による枝刈り: 結果は全件計算と一致する"""
+
+    @pytest.fixture
+    def large_catalog(self):
+        with patch('api.matching_index.get_product_master_data', return_value=_synthetic_products(300)):
+            yield
+
+    def _brute_force(self, profile, top_n):
+        from api.matching import _score_all, _select_top_rows
+        ctx = build_scoring_context({})
+        scores = _score_all(profile, ctx)
+        rows = _select_top_rows(scores.total, ctx.enabled, top_n)
+        return [ctx.products[r]["sku"] for r in rows], [float(scores.total[r]) for r in rows]
+
+    def test_matches_brute_force(self, large_catalog):
+        from api.diagnose import _build_user_profile_from_chart
+        for fire in range(5):
+            for concerns in (["恋愛"], ["仕事", "健康"], []):
+                chart = {"element_balance": {"fire": fire, "earth": 1, "wind": 2, "water": 3}}
+                profile = _build_user_profile_from_chart(chart, concerns)
+                for top_n in (1, 3, 10):
+                    result = recommend_products(profile, top_n=top_n)
+                    skus, scores = self._brute_force(profile, top_n)
+                    assert [r["sku"] for r in result] == skus
+                    assert [r["score"] for r in result] == scores
+
+    def test_counts_pruned_products(self, large_catalog):
+        from api.matching import get_pruning_stats
+        before = get_pruning_stats()
+        recommend_products(_profile(), top_n=3)
+        after = get_pruning_stats()
+        assert after["requests"] == before["requests"] + 1
+        assert after["candidates"] - before["candidates"] == 300
+        assert after["pruned"] > before["pruned"]
+
+    def test_negative_weight_still_exact(self, large_catalog):
+        cfg = {"score_weight_theme": "-0.2"}
+        with patch('api.utils_sheet.get_config', return_value=cfg):
+            result = recommend_products(_profile(), top_n=5)
+            from api.matching import _score_all, _select_top_rows
+            ctx = build_scoring_context()
+            scores = _score_all(_profile(), ctx)
+            rows = _select_top_rows(scores.total, ctx.enabled, 5)
+        assert [r["sku"] for r in result] == [ctx.products[r]["sku"] for r in rows]
+
+
+class TestCombinationAdjacency:
+    """組み合わせマスターの隣接インデックス"""
+
+    def test_symmetric_lookup_matches_master(self):
+        from api.stone_combination_master import get_combination_effect
+        for key, effect in STONE_COMBINATION_MASTER.items():
+            a, b = sorted(key)
+            assert get_combination_effect(a, b) is effect
+            assert get_combination_effect(b, a) is effect
+        assert get_combination_effect("lapis_lazuli", "carnelian") is None
+
+    def test_built_once_per_master(self):
+        from api.stone_combination_master import get_combination_adjacency
+        assert get_combination_adjacency() is get_combination_adjacency()
+        other = {frozenset({"crystal", "onyx"}): STONE_COMBINATION_MASTER[frozenset({"lapis_lazuli", "crystal"})]}
+        rebuilt = get_combination_adjacency(other)
+        assert set(rebuilt) == {"crystal", "onyx"}
+
+    def test_affected_products(self):
+        from api.matching_index import get_products_affected_by_combination
+        affected = get_products_affected_by_combination("crystal", "amethyst")
+        assert set(affected) == {"1206", "1207", "1210"}
+        assert get_products_affected_by_combination("amethyst", "crystal") == affected
+        assert get_products_affected_by_combination("garnet", "onyx") == []
+
+
+class TestRecommendationCache:
+    """推薦結果のLRUキャッシュ"""
+
+    def test_repeat_profile_skips_scoring(self):
+        from api import matching
+        first = recommend_products(_profile(), top_n=3)
+        with patch.object(matching, '_score_with_pruning') as mock_score:
+            second = recommend_products(_profile(), top_n=3)
+        mock_score.assert_not_called()
+        assert second == first
+        assert get_recommendation_cache_stats()["hits"] >= 1
+
+    def test_returned_results_are_copies(self):
+        first = recommend_products(_profile(), top_n=3)
+        first[0]["stones"].append("改変")
+        assert "改変" not in recommend_products(_profile(), top_n=3)[0]["stones"]
+
+    def test_config_change_misses(self):
+        recommend_products(_profile(), top_n=3)
+        top = recommend_products(_profile(), top_n=1)[0]
+        cfg = {f"product_{top['woo_product_id']}_enabled": "false"}
+        with patch('api.utils_sheet.get_config', return_value=cfg):
+            result = recommend_products(_profile(), top_n=1)
+        assert result[0]["sku"] != top["sku"]
+
+    def test_tag_order_is_part_of_key(self):
+        recommend_products(_profile(concern_tags=("直感", "真実")), top_n=3)
+        before = get_recommendation_cache_stats()["misses"]
+        recommend_products(_profile(concern_tags=("真実", "直感")), top_n=3)
+        assert get_recommendation_cache_stats()["misses"] == before + 1
+
+
+class TestRecommendationTable:
+    """build_recommendation_table / lookup_recommendation_table: 事前計算テーブル"""
+
+    def _profiles(self):
+        return {
+            "a": _profile(),
+            "b": _profile(concern_tags=("愛情", "調和"), worry_tags=("恋愛",)),
+            "c": _profile(concern_tags=(), worry_tags=()),
+        }
+
+    def test_lookup_matches_live_scoring(self):
+        from api.matching import build_recommendation_table, lookup_recommendation_table
+        context = build_scoring_context()
+        profiles = self._profiles()
+        table = build_recommendation_table(profiles, top_n=3, context=context)
+        for key, profile in profiles.items():
+            assert lookup_recommendation_table(table, key, profile, context) == \
+                recommend_products(profile, top_n=3, context=context)
+
+    def test_unknown_key_or_stale_version_returns_none(self):
+        from api.matching import build_recommendation_table, lookup_recommendation_table
+        context = build_scoring_context()
+        table = build_recommendation_table(self._profiles(), top_n=3, context=context)
+        assert lookup_recommendation_table(table, "z", _profile(), context) is None
+        assert lookup_recommendation_table(table, "a", _profile(), context, top_n=4) is None
+        with patch('api.utils_sheet.get_config', return_value={"score_weight_element": "0.9"}):
+            changed = build_scoring_context()
+        assert lookup_recommendation_table(table, "a", _profile(), changed) is None
+
+    def test_diagnose_uses_table_unless_problem_adds_tags(self):
+        import threading
+        from api import diagnose
+        from api.matching import build_recommendation_table as build
+        building = threading.Event()
+
+        def slow_build(*args, **kwargs):
+            building.wait()
+            return build(*args, **kwargs)
+        chart_info = {"fire": 1, "earth": 1, "wind": 2, "water": 2}
+        concerns = ["仕事", "恋愛"]
+        diagnose._recommendation_tables.clear()
+        with patch.object(diagnose, "PRECOMPUTE_RECOMMENDATIONS", True):
+            profile = diagnose._build_user_profile_from_chart(chart_info, concerns, "転職したい")
+            # テーブルができるまではリクエストを待たせず通常のマッチングを使う
+            with patch.object(diagnose, "build_recommendation_table",
+                              side_effect=slow_build), \
+                 patch.object(diagnose, "recommend_products", return_value=[]) as mock_live:
+                diagnose._recommend_for_chart(chart_info, concerns, "転職したい", profile)
+                mock_live.assert_called_once()
+                threads = list(diagnose._recommendation_builds.values())
+                assert len(threads) == 1
+                building.set()
+                threads[0].join()
+            assert not diagnose._recommendation_builds
+
+            with patch.object(diagnose, "recommend_products") as mock_live:
+                top = diagnose._recommend_for_chart(chart_info, concerns, "転職したい", profile)
+            mock_live.assert_not_called()
+            assert top == recommend_products(profile, top_n=3)
+
+            profile = diagnose._build_user_profile_from_chart(chart_info, concerns, "眠れない")
+            with patch.object(diagnose, "recommend_products", return_value=[]) as mock_live:
+                diagnose._recommend_for_chart(chart_info, concerns, "眠れない", profile)
+            mock_live.assert_called_once()
+        diagnose._recommendation_tables.clear()
+
+
+class TestBenchmarkSuite:
+    """tests/bench_matching: 合成マスターでのベンチマーク"""
+
+    def test_small_run_reports_every_function(self):
+        from tests.bench_matching import run
+        report = run([10], repeat=3)
+        names = {(r["name"], r["products"]) for r in report["results"]}
+        assert names == {
+            ("build_product_index", 10), ("recommend_products", 10),
+            ("_calc_product_profile", 10), ("_score_product", 10),
+        }
+        assert all(r["calls"] >= 1 and r["median_ms"] >= 0 for r in report["results"])
+
+    def test_masters_restored_after_run(self):
+        from tests.bench_matching import run
+        run([10], repeat=1)
+        assert len(get_product_index()) == len(PRODUCT_MASTER)
+
+
+class TestIndexSnapshot:
+    """商品インデックスのディスクスナップショット"""
+
+    @pytest.fixture
+    def snapshot_dir(self, tmp_path):
+        with patch('api.matching_index._SNAPSHOT_DIR', str(tmp_path)):
+            yield tmp_path
+
+    def test_cold_start_loads_snapshot(self, snapshot_dir):
+        built = get_product_index()
+        assert (snapshot_dir / "product_index.npz").exists()
+        expected = recommend_products(_profile(), top_n=3)
+
+        invalidate_product_index()
+        invalidate_recommendation_cache()
+        with patch('api.matching_index._compile') as mock_compile:
+            loaded = get_product_index()
+            result = recommend_products(_profile(), top_n=3)
+        mock_compile.assert_not_called()
+        assert loaded.version == built.version
+        assert loaded.vocab == built.vocab
+        np.testing.assert_array_equal(loaded.element_matrix, built.element_matrix)
+        np.testing.assert_array_equal(loaded.theme_bits, built.theme_bits)
+        assert [e["profile"] for e in loaded.entries] == [e["profile"] for e in built.entries]
+        assert result == expected
+
+    def test_version_mismatch_rebuilds(self, snapshot_dir):
+        from api.matching_index import load_index_snapshot
+        get_product_index()
+        stones, combos, products = get_product_index().sources
+        assert load_index_snapshot("0000000000000000", stones, combos, products) is None
+
+        invalidate_product_index()
+        with patch('api.matching_index.get_product_master_data', return_value=_synthetic_products(5)):
+            index = get_product_index()
+        assert set(index.by_id) == {f"X{i:03d}" for i in range(5)}
+
+    def test_corrupt_snapshot_is_ignored(self, snapshot_dir):
+        (snapshot_dir / "product_index.npz").write_bytes(b"broken")
+        assert len(get_product_index()) == len(PRODUCT_MASTER)
+
+
+def _gendered_products(count: int) -> dict:
+    """gender_mode を male / female / unisex で順に割り当てた合成商品マスター"""
+    products = _synthetic_products(count)
+    for i, product in enumerate(products.values()):
+        product["gender_mode"] = ("male", "female", "unisex")[i % 3]
+    return products
+
+
+class TestGenderPartition:
+    """性別による候補商品の分割"""
+
+    @pytest.fixture
+    def gendered_catalog(self):
+        products = _gendered_products(90)
+        with patch('api.matching_index.get_product_master_data', return_value=products):
+            yield products
+
+    def _modes(self, result, products):
+        by_sku = {p["sku"]: p["gender_mode"] for p in products.values()}
+        return {by_sku[r["sku"]] for r in result}
+
+    def test_normalize_gender(self):
+        from api.product_master import normalize_gender, gender_modes_for
+        assert normalize_gender("女性") == "female"
+        assert normalize_gender("Male") == "male"
+        assert normalize_gender("その他") is None
+        assert normalize_gender(None) is None
+        assert gender_modes_for("男性") == ("male", "unisex")
+        assert set(gender_modes_for("")) == {"male", "female", "unisex"}
+
+    def test_partition_masks(self, gendered_catalog):
+        index = get_product_index()
+        assert int(index.gender_masks["male"].sum()) == 30
+        assert int(index.gender_mask("女性").sum()) == 60
+        assert int(index.gender_mask(None).sum()) == 90
+
+    def test_male_user_gets_no_female_products(self, gendered_catalog):
+        result = recommend_products(_profile(), top_n=20, gender="男性")
+        assert len(result) == 20
+        assert self._modes(result, gendered_catalog) <= {"male", "unisex"}
+
+    def test_partition_matches_filtered_full_ranking(self, gendered_catalog):
+        full = recommend_products(_profile(), top_n=90)
+        female = recommend_products(_profile(), top_n=5, gender="female")
+        expected = [r for r in full if self._modes([r], gendered_catalog) <= {"female", "unisex"}][:5]
+        assert [r["sku"] for r in female] == [r["sku"] for r in expected]
+        assert [r["score"] for r in female] == [r["score"] for r in expected]
+
+    def test_only_partition_is_scored(self, gendered_catalog):
+        from api.matching import get_pruning_stats
+        before = get_pruning_stats()
+        recommend_products(_profile(), top_n=3, gender="male")
+        assert get_pruning_stats()["candidates"] - before["candidates"] == 60
+
+    def test_gender_is_part_of_cache_key(self, gendered_catalog):
+        male = recommend_products(_profile(), top_n=10, gender="male")
+        female = recommend_products(_profile(), top_n=10, gender="female")
+        assert self._modes(female, gendered_catalog) <= {"female", "unisex"}
+        assert male != female
+
+    def test_batch_genders(self, gendered_catalog):
+        profiles = [_profile(), _profile(concern_tags=("愛情",))]
+        genders = ["male", "女性"]
+        batch = recommend_products_batch(profiles, top_n=5, genders=genders)
+        for profile, gender, result in zip(profiles, genders, batch):
+            assert result == recommend_products(profile, top_n=5, gender=gender)
+
+    def test_table_is_per_gender(self, gendered_catalog):
+        from api.matching import build_recommendation_table, lookup_recommendation_table
+        context = build_scoring_context()
+        table = build_recommendation_table({"a": _profile()}, top_n=3, context=context, gender="male")
+        assert lookup_recommendation_table(table, "a", _profile(), context) is None
+        assert lookup_recommendation_table(table, "a", _profile(), context, gender="男性") == \
+            recommend_products(_profile(), top_n=3, context=context, gender="male")
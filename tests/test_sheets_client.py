@@ -0,0 +1,159 @@
+"""Sheets APIクォータ管理付きHTTPクライアントの単体テスト
+
+実際のHTTP通信は行わず、HTTPClient.request と time.sleep をモックする。
+"""
+
+import pytest
+import requests
+from unittest.mock import MagicMock, patch
+from gspread.exceptions import APIError
+
+from api import sheets_client
+from api.sheets_client import (
+    QuotaHTTPClient, TokenBucket, background_retries, backoff_delay, classify_error,
+)
+
+
+def _api_error(code: int) -> APIError:
+    response = MagicMock()
+    response.json.return_value = {"error": {"code": code, "message": f"error {code}"}}
+    return APIError(response)
+
+
+@pytest.fixture
+def http():
+    """認証を行わない QuotaHTTPClient（リクエストはクォータ十分なバケットで計量）"""
+    client = QuotaHTTPClient.__new__(QuotaHTTPClient)
+    client.login = MagicMock()
+    buckets = {"read": TokenBucket("read", 600), "write": TokenBucket("write", 600)}
+    with patch.object(sheets_client, "_buckets", buckets), \
+         patch.object(sheets_client.time, "sleep") as mock_sleep:
+        client.sleep = mock_sleep
+        yield client
+
+
+class TestClassifyError:
+    """エラー分類"""
+
+    @pytest.mark.parametrize("code, kind", [
+        (429, "quota"), (401, "auth"), (500, "transient"), (503, "transient"),
+        (408, "transient"), (400, "fatal"), (403, "fatal"), (404, "fatal"),
+    ])
+    def test_api_error(self, code, kind):
+        assert classify_error(_api_error(code)) == kind
+
+    def test_network_errors_are_transient(self):
+        assert classify_error(requests.ConnectionError()) == "transient"
+        assert classify_error(requests.Timeout()) == "transient"
+        assert classify_error(ValueError()) == "fatal"
+
+
+class TestBackoff:
+    """ジッター付き指数バックオフ"""
+
+    def test_grows_and_is_capped(self):
+        for attempt in range(10):
+            ceiling = min(sheets_client.BACKOFF_MAX, sheets_client.BACKOFF_BASE * 2 ** attempt)
+            assert ceiling / 2 <= backoff_delay(attempt) <= ceiling
+
+
+class TestTokenBucket:
+    """トークンバケット"""
+
+    def test_waits_when_empty(self):
+        bucket = TokenBucket("read", 60)  # 1秒に1トークン
+        with patch.object(sheets_client.time, "sleep") as mock_sleep:
+            for _ in range(60):
+                assert bucket.acquire() == 0.0
+            mock_sleep.side_effect = lambda s: setattr(bucket, "_tokens", bucket._tokens + s * bucket.rate)
+            assert bucket.acquire() > 0
+        usage = bucket.usage()
+        assert usage["used_last_minute"] == 61
+        assert usage["limit_per_minute"] == 60
+        assert usage["waited_ms"] > 0
+
+    def test_gives_up_when_wait_exceeds_deadline(self):
+        bucket = TokenBucket("read", 60)
+        bucket._tokens = 0.0
+        with patch.object(sheets_client.time, "sleep") as mock_sleep:
+            with pytest.raises(TimeoutError):
+                bucket.acquire(sheets_client.time.monotonic() + 0.5)
+        mock_sleep.assert_not_called()
+        assert bucket.acquired == 0
+
+
+class TestQuotaHTTPClient:
+    """リトライとクォータ計量"""
+
+    def test_reads_and_writes_use_separate_buckets(self, http):
+        with patch("gspread.http_client.HTTPClient.request", return_value="ok"):
+            http.request("get", "url")
+            http.request("post", "url")
+            http.request("put", "url")
+        usage = sheets_client.quota_usage()
+        assert usage["read"]["total"] == 1
+        assert usage["write"]["total"] == 2
+
+    def test_quota_error_is_retried_with_backoff(self, http):
+        with patch("gspread.http_client.HTTPClient.request",
+                   side_effect=[_api_error(429), _api_error(503), "ok"]) as mock_request:
+            assert http.request("get", "url") == "ok"
+        assert mock_request.call_count == 3
+        assert http.sleep.call_count == 2
+        http.login.assert_not_called()
+
+    def test_auth_error_refreshes_token_once(self, http):
+        with patch("gspread.http_client.HTTPClient.request",
+                   side_effect=[_api_error(401), "ok"]):
+            assert http.request("get", "url") == "ok"
+        http.login.assert_called_once()
+
+        with patch("gspread.http_client.HTTPClient.request", side_effect=_api_error(401)):
+            with pytest.raises(APIError):
+                http.request("get", "url")
+
+    def test_fatal_error_is_not_retried(self, http):
+        with patch("gspread.http_client.HTTPClient.request",
+                   side_effect=_api_error(400)) as mock_request:
+            with pytest.raises(APIError):
+                http.request("post", "url")
+        assert mock_request.call_count == 1
+        http.sleep.assert_not_called()
+
+    def test_gives_up_after_max_retries(self, http):
+        with patch("gspread.http_client.HTTPClient.request",
+                   side_effect=_api_error(429)) as mock_request:
+            with pytest.raises(APIError):
+                http.request("get", "url")
+        assert mock_request.call_count == sheets_client.MAX_RETRIES + 1
+
+    def test_request_path_stops_at_deadline(self, http):
+        with patch.object(sheets_client, "REQUEST_RETRY_DEADLINE", 1.0), \
+             patch.object(sheets_client, "backoff_delay", side_effect=[0.4, 5.0]), \
+             patch("gspread.http_client.HTTPClient.request",
+                   side_effect=_api_error(503)) as mock_request:
+            with pytest.raises(APIError):
+                http.request("get", "url")
+        # 1回目のリトライは期限内、2回目は期限を超えるのでやめる
+        assert mock_request.call_count == 2
+
+    def test_quota_wait_counts_against_deadline(self, http):
+        bucket = sheets_client._buckets["read"]
+        bucket._tokens = 0.0
+        bucket.rate = 1 / 60  # 次のトークンまで60秒
+        http.sleep.side_effect = lambda s: setattr(bucket, "_tokens", bucket._tokens + s * bucket.rate)
+        with patch.object(sheets_client, "REQUEST_RETRY_DEADLINE", 20.0), \
+             patch("gspread.http_client.HTTPClient.request", return_value="ok") as mock_request:
+            with pytest.raises(TimeoutError):
+                http.request("get", "url")
+            with background_retries():
+                assert http.request("get", "url") == "ok"
+        assert mock_request.call_count == 1
+
+    def test_background_uses_longer_deadline(self):
+        with patch.object(sheets_client, "REQUEST_RETRY_DEADLINE", 20.0), \
+             patch.object(sheets_client, "BACKGROUND_RETRY_DEADLINE", 300.0):
+            assert sheets_client.retry_deadline() == 20.0
+            with background_retries():
+                assert sheets_client.retry_deadline() == 300.0
+            assert sheets_client.retry_deadline() == 20.0
@@ -0,0 +1,196 @@
+"""ストレージバックエンドの単体テスト
+
+memory / sqlite バックエンドは同じテストを通す。sheets バックエンドは api/utils_sheet.py への委譲だけ確認する。
+"""
+
+import pytest
+from unittest.mock import patch
+
+from api import storage
+from api.storage import MemoryStorage, SQLiteStorage, SheetsStorage, get_storage, set_storage
+from api.stone_master import STONE_MASTER
+from api.stone_combination_master import STONE_COMBINATION_MASTER
+from api.product_master import PRODUCT_MASTER
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStorage()
+    return SQLiteStorage(str(tmp_path / "storage.sqlite3"))
+
+
+class TestRowStorage:
+    """memory / sqlite 共通の読み書き"""
+
+    def test_diagnosis_roundtrip(self, backend):
+        backend.add_diagnosis({"diagnosis_id": "d1", "stone_name": "水晶"})
+        backend.update_diagnosis("d1", "水晶×2", "slug-1")
+        backend.mark_purchased("d1")
+        record = backend.get_diagnosis("d1")
+        assert record["stone_name"] == "水晶"
+        assert record["stones"] == "水晶×2"
+        assert record["product_slug"] == "slug-1"
+        assert record["purchased"] == "TRUE"
+        assert backend.get_diagnosis("missing") is None
+        assert backend.get_diagnosis("") is None
+
+    def test_profile_upsert(self, backend):
+        backend.upsert_profile({"user_id": "U1", "gender": "female", "birth": {"date": "1990-01-01"}})
+        backend.upsert_profile({"user_id": "U1", "gender": "female", "wrist_inner_cm": 15.5, "bead_size_mm": 8})
+        profile = backend.get_profile("U1")
+        assert profile["wrist_inner_cm"] == 15.5
+        assert profile["bead_size_mm"] == 8
+        assert profile["birth"]["date"] == ""
+        assert len(backend._records("profiles")) == 1
+        assert backend.get_profile("U2") is None
+
+    def test_config_is_numericised(self, backend):
+        backend.set_config("score_weight_element", "0.4")
+        backend.set_config("mode", "a")
+        backend.set_config("score_weight_element", "0.5")
+        assert backend.get_config() == {"score_weight_element": 0.5, "mode": "a"}
+
+    def test_masters_roundtrip(self, backend):
+        assert backend.get_stone_master() is None
+        backend.write_stone_master(STONE_MASTER)
+        backend.write_combination_master(STONE_COMBINATION_MASTER)
+        backend.write_product_master(PRODUCT_MASTER)
+        stones = backend.get_stone_master()
+        assert set(stones) == set(STONE_MASTER)
+        sid = next(iter(STONE_MASTER))
+        assert stones[sid]["element_profile"] == pytest.approx(STONE_MASTER[sid]["element_profile"])
+        assert set(backend.get_combination_master()) == set(STONE_COMBINATION_MASTER)
+        products = backend.get_product_master()
+        assert set(products) == set(PRODUCT_MASTER)
+        pid = next(iter(PRODUCT_MASTER))
+        assert products[pid]["parts"] == PRODUCT_MASTER[pid]["parts"]
+
+        backend.write_product_master({pid: PRODUCT_MASTER[pid]})
+        assert list(backend.get_product_master()) == [pid]
+
+    def test_master_crud(self, backend):
+        sid = next(iter(STONE_MASTER))
+        backend.upsert_stone(sid, STONE_MASTER[sid])
+        backend.upsert_stone("S-NEW", {"stone_name": "新石", "weight": 2})
+        backend.upsert_stone(sid, {**STONE_MASTER[sid], "stone_name": "改名"})
+        stones = backend.get_stone_master()
+        assert list(stones) == [sid, "S-NEW"]
+        assert stones[sid]["stone_name"] == "改名"
+        assert backend.delete_stone(sid)
+        assert not backend.delete_stone(sid)
+        assert list(backend.get_stone_master()) == ["S-NEW"]
+
+        backend.upsert_combination("b", "a", {"meaning": "旧"})
+        backend.upsert_combination("a", "b", {"meaning": "新"})
+        combos = backend.get_combination_master()
+        assert [c["meaning"] for c in combos.values()] == ["新"]
+        assert backend.delete_combination("b", "a")
+        assert not backend.delete_combination("a", "b")
+
+        assert backend.generate_external_product_id() == "X001"
+        backend.upsert_product("X001", {"sku": "ext"})
+        backend.upsert_product("P1", {"sku": "woo"})
+        assert backend.generate_external_product_id() == "X002"
+        assert not backend.delete_product("P1")
+        assert backend.delete_product("X001")
+        assert list(backend.get_product_master()) == ["P1"]
+
+    def test_logs(self, backend):
+        backend.add_order({"order_id": 1, "diagnosis_id": "d1"})
+        backend.add_bracelet_selection({"selection_id": "s1", "rank": 1})
+        assert backend._records("orders")[0]["order_id"] == "1"
+        assert backend._records("bracelet_selections")[0]["rank"] == "1"
+
+
+class TestSheetsStorage:
+    """sheets バックエンドは api/utils_sheet.py の関数を呼ぶ"""
+
+    def test_delegates(self):
+        backend = SheetsStorage()
+        with patch("api.utils_sheet.get_config", return_value={"a": 1}), \
+             patch("api.utils_sheet.get_stone_master_from_sheet", return_value=None) as mock_stones:
+            assert backend.get_config() == {"a": 1}
+            assert backend.get_stone_master() is None
+        mock_stones.assert_called_once()
+
+
+class TestInterface:
+    """StorageBackend は抽象基底クラス"""
+
+    def test_incomplete_backend_fails_on_creation(self):
+        class Partial(storage._RowStorage):
+            def _append(self, table, row):
+                pass
+
+        with pytest.raises(TypeError):
+            Partial()
+        with pytest.raises(TypeError):
+            storage.StorageBackend()
+
+
+class TestSelection:
+    """STORAGE_BACKEND によるバックエンド選択"""
+
+    @pytest.fixture(autouse=True)
+    def reset(self):
+        set_storage(None)
+        yield
+        set_storage(None)
+
+    def test_default_is_sheets(self):
+        assert isinstance(get_storage(), SheetsStorage)
+
+    def test_memory(self):
+        with patch.object(storage, "STORAGE_BACKEND", "memory"):
+            assert isinstance(get_storage(), MemoryStorage)
+
+    def test_sqlite_requires_explicit_path(self, tmp_path):
+        with patch.object(storage, "STORAGE_BACKEND", "sqlite"), \
+             patch.object(storage, "STORAGE_SQLITE_PATH", ""):
+            with pytest.raises(RuntimeError):
+                get_storage()
+        path = str(tmp_path / "atlas.sqlite3")
+        set_storage(None)
+        with patch.object(storage, "STORAGE_BACKEND", "sqlite"), \
+             patch.object(storage, "STORAGE_SQLITE_PATH", path):
+            assert get_storage().path == path
+
+    def test_warm_up_only_when_sheets_caches_are_cold(self):
+        set_storage(MemoryStorage())
+        assert not storage.needs_warm_up()
+        set_storage(SheetsStorage())
+        with patch("api.utils_sheet.needs_warm_up", return_value=False) as mock_needs:
+            assert not storage.needs_warm_up()
+        mock_needs.assert_called_once()
+
+    def test_unknown_falls_back_to_sheets(self):
+        with patch.object(storage, "STORAGE_BACKEND", "nope"):
+            assert isinstance(get_storage(), SheetsStorage)
+
+    def test_admin_master_edits_go_to_selected_backend(self):
+        from api.index import app
+        backend = MemoryStorage()
+        set_storage(backend)
+        app.config['TESTING'] = True
+        with patch("api.index._check_admin_auth", return_value=True), \
+             patch("api.utils_sheet._get_worksheet", side_effect=AssertionError("Sheets を触らない")), \
+             app.test_client() as client:
+            resp = client.post('/api/admin/stone', json={"stone_id": "S1", "stone_data": {"stone_name": "水晶"}})
+            assert resp.status_code == 200
+            resp = client.post('/api/admin/product', json={"product_data": {"sku": "ext"}})
+            assert resp.get_json()["product_id"] == "X001"
+            assert client.delete('/api/admin/stone/S1').status_code == 200
+        assert backend.get_stone_master() is None
+        assert list(backend.get_product_master()) == ["X001"]
+
+    def test_profile_endpoint_on_memory_backend(self):
+        from api.index import app
+        set_storage(MemoryStorage())
+        app.config['TESTING'] = True
+        with app.test_client() as client:
+            resp = client.post('/api/profile', json={"user_id": "U1", "gender": "male", "wrist_inner_cm": 16})
+            assert resp.status_code == 200
+            assert resp.get_json()["wrist_inner_cm"] == 16.0
+            resp = client.get('/api/profile?user_id=U1')
+            assert resp.get_json()["gender"] == "male"
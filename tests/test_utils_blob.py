@@ -0,0 +1,136 @@
+"""診断テキストのブロブストアの単体テスト
+
+GCS はメモリ上のフェイクバケットに、/tmp ファイル層は tmp_path に差し替える。
+"""
+
+import pytest
+from unittest.mock import patch
+
+from api import utils_blob, utils_image
+from api.cache import LRUCache
+from api.utils_blob import get_document, offload_text, put_document, resolve_text, text_ref
+
+LOG = {
+    "diagnosis_id": "d1",
+    "stone_name": "水晶",
+    "horoscope_full": "運命の地図" * 200,
+    "past": "過去" * 200,
+    "present_future": "現在と未来" * 200,
+    "element_detail": "エレメント" * 200,
+}
+
+
+class FakeBlob:
+    def __init__(self, objects: dict, name: str):
+        self.objects = objects
+        self.name = name
+
+    def exists(self) -> bool:
+        return self.name in self.objects
+
+    def upload_from_string(self, data: bytes, content_type: str = "") -> None:
+        self.objects[self.name] = data
+
+    def download_as_bytes(self) -> bytes:
+        if self.name not in self.objects:
+            raise FileNotFoundError(self.name)
+        return self.objects[self.name]
+
+
+class FakeGCSClient:
+    """bucket(name).blob(name) だけを持つ GCS クライアントのフェイク"""
+
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+
+    def bucket(self, name: str) -> "FakeGCSClient":
+        return self
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self.objects, name)
+
+
+@pytest.fixture
+def gcs():
+    return FakeGCSClient()
+
+
+@pytest.fixture(autouse=True)
+def blob_store(tmp_path, gcs):
+    with patch.object(utils_blob, "_BLOB_DIR", str(tmp_path)), \
+         patch.object(utils_blob, "_documents", LRUCache("test")), \
+         patch.object(utils_blob, "DIAGNOSIS_TEXT_OFFLOAD", True), \
+         patch.object(utils_image, "GCS_BUCKET_NAME", "bucket"), \
+         patch.object(utils_image, "_get_gcs_client", return_value=gcs):
+        yield tmp_path
+
+
+class TestDocuments:
+    """内容アドレスでの保存と取得"""
+
+    def test_same_content_same_key(self, blob_store):
+        digest = put_document({"a": "あ", "b": "い"})
+        assert put_document({"b": "い", "a": "あ"}) == digest
+        assert len(list(blob_store.iterdir())) == 1
+
+    def test_read_from_file_after_memory_eviction(self):
+        digest = put_document({"a": "あ"})
+        utils_blob._documents.invalidate()
+        assert get_document(digest) == {"a": "あ"}
+        assert get_document("0" * 64) is None
+
+    def test_read_from_gcs_on_another_instance(self, blob_store, gcs):
+        digest = put_document({"a": "あ"})
+        assert f"atlas_text/{digest}.json.gz" in gcs.objects
+        # 別インスタンス相当: メモリも /tmp も空
+        utils_blob._documents.invalidate()
+        for path in blob_store.iterdir():
+            path.unlink()
+        assert get_document(digest) == {"a": "あ"}
+        # 取得したブロブは /tmp に残る
+        assert (blob_store / f"{digest}.json.gz").exists()
+
+    def test_tmp_alone_is_not_durable(self, blob_store):
+        with patch.object(utils_image, "GCS_BUCKET_NAME", ""):
+            assert put_document({"a": "あ"}) is None
+        with patch.object(utils_image, "_get_gcs_client", return_value=None):
+            assert put_document({"a": "あ"}) is None
+        assert list(blob_store.iterdir()) == []
+
+
+class TestOffload:
+    """診断ログの長文列の置き換え"""
+
+    def test_roundtrip(self):
+        row = offload_text(LOG)
+        assert row["stone_name"] == "水晶"
+        assert row["past"] == row["present_future"] == row["element_detail"] == ""
+        assert text_ref(row)
+        assert resolve_text(row) == LOG
+
+    def test_without_gcs_text_stays_in_sheet(self):
+        with patch.object(utils_image, "GCS_BUCKET_NAME", ""):
+            assert offload_text(LOG) is LOG
+
+    def test_disabled_keeps_text_inline(self):
+        with patch.object(utils_blob, "DIAGNOSIS_TEXT_OFFLOAD", False):
+            assert offload_text(LOG) is LOG
+        assert resolve_text(LOG) is LOG
+
+    def test_add_diagnosis_writes_pointer(self):
+        from api import utils_sheet
+        with patch.object(utils_sheet, "_append_log_row") as mock_append, \
+             patch.object(utils_sheet, "_appended_row_number", return_value=None):
+            utils_sheet.add_diagnosis(LOG)
+        row = mock_append.call_args.args[1]
+        assert row[4].startswith(utils_blob.TEXT_REF_PREFIX)
+        assert row[5:8] == ["", "", ""]
+
+    def test_fortune_detail_resolves_text(self):
+        from api.index import app
+        row = offload_text(LOG)
+        utils_blob._documents.invalidate()
+        with patch("api.index.get_diagnosis", return_value=row), app.test_client() as client:
+            data = client.post('/api/fortune-detail', json={"diagnosis_id": "d1"}).get_json()
+        assert data["past"] == LOG["past"]
+        assert data["element_detail"] == LOG["element_detail"]
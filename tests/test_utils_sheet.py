@@ -0,0 +1,826 @@
+"""Google Sheets連携モジュールの単体テスト
+
+gspread のワークシートはメモリ上のフェイクに差し替え、API呼び出し回数を数える。
+"""
+
+import re
+from collections import Counter
+from types import SimpleNamespace
+
+import gspread
+import pytest
+from unittest.mock import patch
+from gspread.utils import a1_to_rowcol
+
+from api import utils_sheet
+from api.utils_sheet import (
+    EXPECTED_HEADERS,
+    LOG_SHEET_NAME,
+    add_diagnosis,
+    get_diagnosis,
+    mark_purchased,
+    update_diagnosis,
+    invalidate_diagnosis_index,
+    batch_update_row_fields,
+    upsert_profile,
+    PROFILE_SHEET_NAME,
+)
+
+
+class FakeWorksheet:
+    """gspread.Worksheet のうちテストで使うメソッドだけを持つフェイク"""
+
+    def __init__(self, title: str, rows: list[list] | None = None):
+        self.title = title
+        self.rows = [list(r) for r in (rows or [])]
+        self.calls = Counter()
+
+    def _cell(self, value) -> str:
+        if isinstance(value, bool):
+            return "TRUE" if value else "FALSE"
+        return "" if value is None else str(value)
+
+    def col_values(self, col: int) -> list[str]:
+        self.calls["col_values"] += 1
+        values = [r[col - 1] if len(r) >= col else "" for r in self.rows]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def row_values(self, row: int) -> list[str]:
+        self.calls["row_values"] += 1
+        if row > len(self.rows):
+            return []
+        values = list(self.rows[row - 1])
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def get(self, range_name: str) -> list[list[str]]:
+        self.calls["get"] += 1
+        m = re.match(r"A(\d+):([A-Z]+)$", range_name)
+        start = int(m.group(1))
+        width = a1_to_rowcol(f"{m.group(2)}1")[1]
+        values = []
+        for r in self.rows[start - 1:]:
+            cells = list(r[:width])
+            while cells and cells[-1] == "":
+                cells.pop()
+            values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def acell(self, label: str) -> SimpleNamespace:
+        self.calls["acell"] += 1
+        row, col = a1_to_rowcol(label)
+        cells = self.rows[row - 1] if row <= len(self.rows) else []
+        return SimpleNamespace(value=cells[col - 1] if len(cells) >= col and cells[col - 1] != "" else None)
+
+    def get_all_values(self) -> list[list[str]]:
+        self.calls["get_all_values"] += 1
+        width = max((len(r) for r in self.rows), default=0)
+        return [list(r) + [""] * (width - len(r)) for r in self.rows]
+
+    def append_rows(self, rows: list[list], value_input_option: str = "RAW") -> dict:
+        self.calls["append_rows"] += 1
+        start = len(self.rows) + 1
+        self.rows.extend([self._cell(v) for v in row] for row in rows)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{start}:N{len(self.rows)}"}}
+
+    def append_row(self, row: list, value_input_option: str = "RAW") -> dict:
+        self.calls["append_row"] += 1
+        self.rows.append([self._cell(v) for v in row])
+        return {}
+
+    def _write(self, range_name: str, values: list) -> None:
+        row, col = a1_to_rowcol(range_name.split(":")[0])
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        for offset, value in enumerate(values):
+            while len(cells) < col + offset:
+                cells.append("")
+            cells[col + offset - 1] = self._cell(value)
+
+    def update(self, range_name: str, values: list[list], value_input_option: str = "RAW") -> dict:
+        self.calls["update"] += 1
+        self._write(range_name, values[0])
+        return {}
+
+    def batch_update(self, data: list[dict], value_input_option: str = "RAW") -> dict:
+        self.calls["batch_update"] += 1
+        self.ranges = [d["range"] for d in data]
+        for d in data:
+            self._write(d["range"], d["values"][0])
+        return {}
+
+    def api_calls(self) -> int:
+        return sum(self.calls.values())
+
+
+def _log_row(diagnosis_id: str, stone_name: str = "水晶") -> list[str]:
+    row = [""] * len(EXPECTED_HEADERS[LOG_SHEET_NAME])
+    row[0] = diagnosis_id
+    row[2] = stone_name
+    row[-1] = "FALSE"
+    return row
+
+
+@pytest.fixture
+def sheets():
+    """シート名 → FakeWorksheet（diagnosis_logs には5件の診断を入れておく）"""
+    books = {
+        name: FakeWorksheet(name, [headers])
+        for name, headers in EXPECTED_HEADERS.items()
+    }
+    books[LOG_SHEET_NAME].rows.extend(_log_row(f"d{i}") for i in range(1, 6))
+    invalidate_diagnosis_index()
+    utils_sheet._profile_rows.invalidate()
+    utils_sheet._profile_records.invalidate()
+    utils_sheet.invalidate_config_cache()
+    with patch.object(utils_sheet, "_get_worksheet", side_effect=books.__getitem__):
+        yield books
+    invalidate_diagnosis_index()
+    utils_sheet._profile_rows.invalidate()
+    utils_sheet._profile_records.invalidate()
+    utils_sheet.invalidate_config_cache()
+
+
+@pytest.fixture
+def log_sheet(sheets):
+    return sheets[LOG_SHEET_NAME]
+
+
+class TestDiagnosisRowIndex:
+    """diagnosis_logs の diagnosis_id → 行番号 インデックス"""
+
+    def test_first_lookup_loads_column_once(self, log_sheet):
+        assert get_diagnosis("d3")["diagnosis_id"] == "d3"
+        assert get_diagnosis("d4")["diagnosis_id"] == "d4"
+        assert log_sheet.calls["col_values"] == 1
+        assert log_sheet.calls["row_values"] == 2
+
+    def test_cached_record_needs_no_api_call(self, log_sheet):
+        get_diagnosis("d2")
+        before = log_sheet.api_calls()
+        assert get_diagnosis("d2")["stone_name"] == "水晶"
+        assert log_sheet.api_calls() == before
+
+    def test_returned_record_is_a_copy(self, log_sheet):
+        get_diagnosis("d2")["stone_name"] = "改変"
+        assert get_diagnosis("d2")["stone_name"] == "水晶"
+
+    def test_rows_added_elsewhere_are_read_incrementally(self, log_sheet):
+        get_diagnosis("d1")
+        log_sheet.rows.append(_log_row("other-instance"))
+        assert get_diagnosis("other-instance")["diagnosis_id"] == "other-instance"
+        assert log_sheet.calls["col_values"] == 1
+        assert log_sheet.calls["get"] == 1
+
+    def test_unknown_id(self, log_sheet):
+        assert get_diagnosis("missing") is None
+        assert get_diagnosis("") is None
+
+    def test_own_append_is_indexed(self, log_sheet):
+        get_diagnosis("d1")
+        add_diagnosis({"diagnosis_id": "new", "stone_name": "アメジスト"})
+        log_sheet.calls.clear()
+        assert get_diagnosis("new")["stone_name"] == "アメジスト"
+        assert log_sheet.calls == Counter({"row_values": 1})
+
+    def test_append_does_not_skip_rows_from_other_instances(self, log_sheet):
+        get_diagnosis("d1")
+        log_sheet.rows.append(_log_row("other-instance"))
+        add_diagnosis({"diagnosis_id": "new"})
+        assert get_diagnosis("other-instance")["diagnosis_id"] == "other-instance"
+        assert get_diagnosis("new")["diagnosis_id"] == "new"
+
+    def test_update_uses_index_without_header_read(self, log_sheet):
+        get_diagnosis("d1")
+        log_sheet.calls.clear()
+        update_diagnosis("d5", "水晶×14", "slug-1")
+        # キーセルの確認1回＋書き込み1回
+        assert log_sheet.calls == Counter({"acell": 1, "batch_update": 1})
+        assert log_sheet.ranges == ["K6:L6"]
+        row = log_sheet.rows[5]
+        headers = EXPECTED_HEADERS[LOG_SHEET_NAME]
+        assert row[headers.index("stones")] == "水晶×14"
+        assert row[headers.index("product_slug")] == "slug-1"
+
+    def test_updates_refresh_cached_record(self, log_sheet):
+        get_diagnosis("d2")
+        update_diagnosis("d2", "水晶×14", "")
+        mark_purchased("d2")
+        record = get_diagnosis("d2")
+        assert record["stones"] == "水晶×14"
+        assert record["purchased"] == "TRUE"
+
+    def test_shifted_rows_reload_index(self, log_sheet):
+        get_diagnosis("d1")
+        del log_sheet.rows[1]   # d1 の行が手動で削除された
+        assert get_diagnosis("d3")["diagnosis_id"] == "d3"
+        assert log_sheet.calls["col_values"] == 2
+
+    def test_cached_record_expires(self, log_sheet):
+        get_diagnosis("d2")
+        with patch.object(utils_sheet, "CACHE_TTL", 0):
+            get_diagnosis("d3")
+            before = log_sheet.calls["row_values"]
+            get_diagnosis("d3")
+        assert log_sheet.calls["row_values"] == before + 1
+
+
+class TestAppendedRowNumber:
+    """_appended_row_number: append レスポンスの行番号"""
+
+    def test_parses_updated_range(self):
+        from api.utils_sheet import _appended_row_number
+        assert _appended_row_number({"updates": {"updatedRange": "'diagnosis_logs'!A42:N42"}}) == 42
+        assert _appended_row_number({"updates": {"updatedRange": "Sheet1!AB7:AC7"}}) == 7
+
+    def test_missing_response(self):
+        from api.utils_sheet import _appended_row_number
+        assert _appended_row_number(None) is None
+        assert _appended_row_number({}) is None
+
+
+class TestWriteBehind:
+    """ログ系シートへの追記の遅延バッファ"""
+
+    @pytest.fixture
+    def write_behind(self, sheets, tmp_path):
+        with patch.object(utils_sheet, "WRITE_BEHIND_ENABLED", True), \
+             patch.object(utils_sheet, "WRITE_BEHIND_MAX_ROWS", 3), \
+             patch.object(utils_sheet, "WRITE_BEHIND_INTERVAL_MS", 60_000), \
+             patch.object(utils_sheet, "_SPOOL_DIR", str(tmp_path)), \
+             patch.dict(utils_sheet._appenders, clear=True):
+            yield tmp_path
+            for appender in utils_sheet._appenders.values():
+                with appender._lock:
+                    if appender._timer is not None:
+                        appender._timer.cancel()
+
+    def test_rows_are_batched(self, sheets, write_behind):
+        from api.utils_sheet import add_order
+        orders = sheets[utils_sheet.ORDER_SHEET_NAME]
+        add_order({"order_id": "o1"})
+        add_order({"order_id": "o2"})
+        assert orders.api_calls() == 0
+        add_order({"order_id": "o3"})
+        assert orders.calls == Counter({"append_rows": 1})
+        assert [r[0] for r in orders.rows[1:]] == ["o1", "o2", "o3"]
+
+    def test_interval_flush(self, sheets, write_behind):
+        from api.utils_sheet import add_bracelet_selection
+        with patch.object(utils_sheet, "WRITE_BEHIND_INTERVAL_MS", 10):
+            add_bracelet_selection({"selection_id": "s1"})
+        appender = utils_sheet._appenders[utils_sheet.BRACELET_SELECTION_SHEET_NAME]
+        appender._timer.join(2)
+        assert sheets[utils_sheet.BRACELET_SELECTION_SHEET_NAME].rows[1][0] == "s1"
+
+    def test_lookup_flushes_pending_diagnosis(self, log_sheet, write_behind):
+        get_diagnosis("d1")
+        add_diagnosis({"diagnosis_id": "new", "stone_name": "アメジスト"})
+        assert log_sheet.calls["append_rows"] == 0
+        assert get_diagnosis("new")["stone_name"] == "アメジスト"
+        assert log_sheet.calls["append_rows"] == 1
+        assert log_sheet.calls["col_values"] == 1
+        assert log_sheet.calls["get"] == 0
+
+    def test_flush_sheet_buffers(self, sheets, write_behind):
+        from api.utils_sheet import add_order, flush_sheet_buffers
+        add_order({"order_id": "o1"})
+        assert flush_sheet_buffers() == 1
+        assert flush_sheet_buffers() == 0
+        assert not list(write_behind.glob("*.jsonl"))
+
+    def test_spool_survives_crash(self, sheets, write_behind):
+        from api.utils_sheet import add_order, flush_sheet_buffers
+        add_order({"order_id": "o1", "total": 1200})
+        assert len(list(write_behind.glob("orders.*.jsonl"))) == 1
+
+        # プロセスが落ちてバッファが失われた状態を再現
+        utils_sheet._appenders.pop(utils_sheet.ORDER_SHEET_NAME)._timer.cancel()
+        add_order({"order_id": "o2"})
+        assert flush_sheet_buffers() == 2
+        assert [r[0] for r in sheets[utils_sheet.ORDER_SHEET_NAME].rows[1:]] == ["o1", "o2"]
+
+    def test_spool_of_dead_process_is_adopted(self, sheets, write_behind):
+        import json
+        from api.utils_sheet import add_order, flush_sheet_buffers
+        (write_behind / "orders.999999999.jsonl").write_text(json.dumps(["orphan"]) + "\n")
+        with patch.object(utils_sheet, "_pid_alive", side_effect=lambda pid: pid != 999999999):
+            add_order({"order_id": "o1"})
+        flush_sheet_buffers()
+        assert [r[0] for r in sheets[utils_sheet.ORDER_SHEET_NAME].rows[1:]] == ["orphan", "o1"]
+
+    def test_spool_of_live_process_is_left_alone(self, sheets, write_behind):
+        import json
+        from api.utils_sheet import add_order
+        other = write_behind / "orders.999999999.jsonl"
+        other.write_text(json.dumps(["theirs"]) + "\n")
+        with patch.object(utils_sheet, "_pid_alive", return_value=True):
+            add_order({"order_id": "o1"})
+        assert other.exists()
+
+    def test_failed_flush_keeps_rows(self, sheets, write_behind):
+        from api.utils_sheet import add_order, flush_sheet_buffers
+        add_order({"order_id": "o1"})
+        with patch.object(utils_sheet, "_append_rows_with_retry", side_effect=RuntimeError("quota")):
+            assert flush_sheet_buffers() == 0
+        assert flush_sheet_buffers() == 1
+
+    def test_disabled_by_default_appends_synchronously(self, sheets):
+        from api.utils_sheet import add_order
+        add_order({"order_id": "o1"})
+        assert sheets[utils_sheet.ORDER_SHEET_NAME].calls == Counter({"append_rows": 1})
+
+
+class TestBatchUpdateRowFields:
+    """batch_update_row_fields: 複数列を1回の batch_update で更新"""
+
+    def test_separate_columns_in_one_call(self, log_sheet):
+        assert batch_update_row_fields(LOG_SHEET_NAME, "d2", {"stone_name": "翡翠", "purchased": True})
+        assert log_sheet.calls["batch_update"] == 1
+        assert log_sheet.ranges == ["C3:C3", "N3:N3"]
+        assert log_sheet.rows[2][2] == "翡翠"
+        assert log_sheet.rows[2][13] == "TRUE"
+
+    def test_unknown_column_is_skipped(self, log_sheet):
+        assert batch_update_row_fields(LOG_SHEET_NAME, "d2", {"nope": 1, "stones": "x"})
+        assert log_sheet.ranges == ["K3:K3"]
+        assert not batch_update_row_fields(LOG_SHEET_NAME, "d2", {"nope": 1})
+
+    def test_deleted_row_does_not_shift_writes(self, log_sheet):
+        get_diagnosis("d1")
+        del log_sheet.rows[2]  # d2 の行を削除 → d3 以降が1行ずつ上がる
+        mark_purchased("d3")
+        assert log_sheet.rows[2][0] == "d3"
+        assert log_sheet.rows[2][-1] == "TRUE"
+        assert log_sheet.rows[3][-1] == "FALSE"
+
+    def test_deleted_key_is_not_written(self, log_sheet):
+        get_diagnosis("d1")
+        del log_sheet.rows[2]
+        assert not batch_update_row_fields(LOG_SHEET_NAME, "d2", {"stones": "x"})
+        assert log_sheet.calls["batch_update"] == 0
+
+    def test_deleted_profile_does_not_overwrite_neighbour(self, sheets):
+        profiles = sheets[PROFILE_SHEET_NAME]
+        for user_id in ("alice", "bob", "carol"):
+            upsert_profile({"user_id": user_id, "name": user_id})
+        del profiles.rows[1]  # alice の行を削除
+        upsert_profile({"user_id": "bob", "name": "bob2"})
+        assert [r[:2] for r in profiles.rows[1:]] == [["bob", "bob2"], ["carol", "carol"]]
+
+    def test_missing_row(self, log_sheet):
+        assert not batch_update_row_fields(LOG_SHEET_NAME, "missing", {"stones": "x"})
+        assert log_sheet.calls["batch_update"] == 0
+
+    def test_upsert_profile(self, sheets):
+        profiles = sheets[PROFILE_SHEET_NAME]
+        upsert_profile({"user_id": "U1", "name": "花子", "birth": {"date": "1990-01-01"}})
+        assert profiles.calls == Counter({"col_values": 1, "append_rows": 1})
+
+        profiles.calls.clear()
+        upsert_profile({"user_id": "U1", "name": "花子", "wrist_inner_cm": 15})
+        assert profiles.calls == Counter({"acell": 1, "batch_update": 1})
+        assert profiles.ranges == ["A2:J2"]
+        assert len(profiles.rows) == 2
+        assert profiles.rows[1][6] == "15"
+
+
+@pytest.fixture
+def replica(sheets, tmp_path):
+    """SQLiteレプリカを有効にする（バックグラウンド同期は起動しない）"""
+    from api.sheet_replica import SheetReplica
+    r = SheetReplica(str(tmp_path / "replica.sqlite3"))
+    with patch("api.sheet_replica.get_replica", return_value=r):
+        yield r
+
+
+class TestSheetReplica:
+    """SQLite読み取りレプリカ"""
+
+    def test_reads_are_local_after_first_sync(self, replica, log_sheet):
+        assert get_diagnosis("d3")["stone_name"] == "水晶"
+        assert log_sheet.calls == Counter({"get_all_values": 1})
+        invalidate_diagnosis_index()
+        assert get_diagnosis("d4")["diagnosis_id"] == "d4"
+        assert log_sheet.calls == Counter({"get_all_values": 1})
+
+    def test_staleness_picks_up_in_place_edits(self, replica, log_sheet):
+        get_diagnosis("d1")
+        log_sheet.rows[2][-1] = "TRUE"  # 他インスタンスの mark_purchased
+        with patch("api.sheet_replica.MAX_STALENESS", -1):
+            utils_sheet._diagnosis_records.invalidate()
+            assert get_diagnosis("d2")["purchased"] == "TRUE"
+        # diagnosis_logs は書き換えがあるので差分ではなく全体を読む
+        assert log_sheet.calls == Counter({"get_all_values": 2})
+
+    def test_background_sync_skips_fresh_sheets(self, replica, sheets):
+        replica.sync(LOG_SHEET_NAME)
+        calls = []
+        with patch.object(utils_sheet, "_get_worksheet", side_effect=lambda n: calls.append(n) or sheets[n]), \
+             patch("api.sheet_replica.time.sleep", side_effect=[None, StopIteration]):
+            with pytest.raises(StopIteration):
+                replica._sync_loop(30)
+        assert LOG_SHEET_NAME not in calls
+        assert PROFILE_SHEET_NAME in calls
+
+    def test_append_only_sheet_syncs_incrementally(self, replica, sheets):
+        orders = sheets[utils_sheet.ORDER_SHEET_NAME]
+        replica.sync(utils_sheet.ORDER_SHEET_NAME)
+        orders.rows.append(["1"])
+        replica.sync(utils_sheet.ORDER_SHEET_NAME)
+        assert orders.calls == Counter({"get_all_values": 1, "get": 1})
+
+    def test_missing_key_on_log_sheet_reads_new_rows(self, replica, log_sheet):
+        get_diagnosis("d1")
+        log_sheet.rows.append(_log_row("d6", "翡翠"))  # 他インスタンスの追記
+        assert get_diagnosis("d6")["stone_name"] == "翡翠"
+        assert get_diagnosis("nope") is None
+        # 未知のキーは末尾だけ読み足す（全体は読み直さない）
+        assert log_sheet.calls["get_all_values"] == 1
+
+    def test_write_through(self, replica, log_sheet):
+        get_diagnosis("d1")
+        add_diagnosis({"diagnosis_id": "d9", "stone_name": "月長石"})
+        update_diagnosis("d2", "水晶×2", "slug")
+        log_sheet.calls.clear()
+        invalidate_diagnosis_index()
+        assert replica.get_record(LOG_SHEET_NAME, "d9")["stone_name"] == "月長石"
+        assert replica.get_record(LOG_SHEET_NAME, "d2")["stones"] == "水晶×2"
+        assert log_sheet.calls == Counter()
+
+    def test_full_sync_removes_deleted_rows(self, replica, sheets):
+        from api.utils_sheet import get_config
+        config = sheets[utils_sheet.CONFIG_SHEET_NAME]
+        config.rows += [["a", "1", "", ""], ["b", "x", "", ""]]
+        assert get_config() == {"a": 1, "b": "x"}
+        del config.rows[2]
+        utils_sheet._invalidate_cache(utils_sheet.CONFIG_SHEET_NAME)
+        utils_sheet.invalidate_config_cache()
+        assert get_config() == {"a": 1}
+
+    def test_profile_from_replica(self, replica, sheets):
+        from api.utils_sheet import get_profile
+        upsert_profile({"user_id": "U1", "gender": "female", "wrist_inner_cm": 15.5})
+        profiles = sheets[PROFILE_SHEET_NAME]
+        profiles.calls.clear()
+        assert get_profile("U1")["wrist_inner_cm"] == 15.5
+        assert get_profile("U2") is None
+        # 未知のキーは末尾だけ読み足して確かめる
+        assert profiles.calls == Counter({"get_all_values": 1, "get": 1})
+
+    def test_profile_added_by_another_instance(self, replica, sheets):
+        from api.utils_sheet import get_profile
+        profiles = sheets[PROFILE_SHEET_NAME]
+        assert get_profile("U1") is None
+        profiles.rows.append(["U1", "", "male"])  # 他インスタンスの upsert_profile
+        assert get_profile("U1")["gender"] == "male"
+        # 全体は読み直さず、見つからないたびに末尾の新しい行だけ読み足す
+        assert profiles.calls == Counter({"get_all_values": 1, "get": 2})
+
+    def test_combination_key_index(self, replica):
+        plan = replica._conn.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM "stone_combinations" WHERE stone_id_a = ? AND stone_id_b = ?',
+            ("a", "b"),
+        ).fetchall()
+        assert "idx_stone_combinations_key" in str(plan)
+
+
+class FakeSpreadsheet:
+    """gspread.Spreadsheet のフェイク（メタデータ取得とヘッダー行の一括取得を数える）"""
+
+    def __init__(self, worksheets: list):
+        self.sheets = {ws.title: ws for ws in worksheets}
+        self.calls = Counter()
+        self.created_elsewhere = False
+
+    def worksheets(self) -> list:
+        self.calls["worksheets"] += 1
+        return list(self.sheets.values())
+
+    def values_batch_get(self, ranges: list[str]) -> dict:
+        self.calls["values_batch_get"] += 1
+        value_ranges = []
+        for r in ranges:
+            rows = self.sheets[re.match(r"'(.+)'!1:1$", r).group(1)].rows
+            value_ranges.append({"range": r, "values": [rows[0]]} if rows and rows[0] else {"range": r})
+        return {"valueRanges": value_ranges}
+
+    def add_worksheet(self, title: str, rows: int, cols: int):
+        self.calls["add_worksheet"] += 1
+        ws = MetaWorksheet(title, [], sheet_id=len(self.sheets) + 100)
+        if self.created_elsewhere:
+            # メタデータ取得と作成の間に他インスタンスが同じシートを作った
+            self.sheets[title] = ws
+            raise _already_exists(title)
+        self.sheets[title] = ws
+        return ws
+
+    def worksheet(self, title: str):
+        self.calls["worksheet"] += 1
+        if title not in self.sheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.sheets[title]
+
+
+def _already_exists(title: str) -> gspread.exceptions.APIError:
+    from unittest.mock import MagicMock
+    response = MagicMock()
+    response.json.return_value = {"error": {
+        "code": 400, "message": f'A sheet with the name "{title}" already exists.'}}
+    return gspread.exceptions.APIError(response)
+
+
+class MetaWorksheet(FakeWorksheet):
+    """sheetId・列数・1行目の書き込みを持つ FakeWorksheet"""
+
+    def __init__(self, title: str, rows: list[list], sheet_id: int = 0, col_count: int = 26):
+        super().__init__(title, rows)
+        self.id = sheet_id
+        self.col_count = col_count
+
+
+@pytest.fixture
+def spreadsheet():
+    """_get_client をフェイクに差し替え、メタデータ系のキャッシュを空にする"""
+    from unittest.mock import MagicMock
+    sh = FakeSpreadsheet([
+        MetaWorksheet(name, [headers], sheet_id=i)
+        for i, (name, headers) in enumerate(EXPECTED_HEADERS.items())
+        if name != utils_sheet.ORDER_SHEET_NAME
+    ])
+    sh.sheets[LOG_SHEET_NAME].rows[0] = ["diagnosis_id"]  # 古いヘッダー
+    client = MagicMock()
+    client.open_by_key.return_value = sh
+
+    def reset():
+        utils_sheet._worksheet_cache.clear()
+        utils_sheet._verified_headers.clear()
+        utils_sheet._spreadsheet_cache.update({"client": None, "sh": None})
+
+    reset()
+    with patch.object(utils_sheet, "_get_client", return_value=client), \
+         patch.object(utils_sheet, "_get_sheet_id", return_value="sheet-id"):
+        yield sh
+    reset()
+
+
+class TestWorksheetMetadata:
+    """メタデータの一括取得とヘッダー確認のメモ化"""
+
+    def test_one_metadata_fetch_resolves_all_sheets(self, spreadsheet):
+        for name in EXPECTED_HEADERS:
+            if name != utils_sheet.ORDER_SHEET_NAME:
+                utils_sheet._get_worksheet(name)
+        assert spreadsheet.calls == Counter({"worksheets": 1, "values_batch_get": 1})
+        assert spreadsheet.sheets[LOG_SHEET_NAME].rows[0] == EXPECTED_HEADERS[LOG_SHEET_NAME]
+        # 個々のシートの1行目は読まない
+        assert all(ws.calls["row_values"] == 0 for ws in spreadsheet.sheets.values())
+
+    def test_missing_sheet_is_created(self, spreadsheet):
+        orders = utils_sheet._get_worksheet(utils_sheet.ORDER_SHEET_NAME)
+        assert spreadsheet.calls["add_worksheet"] == 1
+        assert orders.rows[0] == EXPECTED_HEADERS[utils_sheet.ORDER_SHEET_NAME]
+        assert utils_sheet._get_worksheet(utils_sheet.ORDER_SHEET_NAME) is orders
+
+    def test_sheet_created_by_another_instance_is_reused(self, spreadsheet):
+        spreadsheet.created_elsewhere = True
+        orders = utils_sheet._get_worksheet(utils_sheet.ORDER_SHEET_NAME)
+        assert orders is spreadsheet.sheets[utils_sheet.ORDER_SHEET_NAME]
+        assert spreadsheet.calls["worksheet"] == 1
+        assert orders.rows[0] == EXPECTED_HEADERS[utils_sheet.ORDER_SHEET_NAME]
+
+    def test_other_create_errors_are_raised(self, spreadsheet):
+        with patch.object(spreadsheet, "add_worksheet", side_effect=_already_exists("x")):
+            with pytest.raises(gspread.exceptions.APIError):
+                utils_sheet._get_worksheet(utils_sheet.ORDER_SHEET_NAME)
+
+    def test_headers_checked_once_per_process(self, spreadsheet):
+        for _ in range(3):
+            utils_sheet._worksheet_cache.clear()  # TTL切れ
+            utils_sheet._get_worksheet(LOG_SHEET_NAME)
+        assert spreadsheet.calls == Counter({"worksheets": 3, "values_batch_get": 1})
+        assert spreadsheet.sheets[LOG_SHEET_NAME].calls["update"] == 1
+
+    def test_schema_change_rechecks(self, spreadsheet):
+        utils_sheet._get_worksheet(LOG_SHEET_NAME)
+        log_ws = spreadsheet.sheets[LOG_SHEET_NAME]
+        log_ws.col_count += 1
+        log_ws.rows[0] = ["diagnosis_id"] + [""] * (len(EXPECTED_HEADERS[LOG_SHEET_NAME]) - 1)
+        utils_sheet._worksheet_cache.clear()
+        utils_sheet._get_worksheet(LOG_SHEET_NAME)
+        assert spreadsheet.calls["values_batch_get"] == 2
+        assert log_ws.rows[0] == EXPECTED_HEADERS[LOG_SHEET_NAME]
+
+
+class TestConfigCache:
+    """get_config のスナップショットキャッシュ"""
+
+    @pytest.fixture
+    def config_sheet(self, sheets):
+        ws = sheets[utils_sheet.CONFIG_SHEET_NAME]
+        ws.rows += [["score_weight_element", "0.5", "", ""], ["mode", "a", "", ""]]
+        return ws
+
+    def test_cached_within_ttl(self, config_sheet):
+        from api.utils_sheet import get_config
+        with patch.object(config_sheet, "get_all_records", create=True,
+                          return_value=[{"key": "mode", "value": "a"}]) as mock_read:
+            first = get_config()
+            first["mode"] = "changed"  # 返り値を書き換えてもキャッシュは変わらない
+            assert get_config()["mode"] == "a"
+            assert mock_read.call_count == 1
+            with patch.object(utils_sheet, "CONFIG_CACHE_TTL", -1):
+                utils_sheet.invalidate_config_cache()
+                get_config()
+                get_config()
+            assert mock_read.call_count == 3
+
+    def test_set_config_writes_through(self, config_sheet):
+        from api.utils_sheet import get_config, set_config
+        with patch.object(config_sheet, "get_all_records", create=True,
+                          return_value=[{"key": "mode", "value": "a"}]) as mock_read:
+            get_config()
+            set_config("score_weight_element", "0.9")
+            set_config("new_key", "x")
+            assert get_config() == {"mode": "a", "score_weight_element": 0.9, "new_key": "x"}
+            assert mock_read.call_count == 1
+        assert config_sheet.rows[1][1] == "0.9"
+
+    def test_failure_is_cached_briefly(self, config_sheet):
+        from api.utils_sheet import get_config
+        with patch.object(config_sheet, "get_all_records", create=True,
+                          side_effect=RuntimeError("quota")) as mock_read:
+            assert get_config() == {}
+            assert get_config() == {}
+            assert mock_read.call_count == 1
+            with patch.object(utils_sheet, "CONFIG_ERROR_TTL", -1):
+                utils_sheet.invalidate_config_cache()
+                get_config()
+                get_config()
+            assert mock_read.call_count == 3
+
+
+class TestWarmMasterCaches:
+    """warm_master_caches: マスター3種とconfigを values_batch_get 1回で読む"""
+
+    @pytest.fixture
+    def book(self, spreadsheet):
+        from api.stone_master import invalidate_stone_master_cache
+        from api.stone_combination_master import invalidate_combination_master_cache
+        from api.product_master import invalidate_product_master_cache
+
+        def invalidate():
+            invalidate_stone_master_cache()
+            invalidate_combination_master_cache()
+            invalidate_product_master_cache()
+            utils_sheet.invalidate_config_cache()
+
+        # 列順は EXPECTED_HEADERS に合わせる
+        sheets = spreadsheet.sheets
+        sheets[utils_sheet.STONE_MASTER_SHEET_NAME].rows.append(["crystal", "水晶", "", "0.5"])
+        sheets[utils_sheet.STONE_COMBO_SHEET_NAME].rows.append(["crystal", "amethyst", "浄化"])
+        sheets[utils_sheet.PRODUCT_MASTER_SHEET_NAME].rows.append(
+            ["P1", "10", "sku-1", '[{"stone_id": "crystal", "role": "main"}]', "female", "TRUE", "1.2"])
+        sheets[utils_sheet.CONFIG_SHEET_NAME].rows.append(["score_weight_element", "0.4"])
+
+        def values_batch_get(ranges):
+            spreadsheet.calls["values_batch_get"] += 1
+            names = [r.strip("'") for r in ranges]
+            return {"valueRanges": [{"range": n, "values": sheets[n].rows} for n in names]}
+
+        invalidate()
+        with patch.object(spreadsheet, "values_batch_get", side_effect=values_batch_get):
+            yield spreadsheet
+        invalidate()
+
+    def test_fills_every_cache_in_one_call(self, book):
+        from api.stone_master import get_stone_master_data
+        from api.stone_combination_master import get_combination_master_data
+        from api.product_master import get_product_master_data
+
+        assert utils_sheet.warm_master_caches() is True
+        assert book.calls == Counter({"values_batch_get": 1})
+        with patch.object(utils_sheet, "_get_all_records", side_effect=AssertionError("個別読み込み")):
+            assert get_stone_master_data()["crystal"]["element_profile"]["fire"] == 0.5
+            assert frozenset({"crystal", "amethyst"}) in get_combination_master_data()
+            product = get_product_master_data()["P1"]
+            assert product["woo_product_id"] == 10
+            assert product["priority_weight"] == 1.2
+            assert product["parts"][0]["stone_id"] == "crystal"
+            assert utils_sheet.get_config() == {"score_weight_element": 0.4}
+
+    def test_noop_when_warm(self, book):
+        utils_sheet.warm_master_caches()
+        assert utils_sheet.warm_master_caches() is False
+        assert book.calls == Counter({"values_batch_get": 1})
+
+    def test_only_stale_ranges_are_read(self, book):
+        from api.cache import get_sheet_cache
+        utils_sheet.warm_master_caches()
+        stones = get_sheet_cache(utils_sheet.STONE_MASTER_SHEET_NAME).get()
+        ranges = []
+        read = book.values_batch_get.side_effect
+        book.values_batch_get.side_effect = lambda r: ranges.append(r) or read(r)
+
+        utils_sheet.invalidate_config_cache()  # configだけ期限切れ
+        assert utils_sheet.needs_warm_up()
+        assert utils_sheet.warm_master_caches() is True
+        assert ranges == [[f"'{utils_sheet.CONFIG_SHEET_NAME}'"]]
+        # 有効なマスターは置き換えない（商品インデックス等を作り直させない）
+        assert get_sheet_cache(utils_sheet.STONE_MASTER_SHEET_NAME).get() is stones
+        assert not utils_sheet.needs_warm_up()
+
+    def test_failure_falls_back_to_lazy_loaders(self, book):
+        with patch.object(book, "values_batch_get", side_effect=RuntimeError("quota")):
+            assert utils_sheet.warm_master_caches() is False
+        from api.cache import get_sheet_cache
+        assert get_sheet_cache(utils_sheet.STONE_MASTER_SHEET_NAME).get() is None
+
+
+class TestProfileStore:
+    """profiles の user_id → 行番号 インデックスとレコードキャッシュ"""
+
+    def test_upsert_returns_written_profile_without_reading_back(self, sheets):
+        from api.utils_sheet import get_profile
+        profiles = sheets[PROFILE_SHEET_NAME]
+        written = upsert_profile({"user_id": "U1", "gender": "female", "wrist_inner_cm": 15.5,
+                                  "bead_size_mm": 8, "birth": {"date": "1990-01-01"}})
+        assert written["wrist_inner_cm"] == 15.5
+        assert written["bead_size_mm"] == 8
+        assert written["birth"]["date"] == "1990-01-01"
+
+        profiles.calls.clear()
+        assert get_profile("U1") == written
+        assert profiles.calls == Counter()
+
+    def test_update_is_one_write(self, sheets):
+        profiles = sheets[PROFILE_SHEET_NAME]
+        upsert_profile({"user_id": "U1"})
+        profiles.calls.clear()
+        upsert_profile({"user_id": "U1", "gender": "male"})
+        assert profiles.calls == Counter({"acell": 1, "batch_update": 1})
+
+    def test_cold_lookup_reads_one_row(self, sheets):
+        from api.utils_sheet import get_profile
+        profiles = sheets[PROFILE_SHEET_NAME]
+        profiles.rows += [["U1", "", "female", "", "", "", "15", "", "", ""],
+                          ["U2", "", "male", "", "", "", "", "", "", ""]]
+        assert get_profile("U2")["gender"] == "male"
+        assert get_profile("U1")["wrist_inner_cm"] == 15.0
+        assert get_profile("U3") is None
+        # A列の読み込み1回＋未知キーの差分1回＋行2回（ヘッダー行は読まない）
+        assert profiles.calls == Counter({"col_values": 1, "get": 1, "row_values": 2})
+
+
+class TestDiagnosisPartitions:
+    """diagnosis_logs の月次パーティション"""
+
+    PARTITION = f"{LOG_SHEET_NAME}_2026_10"
+
+    @pytest.fixture
+    def partition(self, sheets):
+        sheets[self.PARTITION] = FakeWorksheet(self.PARTITION, [EXPECTED_HEADERS[LOG_SHEET_NAME]])
+        yield sheets[self.PARTITION]
+        utils_sheet._ROW_INDEXES.pop(self.PARTITION, None)
+
+    def test_new_id_carries_month(self):
+        from datetime import datetime
+        from api.utils_sheet import diagnosis_partition, new_diagnosis_id
+        now = datetime(2026, 10, 18)
+        with patch.object(utils_sheet, "DIAGNOSIS_LOG_PARTITIONED", True):
+            diagnosis_id = new_diagnosis_id(now)
+        assert diagnosis_id.startswith("202610")
+        assert diagnosis_partition(diagnosis_id) == self.PARTITION
+        # WooCommerceプラグイン（wordpress/atlas-diagnosis-tracker.php）が受け付ける形
+        assert re.match(r"^[0-9a-f\-]{32,36}$", diagnosis_id, re.I)
+        with patch.object(utils_sheet, "DIAGNOSIS_LOG_PARTITIONED", False):
+            assert diagnosis_partition(new_diagnosis_id(now)) == LOG_SHEET_NAME
+        # 数字で始まる従来の uuid4 はパーティションに振り分けない
+        assert diagnosis_partition("20261012-5f1c-4d2e-9b40-0c6e1f2a7d35") == LOG_SHEET_NAME
+
+    def test_partitioned_id_is_routed_to_its_month(self, sheets, partition):
+        diagnosis_id = "202610a3-5f1c-8d2e-9b40-0c6e1f2a7d35"
+        add_diagnosis({"diagnosis_id": diagnosis_id, "stone_name": "水晶"})
+        update_diagnosis(diagnosis_id, "水晶×2", "slug-1")
+        mark_purchased(diagnosis_id)
+        assert len(partition.rows) == 2
+        assert len(sheets[LOG_SHEET_NAME].rows) == 6
+
+        invalidate_diagnosis_index()
+        partition.calls.clear()
+        record = get_diagnosis(diagnosis_id)
+        assert record["stones"] == "水晶×2"
+        assert record["purchased"] == "TRUE"
+        assert sheets[LOG_SHEET_NAME].calls["col_values"] == 0
+        assert partition.calls["col_values"] == 1
+
+    def test_legacy_ids_stay_on_diagnosis_logs(self, log_sheet, partition):
+        assert get_diagnosis("d3")["diagnosis_id"] == "d3"
+        assert get_diagnosis("202610ff-0000-8000-0000-000000000000") is None
+        assert log_sheet.calls["col_values"] == 1